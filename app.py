@@ -1,14 +1,40 @@
-from flask import Flask, jsonify, request, send_from_directory, Response
+from flask import Flask, jsonify, request, send_from_directory, Response, stream_with_context
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 import os
+import re
 import json
+import threading
 import csv
 import io
+import time
 from dotenv import load_dotenv
 from datetime import datetime, timezone
 from flask_mail import Mail, Message
 import uuid # Using uuid for more robust submission IDs
+import click
+from sqlalchemy.exc import IntegrityError
+from services.quiz_sessions import QuizSessionManager, QuizSessionError
+from services.submission_writer import SubmissionBatchWriter, SubmissionWriteError
+from services.query_monitor import QueryMonitor
+from services.profiler import SamplingProfiler
+from services.ai_generation import QuestionGenerationService, AIGenerationError
+from services.question_import import QuestionImporter, QuestionImportError, detect_format
+from services.question_batch import QuestionBatchEditor, QuestionBatchError
+from services.quiz_bundle import QuizBundle, QuizBundleError
+from services.question_sampling import paper_for, paper_seed, uses_sampling, PaperSeedError, SAMPLE_BY_FIELDS, PAPER_SEED_SECRET
+from services.question_search import QuestionSearchIndex, QuestionSearchError, SEARCH_INDEX_DDL, DUPLICATE_THRESHOLD
+from services.essay_scoring import EssayGradingService, EssayGradingError, essay_result, is_essay, score_results
+from services.quiz_cache import QuizCache, QuizLookupError
+from services.access_codes import AccessCodeResolver, AccessCodeError
+from services.usage_meter import UsageMeter, UsageLimitError
+from services.keyset import KeysetPaginator, KeysetError, page_size
+from utils.auth_tokens import AuthClaims, issue_token, require_auth, current_auth, AUTH_ALLOW_LEGACY
+from models.subscription_models import plan_catalog
+from services.metrics import (
+    init_metrics, db_pool_gauges, time_mail_send,
+    SUBMISSIONS_TOTAL, LOGINS_TOTAL, GRADING_SECONDS, GRADED_ANSWERS_TOTAL
+)
 
 # Load environment variables from .env file
 load_dotenv()
@@ -22,6 +48,18 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 db = SQLAlchemy(app)
 
+# Per-request SQL query counts, DB time and N+1 detection
+query_monitor = QueryMonitor(app)
+with app.app_context():
+    query_monitor.watch(db.engine)
+
+# Prometheus-style /metrics (route latency, in-flight requests, DB pool, mail, submissions)
+init_metrics(app)
+db_pool_gauges(lambda: {'quizflow': db.engine})
+
+# Opt-in stack sampling of slow requests (PROFILER_ENABLED), served at /api/admin/profile
+profiler = SamplingProfiler(app)
+
 # --- Mail Configuration ---
 # Configure Flask-Mail with credentials from your .env file
 app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER')
@@ -59,6 +97,13 @@ class Quiz(db.Model):
     time_per_question = db.Column(db.Integer, default=30)  # Time per question in seconds
     is_active = db.Column(db.Boolean, default=True)
     quiz_access_code = db.Column(db.String(20), unique=True, nullable=True)  # Unique student access code
+    sample_size = db.Column(db.Integer, nullable=True)  # Questions drawn per student; None = whole pool
+    sample_by = db.Column(db.String(20), nullable=True)  # Stratify the sample by 'tag' or 'difficulty'
+    shuffle_options = db.Column(db.Boolean, default=False)  # Shuffle multiple choice options per student
+    code_valid_from = db.Column(db.DateTime, nullable=True)  # Access code accepted from (UTC); None = immediately
+    code_expires_at = db.Column(db.DateTime, nullable=True)  # Access code rejected from (UTC); None = never
+    code_max_uses = db.Column(db.Integer, nullable=True)  # Students who may log in with the code; None = unlimited
+    code_uses = db.Column(db.Integer, default=0)  # Students who have logged in with the code
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationship with questions
@@ -78,14 +123,19 @@ class Question(db.Model):
     options = db.Column(db.JSON, nullable=True)  # For essay question metadata (instructions, word limits)
     correct_answer = db.Column(db.Text, nullable=False)  # Changed to Text to support essay answers
     order_index = db.Column(db.Integer, default=0)  # For ordering questions
+    tag = db.Column(db.String(100), nullable=True)  # Topic tag, used for stratified sampling
+    difficulty = db.Column(db.String(20), nullable=True)  # e.g. easy / medium / hard
+    version = db.Column(db.Integer, default=1)  # Bumped on every edit (optimistic concurrency)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class Submission(db.Model):
     __tablename__ = 'submissions'
+    __table_args__ = (db.UniqueConstraint('user_id', 'quiz_id', name='uq_submissions_user_quiz'),)
 
     id = db.Column(db.Integer, primary_key=True)
     submission_id = db.Column(db.String(36), unique=True, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quizzes.id'), nullable=True, index=True)  # Quiz this submission answered
     score = db.Column(db.Integer, nullable=False)
     total_questions = db.Column(db.Integer, nullable=False)
     percentage = db.Column(db.Float, nullable=False)
@@ -95,10 +145,29 @@ class Submission(db.Model):
     access_code = db.Column(db.String(5), nullable=True)  # Store the 5-digit access code
     quiz_start_time = db.Column(db.DateTime, nullable=True)  # When quiz started
     quiz_duration_seconds = db.Column(db.Integer, nullable=True)  # Time taken in seconds
+    essay_status = db.Column(db.String(20), nullable=True)  # None (no essays), pending, provisional or reviewed
+    essay_revision = db.Column(db.Integer, default=0)  # Bumped on every essay score write
+
+
+class QuizSession(db.Model):
+    __tablename__ = 'quiz_sessions'
+    __table_args__ = (db.UniqueConstraint('user_id', 'quiz_id', name='uq_quiz_sessions_user_quiz'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(36), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quizzes.id'), nullable=False)
+    access_code = db.Column(db.String(20), nullable=True)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    deadline = db.Column(db.DateTime, nullable=False)  # Server-side end of the time limit
+    answers = db.Column(db.JSON, nullable=True)  # Autosaved partial answers
+    last_heartbeat_at = db.Column(db.DateTime, nullable=True)
+    submitted_at = db.Column(db.DateTime, nullable=True)
 
 
 class Subscription(db.Model):
     __tablename__ = 'subscriptions'
+    __table_args__ = (db.Index('ix_subscriptions_created_at_id', 'created_at', 'id'),)
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -121,6 +190,7 @@ class Subscription(db.Model):
 
 class Payment(db.Model):
     __tablename__ = 'payments'
+    __table_args__ = (db.Index('ix_payments_created_at_id', 'created_at', 'id'),)
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -149,6 +219,112 @@ with app.app_context():
             _conn.commit()
     except Exception:
         pass  # Column already exists
+    # Add questions.version for batch editing if it doesn't exist yet
+    try:
+        with db.engine.connect() as _conn:
+            _conn.execute(db.text("ALTER TABLE questions ADD COLUMN version INTEGER DEFAULT 1"))
+            _conn.commit()
+    except Exception:
+        pass  # Column already exists
+    # Add submissions.quiz_id (bundles, per-quiz results) if it doesn't exist yet
+    try:
+        with db.engine.connect() as _conn:
+            _conn.execute(db.text("ALTER TABLE submissions ADD COLUMN quiz_id INTEGER REFERENCES quizzes(id)"))
+            _conn.execute(db.text("CREATE INDEX IF NOT EXISTS ix_submissions_quiz_id ON submissions (quiz_id)"))
+            _conn.commit()
+    except Exception:
+        pass  # Column already exists
+    # Question pool sampling columns
+    for _statement in (
+        "ALTER TABLE quizzes ADD COLUMN sample_size INTEGER",
+        "ALTER TABLE quizzes ADD COLUMN sample_by VARCHAR(20)",
+        "ALTER TABLE quizzes ADD COLUMN shuffle_options BOOLEAN DEFAULT FALSE",
+        "ALTER TABLE questions ADD COLUMN tag VARCHAR(100)",
+        "ALTER TABLE questions ADD COLUMN difficulty VARCHAR(20)",
+        "ALTER TABLE submissions ADD COLUMN essay_status VARCHAR(20)",
+        "ALTER TABLE submissions ADD COLUMN essay_revision INTEGER DEFAULT 0",
+        "ALTER TABLE quizzes ADD COLUMN code_valid_from TIMESTAMP",
+        "ALTER TABLE quizzes ADD COLUMN code_expires_at TIMESTAMP",
+        "ALTER TABLE quizzes ADD COLUMN code_max_uses INTEGER",
+        "ALTER TABLE quizzes ADD COLUMN code_uses INTEGER DEFAULT 0",
+        "CREATE INDEX IF NOT EXISTS ix_payments_created_at_id ON payments (created_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_subscriptions_created_at_id ON subscriptions (created_at, id)",
+    ):
+        try:
+            with db.engine.connect() as _conn:
+                _conn.execute(db.text(_statement))
+                _conn.commit()
+        except Exception:
+            pass  # Column already exists
+    # Full-text search index over question text and options (PostgreSQL only)
+    if db.engine.dialect.name == 'postgresql':
+        try:
+            with db.engine.connect() as _conn:
+                _conn.execute(db.text(SEARCH_INDEX_DDL))
+                _conn.commit()
+        except Exception as e:
+            print(f"Could not create question search index: {e}")
+
+def _attempted_quiz(quiz_id, email):
+    """Whether a student (by email) already has a session or a submission for a quiz"""
+    user_id = db.select(User.id).where(User.email == email).scalar_subquery()
+    return bool(db.session.execute(db.select(db.or_(
+        db.select(QuizSession.id).where(QuizSession.user_id == user_id, QuizSession.quiz_id == quiz_id).exists(),
+        db.select(Submission.id).where(Submission.user_id == user_id, Submission.quiz_id == quiz_id).exists()
+    ))).scalar())
+
+# Access codes (global + per quiz, with validity windows and usage caps) resolved from memory
+access_codes = AccessCodeResolver(app, db, Quiz, attempted=_attempted_quiz)
+with app.app_context():
+    access_codes.load()
+
+# Per-quiz snapshots (settings + answer key) for the student endpoints; many quizzes can run at once
+quiz_cache = QuizCache(db, Quiz, Question, codes=access_codes)
+
+# Quiz quota of the app's subscriptions: one conditional UPDATE per quiz (limits below 1 are unlimited)
+subscription_usage = UsageMeter(db, Subscription, 'quizzes_used', 'quizzes_limit', unlimited_below=1)
+
+# Cursor pagination on (created_at, id) for the payments and subscriptions listings
+keyset_pages = KeysetPaginator(db)
+
+# Server-side quiz sessions (deadline cache + heartbeat write-behind buffer)
+quiz_sessions = QuizSessionManager(app, db, QuizSession)
+REQUIRE_QUIZ_SESSION = os.getenv('REQUIRE_QUIZ_SESSION', 'false').lower() in ['true', '1', 'yes']
+
+# Optional group-commit writer for exam-end submission bursts (SUBMISSION_GROUP_COMMIT=true)
+submission_writer = SubmissionBatchWriter(app, db, Submission, quiz_sessions=quiz_sessions)
+
+# Background AI question generation with cached results (AI_GENERATION_BACKEND=fake for offline use)
+ai_generator = QuestionGenerationService(app)
+
+# Question bank search (tsvector on PostgreSQL, in-process index otherwise) and near-duplicate detection
+question_search = QuestionSearchIndex(db, Question, Quiz)
+
+# Bulk question import (validate up front, one transaction; repeats are flagged)
+question_importer = QuestionImporter(db, Question, duplicate_finder=question_search)
+question_batch_editor = QuestionBatchEditor(db, Question)
+
+# Streaming quiz export/import bundles (gzip JSON lines)
+quiz_bundles = QuizBundle(db, Quiz, Question, Submission, User)
+
+# Provisional essay scores (local TF-IDF/BM25 similarity to the sample answer), run as background jobs
+essay_grader = EssayGradingService(app, db, Submission, Question)
+
+def _optional_int(value):
+    """int(value), or None for missing/invalid values"""
+    try:
+        return int(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+def _optional_datetime(value):
+    """Naive UTC datetime from an ISO 8601 string, or None for empty values (ValueError if malformed)"""
+    if value in (None, ''):
+        return None
+    parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
 
 # --- Helper function to find submission by ID ---
 def find_submission_by_id(submission_id):
@@ -171,8 +347,20 @@ def login_page():
 def admin_page():
     return send_from_directory('.', 'admin.html')
 
+def _header_claims():
+    """Identity from the X-User-Id / X-Is-Admin headers of clients that predate tokens"""
+    user_id = _optional_int(request.headers.get('X-User-Id'))
+    if user_id is None:
+        return None
+    is_admin = request.headers.get('X-Is-Admin', 'false').lower() == 'true'
+    return AuthClaims(user_id, 'admin' if is_admin else 'teacher')
+
+# Admin-only endpoints (role from the signed admin token, or the X-Is-Admin header for older clients)
+require_admin = require_auth('admin', legacy=_header_claims)
+
 # --- Admin Routes ---
 @app.route('/api/admin/quizzes', methods=['GET'])
+@require_admin
 def get_all_quizzes():
     """Get all quizzes with their question counts"""
     quizzes = Quiz.query.all()
@@ -189,6 +377,13 @@ def get_all_quizzes():
             "isActive": quiz.is_active,
             "accessCode": quiz.quiz_access_code or "",
             "questionCount": question_count,
+            "sampleSize": quiz.sample_size,
+            "sampleBy": quiz.sample_by,
+            "shuffleOptions": bool(quiz.shuffle_options),
+            "codeValidFrom": quiz.code_valid_from.isoformat() if quiz.code_valid_from else None,
+            "codeExpiresAt": quiz.code_expires_at.isoformat() if quiz.code_expires_at else None,
+            "codeMaxUses": quiz.code_max_uses,
+            "codeUses": quiz.code_uses or 0,
             "createdAt": quiz.created_at.isoformat() if quiz.created_at else None
         })
     
@@ -210,11 +405,16 @@ def admin_login():
     admin_password = os.getenv('ADMIN_PASSWORD', 'admin123')
     
     if username == admin_username and password == admin_password:
-        return jsonify({'success': True, 'message': 'Admin login successful'})
+        return jsonify({
+            'success': True,
+            'message': 'Admin login successful',
+            'token': issue_token(None, 'admin', name=admin_username)
+        })
     else:
         return jsonify({'success': False, 'message': 'Invalid admin credentials'}), 401
 
 @app.route('/api/admin/quiz/<int:quiz_id>/questions', methods=['GET'])
+@require_admin
 def get_quiz_questions(quiz_id):
     """Get all questions for a specific quiz"""
     quiz = Quiz.query.get_or_404(quiz_id)
@@ -232,7 +432,10 @@ def get_quiz_questions(quiz_id):
             "optionD": q.option_d,
             "correctAnswer": q.correct_answer,
             "orderIndex": q.order_index,
-            "options": q.options
+            "options": q.options,
+            "tag": q.tag,
+            "difficulty": q.difficulty,
+            "version": q.version or 1
         })
     
     return jsonify({
@@ -246,6 +449,7 @@ def get_quiz_questions(quiz_id):
     })
 
 @app.route('/api/admin/quiz', methods=['POST'])
+@require_admin
 def create_quiz():
     """Create a new quiz"""
     data = request.get_json()
@@ -278,6 +482,7 @@ def create_quiz():
     
     db.session.add(new_quiz)
     db.session.commit()
+    access_codes.load()
     
     return jsonify({
         "success": True,
@@ -291,6 +496,7 @@ def create_quiz():
     })
 
 @app.route('/api/admin/quiz/<int:quiz_id>/question', methods=['POST'])
+@require_admin
 def add_question(quiz_id):
     """Add a question to a quiz (supports both multiple choice and essay questions)"""
     quiz = Quiz.query.get_or_404(quiz_id)
@@ -306,7 +512,7 @@ def add_question(quiz_id):
         return jsonify({"success": False, "message": "Question text is required"}), 400
     
     # Handle different question types
-    if question_type == 'essay':
+    if is_essay(question_type):
         # Essay questions
         correct_answer = data.get('correct_answer', '').strip()
         options = data.get('options', {})
@@ -323,7 +529,9 @@ def add_question(quiz_id):
             question_type='essay',
             options=options,  # Store as JSON
             correct_answer=correct_answer,
-            order_index=max_order + 1
+            order_index=max_order + 1,
+            tag=(data.get('tag') or '').strip() or None,
+            difficulty=(data.get('difficulty') or '').strip() or None
         )
         
     else:
@@ -352,12 +560,15 @@ def add_question(quiz_id):
             option_c=option_c,
             option_d=option_d,
             correct_answer=correct_answer,
-            order_index=max_order + 1
+            order_index=max_order + 1,
+            tag=(data.get('tag') or '').strip() or None,
+            difficulty=(data.get('difficulty') or '').strip() or None
         )
     
     try:
         db.session.add(new_question)
         db.session.commit()
+        quiz_cache.invalidate(quiz_id)
         
         return jsonify({
             "success": True,
@@ -373,7 +584,209 @@ def add_question(quiz_id):
         db.session.rollback()
         return jsonify({"success": False, "message": f"Database error: {str(e)}"}), 500
 
+@app.route('/api/admin/quiz/<int:quiz_id>/questions/import', methods=['POST'])
+@require_admin
+def import_questions(quiz_id):
+    """
+    Bulk import questions from JSON, CSV or GIFT.
+
+    Accepts either a multipart upload (file, optional format, allowPartial,
+    dryRun) or a JSON body with "questions" (a list) or "content" plus "format".
+    """
+    Quiz.query.get_or_404(quiz_id)
+
+    if request.files.get('file'):
+        upload = request.files['file']
+        fmt = request.form.get('format') or detect_format(upload.filename)
+        options = request.form
+        try:
+            content = upload.read().decode('utf-8-sig')
+        except UnicodeDecodeError:
+            return jsonify({"success": False, "message": "File must be UTF-8 encoded."}), 400
+    else:
+        options = request.get_json(silent=True)
+        if not options:
+            return jsonify({"success": False, "message": "Upload a file or send a JSON body."}), 400
+        if isinstance(options.get('questions'), list):
+            fmt, content = 'json', options['questions']
+        else:
+            fmt, content = options.get('format'), options.get('content') or ''
+
+    allow_partial = str(options.get('allowPartial', 'false')).lower() in ['true', '1', 'yes']
+    dry_run = str(options.get('dryRun', 'false')).lower() in ['true', '1', 'yes']
+
+    try:
+        records = question_importer.parse(content, fmt)
+        summary = question_importer.import_records(quiz_id, records, allow_partial=allow_partial, dry_run=dry_run)
+        quiz_cache.invalidate(quiz_id)
+    except QuestionImportError as e:
+        return jsonify({"success": False, "message": e.message}), e.status_code
+    except Exception as e:
+        return jsonify({"success": False, "message": f"Database error: {str(e)}"}), 500
+
+    if summary["errors"] and not allow_partial:
+        return jsonify({"success": False, "message": f"{len(summary['errors'])} invalid questions; nothing was imported.",
+                        **summary}), 400
+    if dry_run:
+        message = f"{summary['valid']} questions are valid (dry run)"
+    else:
+        message = f"Imported {summary['imported']} questions"
+    return jsonify({"success": True, "message": message, **summary})
+
+@app.route('/api/admin/questions/search', methods=['GET'])
+@require_admin
+def search_questions():
+    """Ranked full-text search over every quiz's questions (q, optional quizId, limit, offset)"""
+    try:
+        quiz_id = request.args.get('quizId', type=int)
+        result = question_search.search(request.args.get('q', ''), quiz_id=quiz_id,
+                                        limit=request.args.get('limit', 20, type=int),
+                                        offset=request.args.get('offset', 0, type=int))
+    except QuestionSearchError as e:
+        return jsonify({"success": False, "message": e.message}), e.status_code
+    return jsonify({"success": True, **result})
+
+@app.route('/api/admin/questions/duplicates', methods=['GET'])
+@require_admin
+def find_duplicate_questions():
+    """Groups of near-duplicate questions in the bank (optional quizId, threshold)"""
+    threshold = request.args.get('threshold', DUPLICATE_THRESHOLD, type=float)
+    if not 0 < threshold <= 1:
+        return jsonify({"success": False, "message": "threshold must be between 0 and 1"}), 400
+    groups = question_search.duplicate_groups(threshold, quiz_id=request.args.get('quizId', type=int))
+    return jsonify({"success": True, "threshold": threshold, "groups": groups})
+
+@app.route('/api/admin/quiz/<int:quiz_id>/essays/grade', methods=['POST'])
+@require_admin
+def grade_quiz_essays(quiz_id):
+    """Start a background job scoring the quiz's pending essay answers"""
+    Quiz.query.get_or_404(quiz_id)
+    data = request.get_json(silent=True) or {}
+    job = essay_grader.start(quiz_id, regrade=bool(data.get('regrade')))
+    return jsonify({"success": True, "message": "Essay grading started", **job.to_dict()}), 202
+
+@app.route('/api/admin/essays/jobs/<job_id>', methods=['GET'])
+@require_admin
+def get_essay_grading_job(job_id):
+    """Status and summary of an essay grading job"""
+    job = essay_grader.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "message": "Job not found or expired"}), 404
+    return jsonify({"success": True, **job.to_dict()})
+
+@app.route('/api/admin/quiz/<int:quiz_id>/essays', methods=['GET'])
+@require_admin
+def list_quiz_essays(quiz_id):
+    """Essay answers for teacher review (optional status=pending|provisional|overridden)"""
+    Quiz.query.get_or_404(quiz_id)
+    try:
+        result = essay_grader.review_queue(quiz_id, status=request.args.get('status') or None,
+                                           limit=min(request.args.get('limit', 100, type=int), 500),
+                                           offset=request.args.get('offset', 0, type=int))
+    except EssayGradingError as e:
+        return jsonify({"success": False, "message": e.message}), e.status_code
+    return jsonify({"success": True, **result})
+
+@app.route('/api/admin/submission/<submission_id>/essay/<int:question_id>', methods=['PUT'])
+@require_admin
+def override_essay_score(submission_id, question_id):
+    """Teacher override of one essay answer's score (0-1), with an optional comment"""
+    data = request.get_json()
+    if not data:
+        return jsonify({"success": False, "message": "Request body must be JSON."}), 400
+    try:
+        result = essay_grader.override(submission_id, question_id, data.get('score'),
+                                       comment=data.get('comment'), expected_revision=data.get('revision'))
+    except EssayGradingError as e:
+        return jsonify({"success": False, "message": e.message}), e.status_code
+    return jsonify({"success": True, "message": "Essay score saved", **result})
+
+@app.route('/api/admin/quiz/<int:quiz_id>/questions/batch', methods=['POST'])
+@require_admin
+def batch_update_questions(quiz_id):
+    """
+    Save a reorder and/or question edits for a whole quiz in one transaction.
+
+    Body: {"order": [question ids...], "patches": [{"id", "version", ...fields}],
+           "versions": {id: version}}. Returns 409 with the conflicting ids if any
+    question changed since the editor loaded it.
+    """
+    Quiz.query.get_or_404(quiz_id)
+    data = request.get_json()
+    if not data:
+        return jsonify({"success": False, "message": "Request body must be JSON."}), 400
+
+    try:
+        result = question_batch_editor.apply(
+            quiz_id, order=data.get('order'), patches=data.get('patches'), versions=data.get('versions')
+        )
+        quiz_cache.invalidate(quiz_id)
+    except QuestionBatchError as e:
+        db.session.rollback()
+        payload = {"success": False, "message": e.message}
+        if e.errors:
+            payload["errors"] = e.errors
+        if e.conflicts:
+            payload["conflicts"] = e.conflicts
+        return jsonify(payload), e.status_code
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"success": False, "message": f"Database error: {str(e)}"}), 500
+
+    return jsonify({"success": True, "message": f"Saved {result['updated']} questions", **result})
+
+@app.route('/api/admin/quiz/<int:quiz_id>/export', methods=['GET'])
+@require_admin
+def export_quiz_bundle(quiz_id):
+    """Stream a quiz (and optionally its submissions) as a gzip JSON-lines bundle"""
+    include_submissions = request.args.get('submissions', 'false').lower() in ['true', '1', 'yes']
+    try:
+        chunks = quiz_bundles.export(quiz_id, include_submissions=include_submissions)
+        first = next(chunks)
+    except QuizBundleError as e:
+        return jsonify({"success": False, "message": e.message}), e.status_code
+
+    def generate():
+        yield first
+        yield from chunks
+
+    filename = f"quiz_{quiz_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.quizflow.jsonl.gz"
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/gzip',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+@app.route('/api/admin/quiz/import', methods=['POST'])
+@require_admin
+def import_quiz_bundle():
+    """
+    Import a quiz bundle as a new inactive quiz.
+
+    Send the bundle as the raw request body or as a multipart "file".
+    Query/form options: submissions=false to skip submissions, title to rename.
+    """
+    options = request.form if request.files.get('file') else request.args
+    stream = request.files['file'].stream if request.files.get('file') else request.stream
+    include_submissions = str(options.get('submissions', 'true')).lower() in ['true', '1', 'yes']
+
+    try:
+        summary = quiz_bundles.import_stream(stream, include_submissions=include_submissions,
+                                             title=options.get('title'))
+        access_codes.load()
+    except QuizBundleError as e:
+        return jsonify({"success": False, "message": e.message}), e.status_code
+    except Exception as e:
+        return jsonify({"success": False, "message": f"Database error: {str(e)}"}), 500
+
+    return jsonify({
+        "success": True,
+        "message": f"Imported quiz with {summary['questions']} questions and {summary['submissions']} submissions",
+        **summary
+    })
+
 @app.route('/api/admin/quiz/<int:quiz_id>/settings', methods=['PUT'])
+@require_admin
 def update_quiz_settings(quiz_id):
     """Update quiz settings including the access code"""
     quiz = Quiz.query.get_or_404(quiz_id)
@@ -390,7 +803,8 @@ def update_quiz_settings(quiz_id):
     if 'timePerQuestion' in data:
         quiz.time_per_question = int(data['timePerQuestion'])
 
-    new_code = data.get('accessCode', '').strip() or None
+    # Only touch the access code when it is sent, so window/cap updates keep it
+    new_code = (data.get('accessCode') or '').strip() or None if 'accessCode' in data else quiz.quiz_access_code
     if new_code != quiz.quiz_access_code:
         if new_code:
             existing = Quiz.query.filter(Quiz.quiz_access_code == new_code, Quiz.id != quiz_id).first()
@@ -398,14 +812,69 @@ def update_quiz_settings(quiz_id):
                 return jsonify({"success": False, "message": f"Access code '{new_code}' is already used by another quiz"}), 400
         quiz.quiz_access_code = new_code
 
+    # Per-student question sampling
+    if 'sampleSize' in data:
+        sample_size = data['sampleSize']
+        if sample_size in (None, '', 0):
+            quiz.sample_size = None
+        else:
+            try:
+                sample_size = int(sample_size)
+            except (TypeError, ValueError):
+                return jsonify({"success": False, "message": "sampleSize must be a number"}), 400
+            pool_size = Question.query.filter_by(quiz_id=quiz_id).count()
+            if sample_size < 1 or sample_size > pool_size:
+                return jsonify({"success": False, "message": f"sampleSize must be between 1 and the pool size ({pool_size})"}), 400
+            quiz.sample_size = sample_size
+    if 'sampleBy' in data:
+        sample_by = data['sampleBy'] or None
+        if sample_by is not None and sample_by not in SAMPLE_BY_FIELDS:
+            return jsonify({"success": False, "message": f"sampleBy must be one of: {', '.join(SAMPLE_BY_FIELDS)}"}), 400
+        quiz.sample_by = sample_by
+    if 'shuffleOptions' in data:
+        quiz.shuffle_options = bool(data['shuffleOptions'])
+    if uses_sampling(quiz) and not PAPER_SEED_SECRET:
+        return jsonify({"success": False, "message": "Set PAPER_SEED_SECRET (or SECRET_KEY) before enabling sampling or option shuffling"}), 400
+
+    # Access code validity window and usage cap
+    for key, column in (('codeValidFrom', 'code_valid_from'), ('codeExpiresAt', 'code_expires_at')):
+        if key in data:
+            try:
+                setattr(quiz, column, _optional_datetime(data[key]))
+            except ValueError:
+                return jsonify({"success": False, "message": f"{key} must be an ISO 8601 date and time"}), 400
+    if quiz.code_valid_from and quiz.code_expires_at and quiz.code_expires_at <= quiz.code_valid_from:
+        return jsonify({"success": False, "message": "codeExpiresAt must be after codeValidFrom"}), 400
+    if 'codeMaxUses' in data:
+        max_uses = _optional_int(data['codeMaxUses'])
+        if data['codeMaxUses'] not in (None, '') and (max_uses is None or max_uses < 1):
+            return jsonify({"success": False, "message": "codeMaxUses must be a positive number"}), 400
+        quiz.code_max_uses = max_uses
+    if data.get('resetCodeUses'):
+        quiz.code_uses = 0
+
     db.session.commit()
+    quiz_cache.invalidate(quiz_id)
+    access_codes.load()
     return jsonify({
         "success": True,
         "message": "Quiz settings updated",
-        "quiz": {"id": quiz.id, "title": quiz.title, "accessCode": quiz.quiz_access_code or ""}
+        "quiz": {
+            "id": quiz.id,
+            "title": quiz.title,
+            "accessCode": quiz.quiz_access_code or "",
+            "sampleSize": quiz.sample_size,
+            "sampleBy": quiz.sample_by,
+            "shuffleOptions": bool(quiz.shuffle_options),
+            "codeValidFrom": quiz.code_valid_from.isoformat() if quiz.code_valid_from else None,
+            "codeExpiresAt": quiz.code_expires_at.isoformat() if quiz.code_expires_at else None,
+            "codeMaxUses": quiz.code_max_uses,
+            "codeUses": quiz.code_uses or 0
+        }
     })
 
 @app.route('/api/admin/quiz/<int:quiz_id>/activate', methods=['POST'])
+@require_admin
 def toggle_quiz_status(quiz_id):
     """Activate or deactivate a quiz"""
     quiz = Quiz.query.get_or_404(quiz_id)
@@ -413,12 +882,10 @@ def toggle_quiz_status(quiz_id):
     
     is_active = data.get('isActive', not quiz.is_active)
     
-    # If activating this quiz, deactivate all others (only one active quiz at a time)
-    if is_active:
-        Quiz.query.update({'is_active': False})
-    
+    # Quizzes are activated independently; students reach each one by its access code
     quiz.is_active = is_active
     db.session.commit()
+    quiz_cache.invalidate(quiz_id)
     
     status = "activated" if is_active else "deactivated"
     return jsonify({
@@ -432,6 +899,7 @@ def toggle_quiz_status(quiz_id):
     })
 
 @app.route('/api/admin/students', methods=['GET'])
+@require_admin
 def get_all_students():
     """Get all registered students with their submission status"""
     users = User.query.all()
@@ -455,6 +923,7 @@ def get_all_students():
     return jsonify({"success": True, "students": student_list})
 
 @app.route('/api/admin/results/download', methods=['GET'])
+@require_admin
 def download_results():
     """Download all quiz submission results as a CSV file"""
     submissions = Submission.query.order_by(Submission.submitted_at.desc()).all()
@@ -558,67 +1027,130 @@ def validate_code():
     if not code:
         return jsonify({"success": False, "message": "Code is required"}), 400
     
-    if not code.isdigit() or len(code) != 5:
-        return jsonify({"success": False, "message": "Code must be exactly 5 digits"}), 400
+    if not code.isdigit() or len(code) < 4:
+        return jsonify({"success": False, "message": "Code must be at least 4 digits"}), 400
     
-    valid_codes = os.getenv('VALID_LOGIN_CODES', '12345,67890,11111,22222,33333').split(',')
-    
-    if code in valid_codes:
-        return jsonify({"success": True, "message": "Valid code", "isValid": True}), 200
-    else:
-        return jsonify({"success": False, "message": "Invalid code", "isValid": False}), 200
+    try:
+        access_codes.resolve(code)
+    except AccessCodeError as e:
+        return jsonify({"success": False, "message": e.message, "isValid": False}), 200
+    return jsonify({"success": True, "message": "Valid code", "isValid": True}), 200
 
 
 
-@app.route('/api/auth/login', methods=['POST'])
-def login_user():
-    data = request.get_json()
-    if not data:
-        return jsonify({"success": False, "message": "Request body must be JSON."}), 400
-    
+def _login_error(data):
+    """Validation message for a student login body (code, name, email), or None"""
     login_code = data.get('code')
-    student_name = data.get('name', '').strip()
-    student_email = data.get('email', '').strip()
+    student_name = (data.get('name') or '').strip()
+    student_email = (data.get('email') or '').strip()
 
     if not login_code:
-        return jsonify({"success": False, "message": "Login code is required"}), 400
-    
+        return "Login code is required"
     if not student_name:
-        return jsonify({"success": False, "message": "Student name is required"}), 400
-    
+        return "Student name is required"
     if not student_email:
-        return jsonify({"success": False, "message": "Email address is required"}), 400
-    
+        return "Email address is required"
+
     # Validate email format
-    import re
     email_pattern = r'^[^\s@]+@[^\s@]+\.[^\s@]+$'
     if not re.match(email_pattern, student_email):
-        return jsonify({"success": False, "message": "Please enter a valid email address"}), 400
+        return "Please enter a valid email address"
 
     # Validate the code format
-    if not login_code.isdigit() or len(login_code) < 4:
-        return jsonify({"success": False, "message": "Invalid code format. Please enter a valid access code."}), 400
+    if not str(login_code).isdigit() or len(str(login_code)) < 4:
+        return "Invalid code format. Please enter a valid access code."
+    return None
+
+def send_welcome_email(student_name, student_email, login_code, quiz_title=None):
+    """Send the "ready to start" email to a newly registered student"""
+    try:
+        # Get quiz info for welcome email
+        quiz_info = f"You're about to take: {quiz_title}" if quiz_title else "Get ready for your quiz!"
+        
+        welcome_subject = f"🎯 Welcome to QuizFlow - Ready to Start?"
+        welcome_body = f"""
+🎉 Hello {student_name}!
+
+Welcome to QuizFlow! You have successfully logged in and are ready to begin your quiz.
+
+📋 QUIZ INFORMATION:
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+{quiz_info}
+🔐 Your access code: {login_code}
+📧 Email: {student_email}
+📅 Login time: {datetime.now().strftime('%B %d, %Y at %I:%M %p')}
+
+📝 INSTRUCTIONS:
+• Make sure you have a stable internet connection
+• Take your time to read each question carefully  
+• You can only submit the quiz once
+• Your results will be emailed to you upon completion
+
+Good luck! We're rooting for you! 🚀
 
-    # First: check if code matches a specific quiz's access code
-    quiz_by_code = Quiz.query.filter_by(quiz_access_code=login_code).first()
+Best regards,
+The QuizFlow Team
+        """.strip()
+        
+        welcome_msg = Message(
+            subject=welcome_subject,
+            recipients=[student_email],
+            body=welcome_body
+        )
+        time_mail_send(mail.send, welcome_msg, 'student_welcome')
+        print(f"✅ Successfully sent welcome email to: {student_email}")
+        
+    except Exception as e:
+        print(f"❌ FAILED to send welcome email: {e}")
+
+@app.route('/api/auth/login', methods=['POST'])
+def login_user():
+    data = request.get_json()
+    if not data:
+        return jsonify({"success": False, "message": "Request body must be JSON."}), 400
     
-    # Fallback: check global VALID_LOGIN_CODES
-    if not quiz_by_code:
-        valid_codes = os.getenv('VALID_LOGIN_CODES', '12345,67890,11111,22222,33333').split(',')
-        if login_code not in valid_codes:
-            return jsonify({"success": False, "message": "Invalid access code. Please check your code and try again."}), 401
+    error = _login_error(data)
+    if error:
+        return jsonify({"success": False, "message": error}), 400
+    login_code = str(data['code'])
+    student_name = data['name'].strip()
+    student_email = data['email'].strip()
+
+    # Resolve the code from the in-memory index (a quiz's code, or a global VALID_LOGIN_CODES code)
+    try:
+        access = access_codes.resolve(login_code)
+    except AccessCodeError as e:
+        LOGINS_TOTAL.inc(result='invalid_code')
+        return jsonify({"success": False, "message": e.message}), e.status_code
+
+    # The quiz this login is for: the code's quiz, else the single active quiz (if unambiguous)
+    snapshot = quiz_cache.get(access.quiz_id) if access.quiz_id is not None else None
+    quiz = snapshot.quiz if snapshot else None
+    if quiz is None:
+        try:
+            quiz = quiz_cache.resolve().quiz
+        except QuizLookupError:
+            quiz = None
 
     # Check if this student has already taken the quiz with this email and code combination
     existing_user = User.query.filter_by(email=student_email).first()
+    submission = (Submission.query.filter_by(user_id=existing_user.id, quiz_id=quiz.id).first()
+                  if existing_user and quiz else None)
+
+    # Count the student's first login against the code's usage cap (repeat logins are free)
+    if submission is None:
+        try:
+            access_codes.consume(login_code, student_email)
+        except AccessCodeError as e:
+            LOGINS_TOTAL.inc(result='code_exhausted')
+            return jsonify({"success": False, "message": e.message}), e.status_code
     
     if existing_user:
-        # Check if user has already submitted quiz
-        submission = Submission.query.filter_by(user_id=existing_user.id).first()
+        # Check if user has already submitted this quiz
         if submission:
-            # Get quiz title — prefer the quiz matched by access code
-            quiz = quiz_by_code or Quiz.query.filter_by(is_active=True).first()
-            quiz_title = quiz.title if quiz else "the quiz"
+            quiz_title = quiz.title
             
+            LOGINS_TOTAL.inc(result='already_taken')
             return jsonify({
                 "success": True,
                 "quizAlreadyTaken": True,
@@ -626,6 +1158,8 @@ def login_user():
                 "email": student_email,
                 "userId": student_email,
                 "studentName": student_name,
+                "quizId": quiz.id,
+                "token": issue_token(existing_user.id, 'student', quiz.id, existing_user.name, student_email),
                 "pastResults": {
                     "submissionId": submission.submission_id,
                     "score": submission.score,
@@ -636,12 +1170,16 @@ def login_user():
                 }
             }), 200
         else:
+            LOGINS_TOTAL.inc(result='returning')
             return jsonify({
                 "success": True, 
                 "message": "Login successful. You can start the quiz.", 
                 "email": student_email,
                 "userId": student_email,
-                "studentName": student_name
+                "studentName": student_name,
+                "quizId": quiz.id if quiz else None,
+                "token": issue_token(existing_user.id, 'student', quiz.id if quiz else None,
+                                     existing_user.name, student_email)
             }), 200
     else:
         # Create new user entry for this student
@@ -651,100 +1189,319 @@ def login_user():
             password=login_code  # Store the code as password for reference
         )
         db.session.add(new_user)
+        db.session.flush()
+        new_user_id = new_user.id  # read before commit expires it (saves a refresh query)
         db.session.commit()
+        LOGINS_TOTAL.inc(result='new')
         
         # Send welcome email to new student
         send_welcome_emails = os.getenv('SEND_STUDENT_EMAILS', 'true').lower() in ['true', '1', 'yes']
         if send_welcome_emails:
-            try:
-                # Get quiz info for welcome email
-                active_quiz = Quiz.query.filter_by(is_active=True).first()
-                quiz_info = f"You're about to take: {active_quiz.title}" if active_quiz else "Get ready for your quiz!"
-                
-                welcome_subject = f"🎯 Welcome to QuizFlow - Ready to Start?"
-                welcome_body = f"""
-🎉 Hello {student_name}!
-
-Welcome to QuizFlow! You have successfully logged in and are ready to begin your quiz.
-
-📋 QUIZ INFORMATION:
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-{quiz_info}
-🔐 Your access code: {login_code}
-📧 Email: {student_email}
-📅 Login time: {datetime.now().strftime('%B %d, %Y at %I:%M %p')}
-
-📝 INSTRUCTIONS:
-• Make sure you have a stable internet connection
-• Take your time to read each question carefully  
-• You can only submit the quiz once
-• Your results will be emailed to you upon completion
-
-Good luck! We're rooting for you! 🚀
-
-Best regards,
-The QuizFlow Team
-                """.strip()
-                
-                welcome_msg = Message(
-                    subject=welcome_subject,
-                    recipients=[student_email],
-                    body=welcome_body
-                )
-                mail.send(welcome_msg)
-                print(f"✅ Successfully sent welcome email to: {student_email}")
-                
-            except Exception as e:
-                print(f"❌ FAILED to send welcome email: {e}")
+            send_welcome_email(student_name, student_email, login_code, quiz.title if quiz else None)
         
         return jsonify({
             "success": True, 
             "message": "Login successful. You can start the quiz.", 
             "email": student_email,
             "userId": student_email,
-            "studentName": student_name
+            "studentName": student_name,
+            "quizId": quiz.id if quiz else None,
+            "token": issue_token(new_user_id, 'student', quiz.id if quiz else None, student_name, student_email)
         }), 200
 
 @app.route('/api/quiz', methods=['GET'])
+@require_auth('student', optional=True)
 def get_quiz():
-    # Look up quiz by access code first, then fall back to active quiz
+    # Look up the quiz by id or access code (the single active quiz if neither is given)
     code = request.args.get('code', '').strip()
-    if code:
-        quiz = Quiz.query.filter_by(quiz_access_code=code).first()
-        if not quiz:
-            return jsonify({"success": False, "message": "No quiz found for this access code"}), 404
-    else:
-        quiz = Quiz.query.filter_by(is_active=True).first()
-        if not quiz:
-            return jsonify({"success": False, "message": "No active quiz found"}), 404
-    
-    # Get questions for this quiz, ordered by order_index
-    questions = Question.query.filter_by(quiz_id=quiz.id).order_by(Question.order_index.asc()).all()
-    
-    if not questions:
+    try:
+        snapshot = quiz_cache.resolve(quiz_id=_token_quiz_id(request.args.get('quizId')), code=code or None,
+                                      bound_quiz_id=_bound_quiz_id())
+    except QuizLookupError as e:
+        return jsonify({"success": False, "message": e.message}), e.status_code
+
+    # Questions come from the per-quiz cache, ordered by order_index
+    if not snapshot.questions:
         return jsonify({
             "success": False,
             "message": "No questions found for this quiz"
         }), 404
+
+    # Sampled/shuffled quizzes give each student their own (reproducible) paper,
+    # for the email in their token; only clients without one may name an email
+    auth = current_auth()
+    if auth is not None and auth.email:
+        email = auth.email
+    elif uses_sampling(snapshot.quiz) and not AUTH_ALLOW_LEGACY:
+        return jsonify({"success": False, "message": "Please log in to load this quiz"}), 401
+    else:
+        email = request.args.get('email', '').strip()
+    if uses_sampling(snapshot.quiz) and not email:
+        return jsonify({"success": False, "message": "Student email is required for this quiz"}), 400
     
-    # Format questions for frontend
+    try:
+        return jsonify({"success": True, **_quiz_payload(snapshot, email)})
+    except PaperSeedError as e:
+        return jsonify({"success": False, "message": e.message}), e.status_code
+
+def _render_paper(quiz, questions, email):
+    """A student's paper formatted for the frontend (no answers)"""
     formatted_questions = []
-    for q in questions:
+    for item in paper_for(quiz, questions, email):
+        if is_essay(item.question.question_type):
+            essay_options = item.question.options if isinstance(item.question.options, dict) else {}
+            formatted_questions.append({
+                "id": item.question.id,
+                "question": item.question.question_text,
+                "questionType": "essay",
+                "instructions": essay_options.get('instructions'),
+                "maxWords": essay_options.get('maxWords')
+            })
+            continue
         formatted_questions.append({
-            "id": q.id,
-            "question": q.question_text,
-            "options": [q.option_a, q.option_b, q.option_c, q.option_d]
+            "id": item.question.id,
+            "question": item.question.question_text,
+            "questionType": "multiple_choice",
+            "options": item.options
         })
     
-    return jsonify({
-        "success": True,
+    return {
+        "quizId": quiz.id,
         "title": quiz.title,
         "timePerQuestion": quiz.time_per_question,
         "timeLimit": quiz.time_limit,
         "questions": formatted_questions
+    }
+
+def _quiz_payload(snapshot, email):
+    """Rendered quiz for a student; rendered once per snapshot when every student gets the same paper"""
+    if uses_sampling(snapshot.quiz):
+        return _render_paper(snapshot.quiz, snapshot.questions, email)
+    return snapshot.memo('paper', lambda: _render_paper(snapshot.quiz, snapshot.questions, None))
+
+def _token_quiz_id(requested):
+    """
+    Quiz id for a student request: the requested one, checked against the
+    quiz in the caller's token (which also fills it in when none is given).
+    """
+    requested = _optional_int(requested)
+    auth = current_auth()
+    if auth is None or auth.quiz_id is None:
+        return requested
+    if requested is not None and requested != auth.quiz_id:
+        raise QuizLookupError("You are logged in for a different quiz", 403)
+    return auth.quiz_id
+
+def _bound_quiz_id():
+    """Quiz the caller's token was issued for (already checked at login), or None"""
+    auth = current_auth()
+    return auth.quiz_id if auth is not None else None
+
+def _quiz_session_payload(quiz_session):
+    now = datetime.utcnow()
+    return {
+        "sessionId": quiz_session['session_id'],
+        "quizId": quiz_session['quiz_id'],
+        "startedAt": quiz_session['started_at'].isoformat(),
+        "deadline": quiz_session['deadline'].isoformat(),
+        "serverTime": now.isoformat(),
+        "remainingSeconds": quiz_sessions.remaining_seconds(quiz_session, now),
+        "answers": quiz_session['answers']
+    }
+
+@app.route('/api/quiz/session/start', methods=['POST'])
+@require_auth('student', optional=True)
+def start_quiz_session():
+    """Start (or resume) a server-timed quiz session for a logged-in student"""
+    data = request.get_json(silent=True)
+    if data is None:
+        return jsonify({"success": False, "message": "Request body must be JSON."}), 400
+
+    code = (data.get('code') or '').strip()
+    user = current_auth()
+    if user is None:
+        # Clients without a token identify the student by email
+        user_email = (data.get('email') or '').strip()
+        if not user_email:
+            return jsonify({"success": False, "message": "Email is required"}), 400
+
+        user = User.query.filter_by(email=user_email).first()
+        if not user:
+            return jsonify({"success": False, "message": "User not found. Please login first."}), 401
+
+    try:
+        quiz = quiz_cache.resolve(quiz_id=_token_quiz_id(data.get('quizId')), code=code or None,
+                                  bound_quiz_id=_bound_quiz_id()).quiz
+    except QuizLookupError as e:
+        return jsonify({"success": False, "message": e.message}), e.status_code
+
+    try:
+        quiz_session = quiz_sessions.start(user.id, quiz, access_code=code or None)
+    except QuizSessionError as e:
+        return jsonify({"success": False, "message": e.message}), e.status_code
+
+    return jsonify({"success": True, "session": _quiz_session_payload(quiz_session)})
+
+def _upsert_student(name, email, password):
+    """
+    Insert a student or find the existing one with a single statement.
+
+    Returns (user id, stored name, created). Uses INSERT ... ON CONFLICT (email)
+    DO NOTHING RETURNING on PostgreSQL and SQLite: a new student costs one
+    statement, and a returning one an insert that writes nothing plus a
+    lookup of the existing row.
+    """
+    users = User.__table__
+    now = datetime.utcnow()
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        user = User.query.filter_by(email=email).first()
+        if user:
+            return user.id, user.name, False
+        user = User(name=name, email=email, password=password, created_at=now)
+        db.session.add(user)
+        db.session.commit()
+        return user.id, user.name, True
+
+    stmt = (
+        insert(users).values(name=name, email=email, password=password, created_at=now)
+        .on_conflict_do_nothing(index_elements=[users.c.email])
+        .returning(users.c.id, users.c.name)
+    )
+    row = db.session.execute(stmt).first()
+    created = row is not None
+    if not created:
+        row = db.session.execute(db.select(users.c.id, users.c.name).where(users.c.email == email)).one()
+    db.session.commit()
+    return row.id, row.name, created
+
+def _send_welcome_email_async(*args):
+    """send_welcome_email() on a background thread so it never delays a login"""
+    def run():
+        with app.app_context():
+            send_welcome_email(*args)
+    threading.Thread(target=run, name='welcome-email', daemon=True).start()
+
+@app.route('/api/auth/bootstrap', methods=['POST'])
+def bootstrap_student():
+    """
+    Login-storm fast path: log in, start the session and load the quiz in one call.
+
+    Takes the same body as /api/auth/login (code, name, email). The code and
+    quiz come from memory, the student is upserted with one statement and
+    the rendered quiz is shared by every student of a non-sampled quiz. A
+    student who already submitted gets their result instead of a session.
+    The welcome email (if enabled) is sent in the background.
+    """
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({"success": False, "message": "Request body must be JSON."}), 400
+    error = _login_error(data)
+    if error:
+        return jsonify({"success": False, "message": error}), 400
+    login_code = str(data['code'])
+    student_name = data['name'].strip()
+    student_email = data['email'].strip()
+
+    try:
+        access = access_codes.resolve(login_code)
+    except AccessCodeError as e:
+        LOGINS_TOTAL.inc(result='invalid_code')
+        return jsonify({"success": False, "message": e.message}), e.status_code
+    try:
+        snapshot = quiz_cache.resolve(quiz_id=access.quiz_id, bound_quiz_id=access.quiz_id)
+    except QuizLookupError as e:
+        return jsonify({"success": False, "message": e.message}), e.status_code
+    quiz = snapshot.quiz
+    if not snapshot.questions:
+        return jsonify({"success": False, "message": "No questions found for this quiz"}), 404
+    try:
+        # Refuse before any writes if this quiz's papers cannot be seeded
+        if uses_sampling(quiz):
+            paper_seed(quiz.id, student_email)
+    except PaperSeedError as e:
+        return jsonify({"success": False, "message": e.message}), e.status_code
+
+    user_id, stored_name, created = _upsert_student(student_name, student_email, login_code)
+    student = {
+        "email": student_email,
+        "userId": student_email,
+        "studentName": stored_name,
+        "quizId": quiz.id,
+        "token": issue_token(user_id, 'student', quiz.id, stored_name, student_email)
+    }
+
+    submission = None if created else Submission.query.filter_by(user_id=user_id, quiz_id=quiz.id).first()
+    if submission:
+        LOGINS_TOTAL.inc(result='already_taken')
+        return jsonify({
+            "success": True,
+            "quizAlreadyTaken": True,
+            "message": f"You have already completed '{quiz.title}' with this code.",
+            **student,
+            "pastResults": {
+                "submissionId": submission.submission_id,
+                "score": submission.score,
+                "totalQuestions": submission.total_questions,
+                "percentage": submission.percentage,
+                "feedback": submission.feedback,
+                "detailedResults": submission.detailed_results
+            }
+        })
+
+    try:
+        access_codes.consume(login_code, student_email)
+        quiz_session = quiz_sessions.start(user_id, quiz, access_code=login_code)
+    except AccessCodeError as e:
+        LOGINS_TOTAL.inc(result='code_exhausted')
+        return jsonify({"success": False, "message": e.message}), e.status_code
+    except QuizSessionError as e:
+        return jsonify({"success": False, "message": e.message}), e.status_code
+
+    LOGINS_TOTAL.inc(result='new' if created else 'returning')
+    if created and os.getenv('SEND_STUDENT_EMAILS', 'true').lower() in ['true', '1', 'yes']:
+        _send_welcome_email_async(student_name, student_email, login_code, quiz.title)
+
+    return jsonify({
+        "success": True,
+        "message": "Login successful. You can start the quiz.",
+        **student,
+        "session": _quiz_session_payload(quiz_session),
+        "quiz": _quiz_payload(snapshot, student_email)
+    })
+
+@app.route('/api/quiz/session/<session_id>', methods=['GET'])
+def get_quiz_session(session_id):
+    """Return the server-side timer and autosaved answers for a session"""
+    quiz_session = quiz_sessions.get(session_id)
+    if not quiz_session:
+        return jsonify({"success": False, "message": "Quiz session not found"}), 404
+    return jsonify({"success": True, "session": _quiz_session_payload(quiz_session)})
+
+@app.route('/api/quiz/session/<session_id>/heartbeat', methods=['POST'])
+def quiz_session_heartbeat(session_id):
+    """Lightweight keep-alive that autosaves partial answers (no DB round trip)"""
+    data = request.get_json(silent=True) or {}
+    answers = data.get('answers')
+    if answers is not None and not isinstance(answers, list):
+        return jsonify({"success": False, "message": "Answers must be a list."}), 400
+
+    try:
+        quiz_session = quiz_sessions.heartbeat(session_id, answers)
+    except QuizSessionError as e:
+        return jsonify({"success": False, "message": e.message}), e.status_code
+
+    return jsonify({
+        "success": True,
+        "remainingSeconds": quiz_sessions.remaining_seconds(quiz_session)
     })
 
 @app.route('/api/submit', methods=['POST'])
+@require_auth('student', optional=True)
 def submit_quiz():
     data = request.get_json()
     if not data:
@@ -754,6 +1511,7 @@ def submit_quiz():
     user_email = data.get('email')
     student_name = data.get('name', '').strip()
     login_code = data.get('code')
+    session_id = data.get('sessionId')
     user_answers_indices = data.get('answers', [])
     quiz_start_time_str = data.get('quizStartTime')
     quiz_duration_seconds = data.get('quizDurationSeconds')
@@ -761,8 +1519,12 @@ def submit_quiz():
     if not isinstance(user_answers_indices, list):
         return jsonify({"success": False, "message": "A valid answers list is required."}), 400
 
-    # Create user identifier for new format
-    if student_name and login_code:
+    # A signed token identifies the student without a lookup; otherwise fall back to the body
+    user = current_auth()
+    if user is not None:
+        user_identifier = None
+    elif student_name and login_code:
+        # Create user identifier for new format
         user_identifier = f"{login_code}_{student_name.lower().replace(' ', '_')}"
     elif user_email:
         user_identifier = user_email
@@ -778,38 +1540,95 @@ def submit_quiz():
             quiz_start_time = None
 
     # Find user in database
-    user = User.query.filter_by(email=user_identifier).first()
-    if not user:
-        return jsonify({"success": False, "message": "User not found. Please login first."}), 401
-    
-    # Check if user has already submitted
-    existing_submission = Submission.query.filter_by(user_id=user.id).first()
-    if existing_submission:
+    if user is None:
+        user = User.query.filter_by(email=user_identifier).first()
+        if not user:
+            return jsonify({"success": False, "message": "User not found. Please login first."}), 401
+    
+    # Validate the server-side session deadline (served from the session cache)
+    quiz_session = None
+    if session_id:
+        try:
+            quiz_session = quiz_sessions.validate_submission(session_id, user.id)
+        except QuizSessionError as e:
+            SUBMISSIONS_TOTAL.inc(result='rejected_session')
+            return jsonify({"success": False, "message": e.message}), e.status_code
+    elif REQUIRE_QUIZ_SESSION:
+        return jsonify({"success": False, "message": "A quiz session is required. Please restart the quiz."}), 400
+
+    # Grade against the quiz the student took: the session's, else the one named by id or access code
+    try:
+        if quiz_session:
+            snapshot = quiz_cache.resolve(quiz_id=quiz_session['quiz_id'], bound_quiz_id=quiz_session['quiz_id'])
+        else:
+            snapshot = quiz_cache.resolve(quiz_id=_token_quiz_id(data.get('quizId')), code=login_code or None,
+                                          bound_quiz_id=_bound_quiz_id())
+    except QuizLookupError as e:
+        return jsonify({"success": False, "message": e.message}), e.status_code
+    quiz, questions = snapshot.quiz, snapshot.questions
+
+    # Without a sessionId, a session the student started on this quiz still owns the timing
+    if quiz_session is None:
+        started = quiz_sessions.find(user.id, quiz.id)
+        if started is not None:
+            try:
+                quiz_session = quiz_sessions.validate_submission(started['session_id'], user.id)
+            except QuizSessionError as e:
+                SUBMISSIONS_TOTAL.inc(result='rejected_session')
+                return jsonify({"success": False, "message": e.message}), e.status_code
+            session_id = started['session_id']
+
+    if quiz_session:
+        # Server timing replaces the client-reported values
+        quiz_start_time = quiz_session['started_at']
+        ended_at = min(datetime.utcnow(), quiz_session['deadline'])
+        quiz_duration_seconds = max(0, int((ended_at - quiz_start_time).total_seconds()))
+        if not user_answers_indices:
+            user_answers_indices = quiz_session['answers']
+
+    # Check if user has already submitted this quiz
+    existing_submission = Submission.query.filter_by(user_id=user.id, quiz_id=quiz.id).first()
+    if existing_submission or submission_writer.is_pending(user.id, quiz.id):
+        SUBMISSIONS_TOTAL.inc(result='duplicate')
         return jsonify({"success": False, "message": "This quiz has already been submitted by you."}), 403
 
-    # Get the active quiz and its questions
-    quiz = Quiz.query.filter_by(is_active=True).first()
-    if not quiz:
-        return jsonify({"success": False, "message": "No active quiz found"}), 404
-    
-    questions = Question.query.filter_by(quiz_id=quiz.id).order_by(Question.order_index.asc()).all()
     if not questions:
         return jsonify({"success": False, "message": "No questions found for this quiz"}), 404
 
+    # Rebuild the student's paper from the seed; answers are positions on it
+    try:
+        paper = paper_for(quiz, questions, user.email)
+    except PaperSeedError as e:
+        return jsonify({"success": False, "message": e.message}), e.status_code
+
     score = 0
-    total_questions = len(questions)
+    total_questions = len(paper)
     detailed_results = []
+    grading_started = time.perf_counter()
 
-    for i, question in enumerate(questions):
-        correct_answer_index = question.correct_answer
+    for i, item in enumerate(paper):
+        question = item.question
         user_selected_index = user_answers_indices[i] if i < len(user_answers_indices) else None
+        if is_essay(question.question_type):
+            # Essays are stored as pending and scored later by the essay grader
+            detailed_results.append(essay_result(question, user_selected_index))
+            continue
+
+        correct_answer_index = item.correct_index
+        if user_selected_index is not None:
+            try:
+                user_selected_index = int(user_selected_index)
+            except (TypeError, ValueError):
+                user_selected_index = None
+            if user_selected_index is not None and not 0 <= user_selected_index <= 3:
+                user_selected_index = None
         
-        is_correct = (user_selected_index is not None and int(user_selected_index) == correct_answer_index)
+        is_correct = (user_selected_index is not None and user_selected_index == correct_answer_index)
         if is_correct:
             score += 1
 
-        # Get the option texts
-        options = [question.option_a, question.option_b, question.option_c, question.option_d]
+        # Get the option texts, as displayed to this student
+        options = item.options
         
         detailed_results.append({
             "id": question.id,
@@ -819,33 +1638,66 @@ def submit_quiz():
             "is_correct": is_correct
         })
 
-    percentage = (score / total_questions) * 100 if total_questions > 0 else 0
+    GRADING_SECONDS.observe(time.perf_counter() - grading_started)
+    multiple_choice_count = sum(1 for r in detailed_results if not is_essay(r.get('question_type')))
+    GRADED_ANSWERS_TOTAL.inc(score, correct='true')
+    GRADED_ANSWERS_TOTAL.inc(multiple_choice_count - score, correct='false')
+
+    # Essay points (0 while pending) are added when the essay grader runs
+    points, essay_status = score_results(detailed_results)
+    score = int(round(points))
+    percentage = (points / total_questions) * 100 if total_questions > 0 else 0
     name = user.name.split(' ')[0]
 
     if percentage == 100: feedback_text = f"Perfect score, {name}! You're a demand and supply expert!"
     elif percentage >= 80: feedback_text = f"Excellent work, {name}!"
     elif percentage >= 60: feedback_text = f"Good job, {name}! Solid understanding."
     else: feedback_text = f"Keep practicing, {name}. You'll get there!"
+    if essay_status == 'pending':
+        feedback_text += " Your written answers will be marked shortly and added to this score."
 
     submission_id = str(uuid.uuid4())
     
+    submission_row = {
+        "submission_id": submission_id,
+        "user_id": user.id,
+        "quiz_id": quiz.id,
+        "score": score,
+        "total_questions": total_questions,
+        "percentage": round(percentage, 2),
+        "feedback": feedback_text,
+        "detailed_results": detailed_results,
+        "access_code": login_code if login_code else None,
+        "quiz_start_time": quiz_start_time,
+        "quiz_duration_seconds": quiz_duration_seconds,
+        "essay_status": essay_status,
+        "essay_revision": 0
+    }
+
     # Save submission to database
-    new_submission = Submission(
-        submission_id=submission_id,
-        user_id=user.id,
-        score=score,
-        total_questions=total_questions,
-        percentage=round(percentage, 2),
-        feedback=feedback_text,
-        detailed_results=detailed_results,
-        access_code=login_code if login_code else None,
-        quiz_start_time=quiz_start_time,
-        quiz_duration_seconds=quiz_duration_seconds
-    )
-    db.session.add(new_submission)
-    db.session.commit()
+    if submission_writer.enabled:
+        # Group commit: blocks until the batch containing this row has committed
+        try:
+            submission_writer.write(submission_row, session_id=session_id if quiz_session else None)
+        except SubmissionWriteError as e:
+            SUBMISSIONS_TOTAL.inc(result='duplicate' if e.status_code == 403 else 'write_failed')
+            return jsonify({"success": False, "message": e.message}), e.status_code
+    else:
+        db.session.add(Submission(**submission_row))
+        if quiz_session:
+            quiz_sessions.mark_submitted(session_id)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # A concurrent request saved this student's submission first
+            db.session.rollback()
+            SUBMISSIONS_TOTAL.inc(result='duplicate')
+            return jsonify({"success": False, "message": "This quiz has already been submitted by you."}), 403
+        if quiz_session:
+            quiz_sessions.evict(session_id)
+    SUBMISSIONS_TOTAL.inc(result='accepted')
     
-    print(f"Quiz submitted by: {user_email}, Score: {score}/{total_questions}")
+    app.logger.info(f"Quiz submitted by: {user.email}, Score: {score}/{total_questions}")
 
     # --- Send Email Notifications ---
     
@@ -906,7 +1758,7 @@ The QuizFlow Team
                 recipients=[user.email], 
                 body=student_body
             )
-            mail.send(student_msg)
+            time_mail_send(mail.send, student_msg, 'student_results')
             print(f"✅ Successfully sent results email to student: {user.email}")
             
         except Exception as e:
@@ -936,7 +1788,7 @@ Feedback given: {feedback_text}
                 body=admin_body, 
                 reply_to=user.email
             )
-            mail.send(admin_msg)
+            time_mail_send(mail.send, admin_msg, 'admin_submission')
             print(f"Successfully sent notification email to admin: {admin_email}")
             
         except Exception as e:
@@ -950,31 +1802,36 @@ Feedback given: {feedback_text}
         "percentage": round(percentage, 2),
         "feedback": feedback_text,
         "detailedResults": detailed_results,
+        "essayStatus": essay_status,
         "accessCode": login_code,
         "quizDurationSeconds": quiz_duration_seconds,
         "quizStartTime": quiz_start_time.isoformat() if quiz_start_time else None
     }), 200
 
 @app.route('/api/user/submissions', methods=['GET'])
+@require_auth('student', optional=True)
 def get_user_submissions():
-    user_email = request.args.get('email')
-    if not user_email:
-        return jsonify({"success": False, "message": "User email parameter is required."}), 400
+    user = current_auth()
+    if user is None:
+        user_email = request.args.get('email')
+        if not user_email:
+            return jsonify({"success": False, "message": "User email parameter is required."}), 400
 
-    user = User.query.filter_by(email=user_email).first()
-    if not user:
-        return jsonify({"success": False, "message": "User account not found."}), 404
+        user = User.query.filter_by(email=user_email).first()
+        if not user:
+            return jsonify({"success": False, "message": "User account not found."}), 404
 
-    # Get the active quiz for title reference
-    quiz = Quiz.query.filter_by(is_active=True).first()
-    quiz_title = quiz.title if quiz else "Quiz"
+    # Each submission's own quiz title (one query for all of them)
+    submissions = Submission.query.filter_by(user_id=user.id).all()
+    quiz_ids = {sub.quiz_id for sub in submissions if sub.quiz_id}
+    titles = dict(db.session.query(Quiz.id, Quiz.title).filter(Quiz.id.in_(quiz_ids)).all()) if quiz_ids else {}
 
     submissions_list = []
-    submissions = Submission.query.filter_by(user_id=user.id).all()
     for sub in submissions:
         submissions_list.append({
             "submissionId": sub.submission_id,
-            "quizTitle": quiz_title,
+            "quizId": sub.quiz_id,
+            "quizTitle": titles.get(sub.quiz_id, "Quiz"),
             "score": sub.score,
             "totalQuestionsInQuiz": sub.total_questions,
             "percentage": sub.percentage,
@@ -984,18 +1841,27 @@ def get_user_submissions():
     return jsonify({"success": True, "submissions": submissions_list})
 
 @app.route('/api/submission/<submission_id_str>/details', methods=['GET'])
+@require_auth('student', optional=True)
 def get_submission_details(submission_id_str):
-    user_email, submission = find_submission_by_id(submission_id_str)
+    auth = current_auth()
+    if auth is not None:
+        # Token holders may only read their own submissions (and need no user lookup)
+        submission = Submission.query.filter_by(submission_id=submission_id_str).first()
+        if submission and submission.user_id != auth.id:
+            return jsonify({"success": False, "message": "You do not have access to this submission."}), 403
+        user_email = auth.email
+    else:
+        user_email, submission = find_submission_by_id(submission_id_str)
 
     if not submission:
         return jsonify({"success": False, "message": "Submission not found."}), 404
 
-    # Get the active quiz for title reference
-    quiz = Quiz.query.filter_by(is_active=True).first()
+    quiz = db.session.get(Quiz, submission.quiz_id) if submission.quiz_id else None
     quiz_title = quiz.title if quiz else "Quiz"
 
     summary_response = {
         "submissionId": submission.submission_id,
+        "quizId": submission.quiz_id,
         "quizTitle": quiz_title,
         "score": submission.score,
         "totalQuestionsInQuiz": submission.total_questions,
@@ -1012,6 +1878,7 @@ def get_submission_details(submission_id_str):
     })
 
 @app.route('/api/admin/quiz/<int:quiz_id>', methods=['DELETE'])  
+@require_admin
 def delete_quiz(quiz_id):
     """Delete a quiz and all its questions"""
     try:
@@ -1027,6 +1894,8 @@ def delete_quiz(quiz_id):
         # Delete the quiz
         db.session.delete(quiz)
         db.session.commit()
+        quiz_cache.invalidate(quiz_id)
+        access_codes.load()
         
         return jsonify({
             "success": True, 
@@ -1038,6 +1907,7 @@ def delete_quiz(quiz_id):
         return jsonify({"success": False, "message": str(e)}), 500
 
 @app.route('/api/admin/question/<int:question_id>', methods=['DELETE'])
+@require_admin
 def delete_question(question_id):
     """Delete a specific question"""
     try:
@@ -1045,8 +1915,10 @@ def delete_question(question_id):
         if not question:
             return jsonify({"success": False, "message": "Question not found"}), 404
         
+        quiz_id = question.quiz_id
         db.session.delete(question)
         db.session.commit()
+        quiz_cache.invalidate(quiz_id)
         
         return jsonify({
             "success": True,
@@ -1058,6 +1930,7 @@ def delete_question(question_id):
         return jsonify({"success": False, "message": str(e)}), 500
 
 @app.route('/api/admin/question/<int:question_id>', methods=['PUT'])
+@require_admin
 def update_question(question_id):
     """Update a specific question"""
     try:
@@ -1072,28 +1945,24 @@ def update_question(question_id):
         if not question_text:
             return jsonify({"success": False, "message": "Question text is required"}), 400
         
-        # Update basic fields
-        question.question_text = question_text
-        question.question_type = question_type
+        # Optimistic concurrency: reject edits made against a stale copy
+        if data.get('version') is not None:
+            version = _optional_int(data['version'])
+            if version is None:
+                return jsonify({"success": False, "message": "version must be a number"}), 400
+            if version != (question.version or 1):
+                return jsonify({
+                    "success": False,
+                    "message": "Question was changed by someone else; reload and try again.",
+                    "currentVersion": question.version or 1
+                }), 409
         
-        if question_type == 'essay':
-            # Essay question updates
+        # Validate the whole payload before touching the question
+        if is_essay(question_type):
             correct_answer = data.get('correct_answer', '').strip()
             if not correct_answer:
                 return jsonify({"success": False, "message": "Sample answer is required for essay questions"}), 400
-            
-            options = data.get('options', {})
-            question.correct_answer = correct_answer
-            question.options = options
-            
-            # Clear multiple choice fields for essay questions
-            question.option_a = None
-            question.option_b = None
-            question.option_c = None
-            question.option_d = None
-            
         else:
-            # Multiple choice question updates
             option_a = data.get('optionA', '').strip()
             option_b = data.get('optionB', '').strip()
             option_c = data.get('optionC', '').strip()
@@ -1105,7 +1974,30 @@ def update_question(question_id):
             
             if correct_answer not in [0, 1, 2, 3]:
                 return jsonify({"success": False, "message": "Correct answer must be 0, 1, 2, or 3"}), 400
+        
+        question.version = (question.version or 1) + 1
+        
+        # Update basic fields
+        question.question_text = question_text
+        question.question_type = question_type
+        if 'tag' in data:
+            question.tag = (data['tag'] or '').strip() or None
+        if 'difficulty' in data:
+            question.difficulty = (data['difficulty'] or '').strip() or None
+        
+        if is_essay(question_type):
+            # Essay question updates
+            question.correct_answer = correct_answer
+            question.options = data.get('options', {})
             
+            # Clear multiple choice fields for essay questions
+            question.option_a = None
+            question.option_b = None
+            question.option_c = None
+            question.option_d = None
+            
+        else:
+            # Multiple choice question updates
             question.option_a = option_a
             question.option_b = option_b
             question.option_c = option_c
@@ -1114,6 +2006,7 @@ def update_question(question_id):
             question.options = None  # Clear options for multiple choice
         
         db.session.commit()
+        quiz_cache.invalidate(question.quiz_id)
         
         return jsonify({
             "success": True,
@@ -1121,7 +2014,8 @@ def update_question(question_id):
             "question": {
                 "id": question.id,
                 "questionText": question.question_text,
-                "questionType": question.question_type
+                "questionType": question.question_type,
+                "version": question.version
             }
         })
         
@@ -1133,24 +2027,24 @@ def update_question(question_id):
 # ==================== Subscription & Payment API Endpoints ====================
 
 @app.route('/api/subscription', methods=['GET'])
+@require_auth(legacy=_header_claims)
 def get_subscription():
     """Get current user's subscription information"""
     try:
-        user_id = request.headers.get('X-User-Id')
-        if not user_id:
-            return jsonify({"success": False, "message": "User ID required"}), 400
+        user_id = current_auth().id
 
         subscription = Subscription.query.filter_by(user_id=int(user_id)).first()
         
         if not subscription:
             # Create default free subscription
+            free = plan_catalog.tier('free')
             subscription = Subscription(
                 user_id=int(user_id),
                 plan_type='free',
                 status='active',
-                quizzes_limit=5,
+                quizzes_limit=free['quizzes_limit'],
                 quizzes_used=0,
-                students_limit=50
+                students_limit=free['students_limit']
             )
             db.session.add(subscription)
             db.session.commit()
@@ -1175,25 +2069,19 @@ def get_subscription():
 
 
 @app.route('/api/subscription/upgrade', methods=['POST'])
+@require_auth(legacy=_header_claims)
 def upgrade_subscription():
     """Upgrade user's subscription plan"""
     try:
-        user_id = request.headers.get('X-User-Id')
-        if not user_id:
-            return jsonify({"success": False, "message": "User ID required"}), 400
+        user_id = current_auth().id
 
         data = request.get_json()
         plan_type = data.get('plan_type', 'basic')
         
-        # Define plan limits
-        plan_limits = {
-            'free': {'quizzes_limit': 5, 'students_limit': 50, 'price': 0},
-            'basic': {'quizzes_limit': 20, 'students_limit': 100, 'price': 9.99},
-            'pro': {'quizzes_limit': 100, 'students_limit': 500, 'price': 29.99},
-            'enterprise': {'quizzes_limit': -1, 'students_limit': -1, 'price': 99.99}  # -1 means unlimited
-        }
+        # Plan limits come from the shared plan catalog (-1 means unlimited)
+        limits = plan_catalog.tier(plan_type)
         
-        if plan_type not in plan_limits:
+        if limits is None:
             return jsonify({"success": False, "message": "Invalid plan type"}), 400
 
         subscription = Subscription.query.filter_by(user_id=int(user_id)).first()
@@ -1202,7 +2090,6 @@ def upgrade_subscription():
             subscription = Subscription(user_id=int(user_id))
             db.session.add(subscription)
         
-        limits = plan_limits[plan_type]
         subscription.plan_type = plan_type
         subscription.quizzes_limit = limits['quizzes_limit']
         subscription.students_limit = limits['students_limit']
@@ -1231,12 +2118,11 @@ def upgrade_subscription():
 
 
 @app.route('/api/payment/create', methods=['POST'])
+@require_auth(legacy=_header_claims)
 def create_payment():
     """Create a new payment record"""
     try:
-        user_id = request.headers.get('X-User-Id')
-        if not user_id:
-            return jsonify({"success": False, "message": "User ID required"}), 400
+        user_id = current_auth().id
 
         data = request.get_json()
         amount = data.get('amount', 0)
@@ -1279,21 +2165,29 @@ def create_payment():
 
 
 @app.route('/api/payments', methods=['GET'])
+@require_auth(legacy=_header_claims)
 def get_payments():
-    """Get payment history for admin or user"""
+    """Get payment history for admin or user, newest first (cursor, limit, includeTotal)"""
     try:
-        user_id = request.headers.get('X-User-Id')
-        is_admin = request.headers.get('X-Is-Admin', 'false').lower() == 'true'
-        
-        if not user_id:
-            return jsonify({"success": False, "message": "User ID required"}), 400
+        user_id = current_auth().id
+        is_admin = current_auth().role == 'admin'
 
         if is_admin:
             # Admin can see all payments
-            payments = Payment.query.order_by(Payment.created_at.desc()).limit(100).all()
+            query, filters, default_limit = Payment.query, None, 100
         else:
             # User can only see their own payments
-            payments = Payment.query.filter_by(user_id=int(user_id)).order_by(Payment.created_at.desc()).limit(50).all()
+            query = Payment.query.filter_by(user_id=int(user_id))
+            filters, default_limit = ('user_id', int(user_id)), 50
+
+        limit = page_size(request.args.get('limit', type=int), default_limit)
+        result = keyset_pages.page(
+            query, Payment,
+            cursor=request.args.get('cursor'),
+            limit=limit,
+            include_total=request.args.get('includeTotal', '').lower() in ['true', '1', 'yes'],
+            filters=filters
+        )
 
         return jsonify({
             "success": True,
@@ -1308,18 +2202,28 @@ def get_payments():
                     "description": p.description,
                     "created_at": p.created_at.isoformat() if p.created_at else None
                 }
-                for p in payments
-            ]
+                for p in result.pop('items')
+            ],
+            "pagination": {"limit": limit, **result}
         })
+    except KeysetError as e:
+        return jsonify({"success": False, "message": e.message}), e.status_code
     except Exception as e:
         return jsonify({"success": False, "message": str(e)}), 500
 
 
 @app.route('/api/admin/subscriptions', methods=['GET'])
+@require_admin
 def get_all_subscriptions():
-    """Get all subscriptions (admin only)"""
+    """Get all subscriptions (admin only), newest first (cursor, limit, includeTotal)"""
     try:
-        subscriptions = Subscription.query.order_by(Subscription.created_at.desc()).limit(100).all()
+        limit = page_size(request.args.get('limit', type=int), 100)
+        result = keyset_pages.page(
+            Subscription.query, Subscription,
+            cursor=request.args.get('cursor'),
+            limit=limit,
+            include_total=request.args.get('includeTotal', '').lower() in ['true', '1', 'yes']
+        )
         
         return jsonify({
             "success": True,
@@ -1336,30 +2240,22 @@ def get_all_subscriptions():
                     "expiry_date": s.expiry_date.isoformat() if s.expiry_date else None,
                     "created_at": s.created_at.isoformat() if s.created_at else None
                 }
-                for s in subscriptions
-            ]
+                for s in result.pop('items')
+            ],
+            "pagination": {"limit": limit, **result}
         })
+    except KeysetError as e:
+        return jsonify({"success": False, "message": e.message}), e.status_code
     except Exception as e:
         return jsonify({"success": False, "message": str(e)}), 500
 
 
 @app.route('/api/quiz/create', methods=['POST'])
+@require_auth(legacy=_header_claims)
 def create_quiz_endpoint():
     """Create a new quiz (checks subscription limits)"""
     try:
-        user_id = request.headers.get('X-User-Id')
-        if not user_id:
-            return jsonify({"success": False, "message": "User ID required"}), 400
-
-        # Check subscription limits
-        subscription = Subscription.query.filter_by(user_id=int(user_id)).first()
-        
-        if subscription and subscription.quizzes_limit > 0:
-            if subscription.quizzes_used >= subscription.quizzes_limit:
-                return jsonify({
-                    "success": False,
-                    "message": "Quiz limit reached. Please upgrade your subscription to create more quizzes."
-                }), 403
+        user_id = current_auth().id
 
         data = request.get_json()
         title = data.get('title', '').strip()
@@ -1370,6 +2266,14 @@ def create_quiz_endpoint():
         if not title:
             return jsonify({"success": False, "message": "Quiz title is required"}), 400
 
+        # Check and count the quiz against the subscription in one conditional UPDATE;
+        # it commits together with the quiz
+        try:
+            subscription_usage.consume(int(user_id))
+        except UsageLimitError as e:
+            db.session.rollback()
+            return jsonify({"success": False, "message": e.message}), e.status_code
+
         quiz = Quiz(
             title=title,
             description=description,
@@ -1379,11 +2283,8 @@ def create_quiz_endpoint():
         )
         db.session.add(quiz)
         db.session.commit()
-
-        # Update subscription quiz count
-        if subscription and subscription.quizzes_limit > 0:
-            subscription.quizzes_used += 1
-            db.session.commit()
+        quiz_cache.invalidate()
+        access_codes.load()
 
         return jsonify({
             "success": True,
@@ -1401,103 +2302,65 @@ def create_quiz_endpoint():
 
 
 @app.route('/api/admin/ai/generate-questions', methods=['POST'])
+@require_admin
 def generate_ai_questions():
-    """Generate questions using OpenAI API"""
+    """Start a background AI question generation job"""
+    data = request.get_json()
+    if not data:
+        return jsonify({"success": False, "message": "Request body must be JSON."}), 400
+
+    existing = []
+    if data.get('quizId'):
+        existing = [text for (text,) in db.session.query(Question.question_text)
+                    .filter_by(quiz_id=data.get('quizId')).all()]
+
     try:
-        import openai
-        from openai import OpenAI
-        
-        data = request.get_json()
-        topic = data.get('topic', '').strip()
-        difficulty = data.get('difficulty', 'intermediate')
-        question_type = data.get('questionType', 'multiple_choice')
-        num_questions = data.get('numQuestions', 5)
-        context = data.get('context', '').strip()
-        
-        if not topic:
-            return jsonify({"success": False, "message": "Topic is required"}), 400
-        
-        # Get OpenAI API key from environment
-        api_key = os.getenv('OPENAI_API_KEY')
-        if not api_key or api_key == 'your_openai_api_key_here':
-            return jsonify({"success": False, "message": "OpenAI API key not configured"}), 500
-        
-        # Initialize OpenAI client
-        client = OpenAI(
-            api_key=api_key,
-            organization=os.getenv('OPENAI_ORGANIZATION')
-        )
-        
-        # Create the prompt based on question type
-        if question_type == 'multiple_choice':
-            prompt = f"""Create {num_questions} multiple choice questions about {topic} at {difficulty} level.
-{f'Additional context: {context}' if context else ''}
-
-For each question, provide:
-1. Question text
-2. Four options (A, B, C, D)  
-3. Correct answer (A, B, C, or D)
-4. Brief explanation
-
-Format as JSON array with objects containing: questionText, optionA, optionB, optionC, optionD, correctAnswer (0-3), explanation"""
-
-        elif question_type == 'essay':
-            prompt = f"""Create {num_questions} essay questions about {topic} at {difficulty} level.
-{f'Additional context: {context}' if context else ''}
-
-For each question, provide:
-1. Question text
-2. Sample answer/key points
-3. Instructions for students
-4. Suggested word count
-
-Format as JSON array with objects containing: questionText, sampleAnswer, instructions, maxWords"""
-
-        else:  # mixed
-            mc_count = num_questions // 2
-            essay_count = num_questions - mc_count
-            prompt = f"""Create {mc_count} multiple choice and {essay_count} essay questions about {topic} at {difficulty} level.
-{f'Additional context: {context}' if context else ''}
-
-For multiple choice questions, provide: questionText, optionA, optionB, optionC, optionD, correctAnswer (0-3), explanation, type: "multiple_choice"
-For essay questions, provide: questionText, sampleAnswer, instructions, maxWords, type: "essay"
-
-Format as JSON array."""
-
-        # Make API call to OpenAI
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are an expert educator who creates high-quality quiz questions. Always respond with valid JSON only."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=2000,
-            temperature=0.7
-        )
-        
-        # Parse the response
-        generated_content = response.choices[0].message.content.strip()
-        
-        # Clean up the response to ensure it's valid JSON
-        if generated_content.startswith('```json'):
-            generated_content = generated_content[7:]
-        if generated_content.endswith('```'):
-            generated_content = generated_content[:-3]
-        
-        generated_questions = json.loads(generated_content)
-        
-        return jsonify({
-            "success": True,
-            "questions": generated_questions,
-            "message": f"Generated {len(generated_questions)} questions successfully"
-        })
-        
-    except ImportError:
-        return jsonify({"success": False, "message": "OpenAI library not installed. Run: pip install openai"}), 500
-    except json.JSONDecodeError as e:
-        return jsonify({"success": False, "message": f"Failed to parse AI response: {str(e)}"}), 500
-    except Exception as e:
-        return jsonify({"success": False, "message": f"AI generation failed: {str(e)}"}), 500
+        job = ai_generator.submit(data, existing_questions=existing)
+    except AIGenerationError as e:
+        return jsonify({"success": False, "message": e.message}), e.status_code
+
+    payload = job.to_dict()
+    if job.status == 'completed':
+        return jsonify({"success": True, **payload})
+    return jsonify({"success": True, **payload}), 202
+
+@app.route('/api/admin/ai/jobs/<job_id>', methods=['GET'])
+@require_admin
+def get_ai_generation_job(job_id):
+    """Poll an AI question generation job; ?since=N returns only questions after the first N"""
+    job = ai_generator.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "message": "Generation job not found or expired."}), 404
+    since = request.args.get('since', 0, type=int)
+    return jsonify({"success": job.status != 'failed', **job.to_dict(since=max(0, since))})
+
+@app.route('/api/admin/ai/jobs/<job_id>/events', methods=['GET'])
+@require_admin
+def stream_ai_generation_job(job_id):
+    """Server-Sent Events stream: a 'progress' event per batch of new questions, then the final status"""
+    job = ai_generator.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "message": "Generation job not found or expired."}), 404
+
+    def events():
+        sent = 0
+        version = None
+        while True:
+            ai_generator.get(job_id)   # applies the overrun deadline
+            if job.version != version:
+                version = job.version
+                payload = job.to_dict(since=sent)
+                sent = payload["total"]
+                event = job.status if job.done else 'progress'
+                yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+            if job.done:
+                return
+            job.wait(version, 15)
+            if job.version == version:
+                yield ": keepalive\n\n"
+
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 def migrate_database():
     """Add new columns to existing tables if they don't exist"""
@@ -1531,6 +2394,40 @@ def migrate_database():
                 print("Added quiz_access_code column to quizzes table")
             except Exception:
                 pass  # Column already exists
+
+            # Add version column to questions if it doesn't exist
+            try:
+                conn.execute(db.text("ALTER TABLE questions ADD COLUMN version INTEGER DEFAULT 1"))
+                print("Added version column to questions table")
+            except Exception:
+                pass  # Column already exists
+
+            # Add quiz_id column to submissions if it doesn't exist
+            try:
+                conn.execute(db.text("ALTER TABLE submissions ADD COLUMN quiz_id INTEGER REFERENCES quizzes(id)"))
+                print("Added quiz_id column to submissions table")
+            except Exception:
+                pass  # Column already exists
+
+            # Add question pool sampling columns if they don't exist
+            for table, column, ddl in [
+                ('quizzes', 'sample_size', 'INTEGER'),
+                ('quizzes', 'sample_by', 'VARCHAR(20)'),
+                ('quizzes', 'shuffle_options', 'BOOLEAN DEFAULT FALSE'),
+                ('questions', 'tag', 'VARCHAR(100)'),
+                ('questions', 'difficulty', 'VARCHAR(20)'),
+                ('submissions', 'essay_status', 'VARCHAR(20)'),
+                ('submissions', 'essay_revision', 'INTEGER DEFAULT 0'),
+                ('quizzes', 'code_valid_from', 'TIMESTAMP'),
+                ('quizzes', 'code_expires_at', 'TIMESTAMP'),
+                ('quizzes', 'code_max_uses', 'INTEGER'),
+                ('quizzes', 'code_uses', 'INTEGER DEFAULT 0'),
+            ]:
+                try:
+                    conn.execute(db.text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+                    print(f"Added {column} column to {table} table")
+                except Exception:
+                    pass  # Column already exists
             
             conn.commit()
     except Exception as e:
@@ -1664,6 +2561,77 @@ def populate_sample_quiz():
     print(f"Created sample quiz '{sample_quiz.title}' with {len(sample_questions)} questions")
 
 # --- Main Execution ---
+@app.cli.command('import-questions')
+@click.argument('quiz_id', type=int)
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['json', 'csv', 'gift']), help='Defaults to the file extension')
+@click.option('--allow-partial', is_flag=True, help='Import the valid rows even if some are invalid')
+@click.option('--dry-run', is_flag=True, help='Validate only')
+def import_questions_command(quiz_id, path, fmt, allow_partial, dry_run):
+    """Bulk import questions into QUIZ_ID from a JSON, CSV or GIFT file."""
+    if db.session.get(Quiz, quiz_id) is None:
+        raise click.ClickException(f"Quiz {quiz_id} not found")
+    fmt = fmt or detect_format(path)
+    with open(path, encoding='utf-8-sig') as f:
+        content = f.read()
+    try:
+        records = question_importer.parse(content, fmt)
+        summary = question_importer.import_records(quiz_id, records, allow_partial=allow_partial, dry_run=dry_run)
+    except QuestionImportError as e:
+        raise click.ClickException(e.message)
+
+    for error in summary["errors"]:
+        click.echo(f"row {error['row']}: {error['message']}", err=True)
+    if summary["errors"] and not allow_partial:
+        raise click.ClickException(f"{len(summary['errors'])} invalid questions; nothing was imported")
+    if dry_run:
+        click.echo(f"{summary['valid']} of {summary['received']} questions are valid (dry run)")
+    else:
+        click.echo(f"Imported {summary['imported']} of {summary['received']} questions into quiz {quiz_id}")
+
+@app.cli.command('grade-essays')
+@click.argument('quiz_id', type=int)
+@click.option('--regrade', is_flag=True, help='Recompute provisional scores too (overrides are kept)')
+def grade_essays_command(quiz_id, regrade):
+    """Score the pending essay answers of QUIZ_ID."""
+    if not db.session.get(Quiz, quiz_id):
+        raise click.ClickException(f"Quiz {quiz_id} not found")
+    summary = essay_grader.run(quiz_id, regrade=regrade)
+    click.echo(f"Scored {summary['answersScored']} essay answers in {summary['updated']} submissions "
+               f"({summary['skippedConflicts']} changed meanwhile, left for the next run)")
+
+@app.cli.command('export-quiz')
+@click.argument('quiz_id', type=int)
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+@click.option('--with-submissions', is_flag=True, help='Include submissions and student names/emails')
+def export_quiz_command(quiz_id, path, with_submissions):
+    """Write QUIZ_ID to a gzip JSON-lines bundle at PATH."""
+    try:
+        with open(path, 'wb') as f:
+            for chunk in quiz_bundles.export(quiz_id, include_submissions=with_submissions):
+                f.write(chunk)
+    except QuizBundleError as e:
+        os.remove(path)
+        raise click.ClickException(e.message)
+    click.echo(f"Exported quiz {quiz_id} to {path}")
+
+@app.cli.command('import-quiz')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--skip-submissions', is_flag=True, help='Import quiz settings and questions only')
+@click.option('--title', help='Title for the imported quiz')
+def import_quiz_command(path, skip_submissions, title):
+    """Import a quiz bundle from PATH as a new inactive quiz."""
+    try:
+        with open(path, 'rb') as f:
+            summary = quiz_bundles.import_stream(f, include_submissions=not skip_submissions, title=title)
+    except QuizBundleError as e:
+        raise click.ClickException(e.message)
+    for warning in summary["warnings"]:
+        click.echo(f"warning: {warning}", err=True)
+    click.echo(f"Imported quiz {summary['quizId']}: {summary['questions']} questions, "
+               f"{summary['submissions']} submissions ({summary['skippedSubmissions']} skipped), "
+               f"{summary['createdStudents']} new students")
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5001))
     print(f"Starting Quizflow application on port {port}...")
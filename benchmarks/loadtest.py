@@ -0,0 +1,218 @@
+"""
+QuizFlow Load Test
+==================
+Simulates a full class sitting a quiz against a local database stand-in.
+
+Each virtual student runs the real student flow:
+
+    POST /api/validate-code
+    POST /api/auth/login
+    GET  /api/quiz?code=...
+    POST /api/quiz/session/start
+    POST /api/quiz/session/<id>/heartbeat
+    POST /api/submit
+    GET  /api/submission/<id>/details
+
+Requests go through the Flask test client (no network), mail is suppressed,
+and SQL statements are counted per endpoint with SQLAlchemy engine events.
+The report lists per-endpoint throughput, p50/p95/p99 latency and queries
+per request. The exit code is non-zero on errors or threshold breaches, so
+the script can gate CI.
+
+Usage:
+    python benchmarks/loadtest.py --students 200 --concurrency 50
+    python benchmarks/loadtest.py --max-p95-ms 250 --max-queries 8 --json report.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+
+ACCESS_CODE = '12345'
+ANSWERS = [1, 1, 2, 2, 1, 2, 1, 2, 1, 2]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=100, help='Number of virtual students')
+    parser.add_argument('--concurrency', type=int, default=20, help='Students running at the same time')
+    parser.add_argument('--database-url', help='Database URL (default: temporary SQLite file)')
+    parser.add_argument('--group-commit', action='store_true', help='Enable SUBMISSION_GROUP_COMMIT')
+    parser.add_argument('--max-p95-ms', type=float, help='Fail if any endpoint p95 exceeds this (ms)')
+    parser.add_argument('--max-queries', type=float, help='Fail if any endpoint averages more queries per request')
+    parser.add_argument('--json', dest='json_path', help='Also write the report as JSON to this path')
+    return parser.parse_args()
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+class Recorder:
+    """Collects latency samples and SQL statement counts per endpoint"""
+
+    def __init__(self):
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.queries = defaultdict(int)
+        self.errors = defaultdict(int)
+
+    def on_execute(self, *args, **kwargs):
+        label = getattr(self.local, 'label', None)
+        if label is not None:
+            self.local.queries += 1
+
+    def call(self, label, fn, *args, **kwargs):
+        self.local.label = label
+        self.local.queries = 0
+        started = time.perf_counter()
+        try:
+            response = fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            queries = self.local.queries
+            self.local.label = None
+        with self.lock:
+            self.latencies[label].append(elapsed)
+            self.queries[label] += queries
+            if response.status_code >= 400:
+                self.errors[label] += 1
+        return response
+
+
+def setup_app(args):
+    db_url = args.database_url or f"sqlite:///{tempfile.mkdtemp()}/loadtest.db"
+    os.environ['DATABASE_URL'] = db_url
+    os.environ['SEND_STUDENT_EMAILS'] = 'false'
+    os.environ['SKIP_SAMPLE_DATA'] = 'false'
+    os.environ['VALID_LOGIN_CODES'] = ACCESS_CODE
+    os.environ.pop('ADMIN_EMAIL_RECIPIENT', None)
+    os.environ['SUBMISSION_GROUP_COMMIT'] = 'true' if args.group_commit else 'false'
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import app as quizflow
+
+    quizflow.app.extensions['mail'].suppress = True
+    with quizflow.app.app_context():
+        quizflow.populate_sample_quiz()
+        quiz = quizflow.Quiz.query.filter_by(is_active=True).first()
+        quiz.quiz_access_code = ACCESS_CODE
+        quizflow.db.session.commit()
+        quizflow.access_codes.load()
+    return quizflow, db_url
+
+
+def run_student(quizflow, recorder, index):
+    """Run one virtual student through the full quiz flow"""
+    client = quizflow.app.test_client()
+    email = f"student{index}@loadtest.example"
+
+    recorder.call('validate-code', client.post, '/api/validate-code', json={'code': ACCESS_CODE})
+    recorder.call('auth/login', client.post, '/api/auth/login',
+                  json={'code': ACCESS_CODE, 'name': f'Student {index}', 'email': email})
+    recorder.call('quiz', client.get, f'/api/quiz?code={ACCESS_CODE}')
+
+    response = recorder.call('quiz/session/start', client.post, '/api/quiz/session/start',
+                             json={'email': email, 'code': ACCESS_CODE})
+    session_id = (response.get_json() or {}).get('session', {}).get('sessionId')
+    if session_id:
+        recorder.call('quiz/session/heartbeat', client.post, f'/api/quiz/session/{session_id}/heartbeat',
+                      json={'answers': ANSWERS[:5]})
+
+    response = recorder.call('submit', client.post, '/api/submit', json={
+        'email': email, 'code': ACCESS_CODE, 'sessionId': session_id, 'answers': ANSWERS
+    })
+    submission_id = (response.get_json() or {}).get('submissionId')
+    if submission_id:
+        recorder.call('submission/details', client.get, f'/api/submission/{submission_id}/details')
+
+
+def build_report(recorder, elapsed):
+    report = {}
+    for label, samples in recorder.latencies.items():
+        samples = sorted(samples)
+        report[label] = {
+            'requests': len(samples),
+            'errors': recorder.errors[label],
+            'throughput': len(samples) / elapsed if elapsed else 0.0,
+            'p50_ms': percentile(samples, 50) * 1000,
+            'p95_ms': percentile(samples, 95) * 1000,
+            'p99_ms': percentile(samples, 99) * 1000,
+            'queries_per_request': recorder.queries[label] / len(samples)
+        }
+    return report
+
+
+def print_report(report, elapsed, args, db_url):
+    print(f"Students: {args.students}  Concurrency: {args.concurrency}  "
+          f"Group commit: {args.group_commit}  Elapsed: {elapsed:.2f}s")
+    print(f"Database: {db_url}")
+    print()
+    header = f"{'endpoint':<26}{'reqs':>6}{'errs':>6}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}"
+    print(header)
+    print('-' * len(header))
+    for label, row in report.items():
+        print(f"{label:<26}{row['requests']:>6}{row['errors']:>6}{row['throughput']:>9.1f}"
+              f"{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}"
+              f"{row['queries_per_request']:>9.2f}")
+
+
+def check_thresholds(report, args):
+    failures = []
+    for label, row in report.items():
+        if row['errors']:
+            failures.append(f"{label}: {row['errors']} failed requests")
+        if args.max_p95_ms is not None and row['p95_ms'] > args.max_p95_ms:
+            failures.append(f"{label}: p95 {row['p95_ms']:.1f}ms > {args.max_p95_ms}ms")
+        if args.max_queries is not None and row['queries_per_request'] > args.max_queries:
+            failures.append(f"{label}: {row['queries_per_request']:.2f} queries/request > {args.max_queries}")
+    return failures
+
+
+def main():
+    args = parse_args()
+    quizflow, db_url = setup_app(args)
+
+    from sqlalchemy import event
+
+    recorder = Recorder()
+    with quizflow.app.app_context():
+        event.listen(quizflow.db.engine, 'before_cursor_execute', recorder.on_execute)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(lambda i: run_student(quizflow, recorder, i), range(args.students)))
+    elapsed = time.perf_counter() - started
+
+    report = build_report(recorder, elapsed)
+    print_report(report, elapsed, args, db_url)
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({'elapsedSeconds': elapsed, 'students': args.students,
+                       'concurrency': args.concurrency, 'endpoints': report}, f, indent=2)
+
+    failures = check_thresholds(report, args)
+    if failures:
+        print()
+        print('FAILED:')
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,86 @@
+"""
+QuizFlow Submission Burst Benchmark
+===================================
+Simulates the end of a timed quiz: every student submits at once.
+
+Runs against a local SQLite (or Postgres via --database-url) stand-in with
+mail disabled, and reports throughput with and without group commit.
+
+Usage:
+    python benchmarks/submission_burst.py --students 1000 --workers 50
+    python benchmarks/submission_burst.py --students 1000 --group-commit
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=1000, help='Number of simultaneous submissions')
+    parser.add_argument('--workers', type=int, default=50, help='Concurrent client threads')
+    parser.add_argument('--group-commit', action='store_true', help='Enable SUBMISSION_GROUP_COMMIT')
+    parser.add_argument('--database-url', help='Database URL (default: temporary SQLite file)')
+    parser.add_argument('--target-seconds', type=float, default=10.0,
+                        help='Fail (exit 1) if the burst takes longer than this')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    db_url = args.database_url or f"sqlite:///{tempfile.mkdtemp()}/burst.db"
+    os.environ['DATABASE_URL'] = db_url
+    os.environ['SEND_STUDENT_EMAILS'] = 'false'
+    os.environ['SKIP_SAMPLE_DATA'] = 'false'
+    os.environ.pop('ADMIN_EMAIL_RECIPIENT', None)
+    os.environ['SUBMISSION_GROUP_COMMIT'] = 'true' if args.group_commit else 'false'
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import app as quizflow
+
+    with quizflow.app.app_context():
+        quizflow.populate_sample_quiz()
+        emails = [f"burst{i}@example.com" for i in range(args.students)]
+        quizflow.db.session.execute(
+            quizflow.User.__table__.insert(),
+            [{'name': f'Student {i}', 'email': email, 'password': '12345'} for i, email in enumerate(emails)]
+        )
+        quizflow.db.session.commit()
+
+    answers = [1, 1, 2, 2, 1, 2, 1, 2, 1, 2]
+
+    def submit(email):
+        client = quizflow.app.test_client()
+        started = time.perf_counter()
+        response = client.post('/api/submit', json={'email': email, 'answers': answers})
+        return response.status_code, time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        results = list(pool.map(submit, emails))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for _, latency in results)
+    errors = sum(1 for status, _ in results if status != 200)
+    quantiles = statistics.quantiles(latencies, n=100)
+
+    print(f"Mode:        {'group commit' if args.group_commit else 'per-request commit'}")
+    print(f"Database:    {db_url}")
+    print(f"Submissions: {len(results)} ({errors} errors)")
+    print(f"Elapsed:     {elapsed:.2f}s ({len(results) / elapsed:.1f} submissions/s)")
+    print(f"Latency:     p50={quantiles[49] * 1000:.1f}ms p95={quantiles[94] * 1000:.1f}ms "
+          f"p99={quantiles[98] * 1000:.1f}ms")
+    if args.group_commit:
+        print(f"Writer:      {quizflow.submission_writer.stats}")
+
+    return 1 if errors or elapsed > args.target_seconds else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
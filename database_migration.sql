@@ -126,4 +126,56 @@ WHERE NOT EXISTS (
     SELECT 1 FROM subscriptions WHERE subscriptions.user_id = users.id
 );
 
+-- Server-side quiz sessions (deadline + autosaved answers)
+CREATE TABLE IF NOT EXISTS quiz_sessions (
+    id SERIAL PRIMARY KEY,
+    session_id VARCHAR(36) UNIQUE NOT NULL,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    quiz_id INTEGER NOT NULL REFERENCES quizzes(id) ON DELETE CASCADE,
+    access_code VARCHAR(20),
+    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    deadline TIMESTAMP NOT NULL,
+    answers JSON,
+    last_heartbeat_at TIMESTAMP,
+    submitted_at TIMESTAMP,
+    CONSTRAINT uq_quiz_sessions_user_quiz UNIQUE (user_id, quiz_id)
+);
+
+-- Question versions for batch editing (optimistic concurrency)
+ALTER TABLE questions ADD COLUMN IF NOT EXISTS version INTEGER DEFAULT 1;
+
+-- Quiz each submission answered (bundles, per-quiz results)
+ALTER TABLE submissions ADD COLUMN IF NOT EXISTS quiz_id INTEGER REFERENCES quizzes(id);
+CREATE INDEX IF NOT EXISTS ix_submissions_quiz_id ON submissions (quiz_id);
+
+-- Per-student question sampling from a quiz's pool
+ALTER TABLE quizzes ADD COLUMN IF NOT EXISTS sample_size INTEGER;
+ALTER TABLE quizzes ADD COLUMN IF NOT EXISTS sample_by VARCHAR(20);
+ALTER TABLE quizzes ADD COLUMN IF NOT EXISTS shuffle_options BOOLEAN DEFAULT FALSE;
+ALTER TABLE questions ADD COLUMN IF NOT EXISTS tag VARCHAR(100);
+ALTER TABLE questions ADD COLUMN IF NOT EXISTS difficulty VARCHAR(20);
+
+-- Full-text search over question text and options (must match services/question_search.py)
+CREATE INDEX IF NOT EXISTS ix_questions_search ON questions USING GIN (
+    to_tsvector('english', coalesce(question_text, '') || ' ' || coalesce(option_a, '') || ' ' ||
+    coalesce(option_b, '') || ' ' || coalesce(option_c, '') || ' ' || coalesce(option_d, ''))
+);
+
+-- Essay grading state of each submission
+ALTER TABLE submissions ADD COLUMN IF NOT EXISTS essay_status VARCHAR(20);
+ALTER TABLE submissions ADD COLUMN IF NOT EXISTS essay_revision INTEGER DEFAULT 0;
+
+-- One submission per student and quiz (remove existing duplicates first)
+CREATE UNIQUE INDEX IF NOT EXISTS uq_submissions_user_quiz ON submissions (user_id, quiz_id);
+
+-- Access code validity windows and usage caps
+ALTER TABLE quizzes ADD COLUMN IF NOT EXISTS code_valid_from TIMESTAMP;
+ALTER TABLE quizzes ADD COLUMN IF NOT EXISTS code_expires_at TIMESTAMP;
+ALTER TABLE quizzes ADD COLUMN IF NOT EXISTS code_max_uses INTEGER;
+ALTER TABLE quizzes ADD COLUMN IF NOT EXISTS code_uses INTEGER DEFAULT 0;
+
+-- Keyset pagination of the newest-first payments and subscriptions listings
+CREATE INDEX IF NOT EXISTS ix_payments_created_at_id ON payments (created_at, id);
+CREATE INDEX IF NOT EXISTS ix_subscriptions_created_at_id ON subscriptions (created_at, id);
+
 SELECT 'Database migration completed successfully!' as final_status;
@@ -12,6 +12,8 @@ from .subscription_models import (
     AdminAuditLog,
     RateLimitLog,
     User,
+    plan_catalog,
+    quiz_usage,
     init_subscription_models
 )
 
@@ -23,5 +25,7 @@ __all__ = [
     'AdminAuditLog',
     'RateLimitLog',
     'User',
+    'plan_catalog',
+    'quiz_usage',
     'init_subscription_models'
 ]
@@ -5,12 +5,32 @@ This module contains all database models for the subscription and payment system
 """
 
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import and_, event, func, or_, select
+from sqlalchemy.orm import Session, object_session
 from datetime import datetime, timezone, timedelta
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import check_password_hash
+import hmac
 import os
 
+from services.plan_catalog import PlanCatalog
+from services.usage_meter import UsageMeter, UsageLimitError
+from services.subscription_sweeper import SubscriptionSweeper, next_period
+from utils.email_utils import queue_email, send_subscription_expiry_reminder_email
+from utils.password_hashing import hash_password, needs_rehash, PasswordRehasher
+
 db = SQLAlchemy()
 
+# Background upgrader for plaintext/outdated password hashes (set by init_subscription_models)
+password_rehasher = None
+
+# Background expiry/renewal/reminder processing (set by init_subscription_models)
+subscription_sweeper = None
+
+
+def _as_utc(value):
+    """DateTime columns come back naive; the values they hold are UTC"""
+    return value.replace(tzinfo=timezone.utc) if value is not None and value.tzinfo is None else value
+
 
 # ============================================================================
 # SUBSCRIPTION PLAN MODEL
@@ -50,13 +70,39 @@ class SubscriptionPlan(db.Model):
 
     @classmethod
     def get_plan_by_name(cls, plan_name):
-        """Get a subscription plan by name"""
-        return cls.query.filter_by(plan_name=plan_name, is_active=True).first()
+        """Get an active subscription plan by name (from the in-memory plan catalog)"""
+        return plan_catalog.get(plan_name)
 
     @classmethod
     def get_all_active_plans(cls):
-        """Get all active subscription plans"""
-        return cls.query.filter_by(is_active=True).all()
+        """Get all active subscription plans (from the in-memory plan catalog)"""
+        return plan_catalog.plans()
+
+
+# Shared catalog of plans and tiers; a committed ORM change to a plan invalidates it
+plan_catalog = PlanCatalog(db, SubscriptionPlan)
+
+
+def _note_plan_change(mapper, connection, target):
+    # Flushed, not committed: other requests would still read (and cache) the old plans
+    session = object_session(target)
+    if session is not None:
+        session.info['plans_changed'] = True
+
+
+def _invalidate_changed_plans(session):
+    if session.info.pop('plans_changed', False):
+        plan_catalog.invalidate()
+
+
+def _forget_plan_changes(session):
+    session.info.pop('plans_changed', None)
+
+
+for _event in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(SubscriptionPlan, _event, _note_plan_change)
+event.listen(Session, 'after_commit', _invalidate_changed_plans)
+event.listen(Session, 'after_rollback', _forget_plan_changes)
 
 
 # ============================================================================
@@ -68,6 +114,7 @@ class Payment(db.Model):
     Stores bKash transaction details and screenshots.
     """
     __tablename__ = 'payments'
+    __table_args__ = (db.Index('ix_payments_created_at_id', 'created_at', 'id'),)
 
     id = db.Column(db.Integer, primary_key=True)
     user_email = db.Column(db.String(255), nullable=False, index=True)
@@ -141,7 +188,10 @@ class Payment(db.Model):
 class UserSubscription(db.Model):
     """
     Active user subscriptions with quiz usage tracking.
-    Automatically resets quiz limit every 30 days.
+    Expiry, renewal and reminders are processed by the subscription sweeper,
+    which persists `status` ('active' or 'expired'). Read paths also compare
+    expiry_date with the clock, so a subscription expires on time even where
+    the sweeper does not run.
     """
     __tablename__ = 'user_subscriptions'
 
@@ -153,6 +203,8 @@ class UserSubscription(db.Model):
     start_date = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     expiry_date = db.Column(db.DateTime, nullable=False, index=True)
     is_active = db.Column(db.Boolean, default=True, index=True)
+    status = db.Column(db.String(20), default='active', index=True)  # active, expired (persisted by the sweeper)
+    reminder_sent_at = db.Column(db.DateTime)
     payment_id = db.Column(db.Integer, db.ForeignKey('payments.id'))
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), 
@@ -173,11 +225,17 @@ class UserSubscription(db.Model):
             'status': self.get_status()
         }
 
+    def is_expired(self, now=None):
+        """Expired by the sweeper, or past expiry_date and not swept yet"""
+        if self.status == 'expired':
+            return True
+        return _as_utc(self.expiry_date) < (now or datetime.now(timezone.utc))
+
     def get_status(self):
         """Get current subscription status"""
         if not self.is_active:
             return 'inactive'
-        if self.expiry_date < datetime.now(timezone.utc):
+        if self.is_expired():
             return 'expired'
         if self.quizzes_used >= self.quiz_limit:
             return 'limit_reached'
@@ -185,27 +243,29 @@ class UserSubscription(db.Model):
 
     def can_create_quiz(self):
         """Check if user can create more quizzes"""
-        if not self.is_active:
-            return False
-        if self.expiry_date < datetime.now(timezone.utc):
+        return self.get_status() == 'active'
+
+    def increment_quiz_usage(self):
+        """Increment the quiz usage counter (atomically, if quota is left)"""
+        try:
+            row = quiz_usage.consume(row_id=self.id)
+        except UsageLimitError:
+            db.session.rollback()
             return False
-        if self.quizzes_used >= self.quiz_limit:
+        if row is None:
             return False
+        db.session.commit()
+        UsageMeter.sync(self, 'quizzes_used', row)
         return True
 
-    def increment_quiz_usage(self):
-        """Increment the quiz usage counter"""
-        if self.can_create_quiz():
-            self.quizzes_used += 1
-            db.session.commit()
-            return True
-        return False
-
     def reset_usage(self):
-        """Reset quiz usage and extend subscription for another period"""
+        """Reset quiz usage and extend subscription for another period of the plan's duration"""
+        plan = plan_catalog.get(self.plan_name)
+        self.start_date, self.expiry_date = next_period(
+            self.expiry_date, plan.duration_days if plan else None, datetime.now(timezone.utc))
         self.quizzes_used = 0
-        self.start_date = self.expiry_date
-        self.expiry_date = self.expiry_date + timedelta(days=self.quiz_limit)
+        self.status = 'active'
+        self.reminder_sent_at = None
         db.session.commit()
 
     @classmethod
@@ -216,7 +276,11 @@ class UserSubscription(db.Model):
     @classmethod
     def get_subscription_status(cls, user_id):
         """Get detailed subscription status for a user"""
-        subscription = cls.get_active_subscription(user_id)
+        return cls.status_payload(cls.get_active_subscription(user_id))
+
+    @staticmethod
+    def status_payload(subscription):
+        """Subscription status payload of an already loaded subscription (or None)"""
         if not subscription:
             return {
                 'hasSubscription': False,
@@ -238,6 +302,15 @@ class UserSubscription(db.Model):
         }
 
 
+# Quiz quota of active, unexpired subscriptions (one conditional UPDATE per charge)
+quiz_usage = UsageMeter(
+    db, UserSubscription, 'quizzes_used', 'quiz_limit',
+    scope=lambda t: (t.c.is_active.is_(True),),
+    usable=lambda t, now: (t.c.status == 'active', t.c.expiry_date >= now),
+    limit_message='Quiz limit reached or subscription expired'
+)
+
+
 # ============================================================================
 # ADMIN AUDIT LOG MODEL
 # ============================================================================
@@ -246,6 +319,7 @@ class AdminAuditLog(db.Model):
     Audit log for admin actions (payment approvals, rejections, etc.)
     """
     __tablename__ = 'admin_audit_log'
+    __table_args__ = (db.Index('ix_admin_audit_log_created_at_id', 'created_at', 'id'),)
 
     id = db.Column(db.Integer, primary_key=True)
     admin_username = db.Column(db.String(100), nullable=False, index=True)
@@ -352,18 +426,30 @@ class User(db.Model):
     # Relationship with subscriptions
     subscriptions = db.relationship('UserSubscription', backref='user', lazy=True)
 
-    def set_password(self, password):
-        """Hash and set password"""
-        self.password_hash = generate_password_hash(password)
+    def set_password(self, password, password_hash=None, method=None):
+        """Hash and set password (or set a hash computed elsewhere, e.g. in bulk)"""
+        self.password_hash = password_hash or hash_password(password, method)
         # Keep original password for backward compatibility (consider removing in production)
         self.password = self.password_hash
 
     def check_password(self, password):
-        """Verify password against hash"""
+        """
+        Verify password against hash.
+
+        Legacy plaintext passwords and hashes made with an outdated scheme
+        or cost are upgraded in the background after a successful check.
+        """
         if self.password_hash:
-            return check_password_hash(self.password_hash, password)
-        # Fallback for legacy passwords (consider removing in production)
-        return self.password == password
+            valid = check_password_hash(self.password_hash, password)
+            outdated = valid and needs_rehash(self.password_hash)
+        else:
+            # Fallback for legacy passwords (consider removing in production)
+            valid = self.password is not None and hmac.compare_digest(
+                self.password.encode('utf-8'), password.encode('utf-8'))
+            outdated = valid
+        if outdated and password_rehasher is not None:
+            password_rehasher.submit(self.id, password, self.password_hash or self.password)
+        return valid
 
     def is_teacher(self):
         """Check if user has teacher role"""
@@ -414,6 +500,58 @@ class User(db.Model):
         """Get all teacher users"""
         return cls.query.filter_by(role='teacher').all()
 
+    @classmethod
+    def list_teachers(cls, plan=None, status=None, expires_after=None, expires_before=None,
+                      limit=50, offset=0):
+        """
+        One page of teachers with their active subscription, in two queries.
+
+        Each teacher is outer-joined to one active subscription (the newest,
+        like get_active_subscription() returns for a single user), so the
+        page needs no query per teacher. Filters:
+            plan: subscription plan name ('free' for teachers without one)
+            status: active, expired, limit_reached or no_subscription
+            expires_after / expires_before: subscription expiry window
+
+        Returns (total matching teachers, [(user, subscription or None)]).
+        """
+        active = (
+            db.session.query(func.max(UserSubscription.id).label('id'))
+            .filter(UserSubscription.is_active.is_(True))
+            .group_by(UserSubscription.user_id)
+            .subquery()
+        )
+        query = (
+            db.session.query(cls, UserSubscription)
+            .outerjoin(UserSubscription, and_(UserSubscription.user_id == cls.id,
+                                              UserSubscription.id.in_(select(active.c.id))))
+            .filter(cls.role == 'teacher')
+        )
+
+        now = datetime.now(timezone.utc)
+        if plan == 'free':
+            query = query.filter(UserSubscription.id.is_(None))
+        elif plan:
+            query = query.filter(UserSubscription.plan_name == plan)
+        if status == 'no_subscription':
+            query = query.filter(UserSubscription.id.is_(None))
+        elif status == 'expired':
+            query = query.filter(or_(UserSubscription.status == 'expired', UserSubscription.expiry_date < now))
+        elif status == 'limit_reached':
+            query = query.filter(UserSubscription.status == 'active', UserSubscription.expiry_date >= now,
+                                 UserSubscription.quizzes_used >= UserSubscription.quiz_limit)
+        elif status == 'active':
+            query = query.filter(UserSubscription.status == 'active', UserSubscription.expiry_date >= now,
+                                 UserSubscription.quizzes_used < UserSubscription.quiz_limit)
+        if expires_after:
+            query = query.filter(UserSubscription.expiry_date >= expires_after)
+        if expires_before:
+            query = query.filter(UserSubscription.expiry_date < expires_before)
+
+        total = query.order_by(None).count()
+        rows = query.order_by(cls.created_at.desc(), cls.id.desc()).limit(limit).offset(offset).all()
+        return total, rows
+
     @classmethod
     def get_by_email(cls, email):
         """Get user by email"""
@@ -434,11 +572,33 @@ def init_subscription_models(app):
     Initialize subscription models with Flask app.
     Call this in your main app.py after creating the Flask app.
     """
+    global password_rehasher, subscription_sweeper
     db.init_app(app)
+    password_rehasher = PasswordRehasher(app, db, User)
+    subscription_sweeper = SubscriptionSweeper(
+        app, db, UserSubscription, User, plan_catalog,
+        notify=lambda email, plan_name, expiry_date: queue_email(
+            send_subscription_expiry_reminder_email, email, plan_name, expiry_date)
+    )
     
     with app.app_context():
         db.create_all()
         
+        # Columns added after the first release (create_all does not alter existing tables)
+        for statement in (
+            "ALTER TABLE user_subscriptions ADD COLUMN status VARCHAR(20) DEFAULT 'active'",
+            "ALTER TABLE user_subscriptions ADD COLUMN reminder_sent_at TIMESTAMP",
+            "CREATE INDEX IF NOT EXISTS ix_user_subscriptions_status ON user_subscriptions (status)",
+            "CREATE INDEX IF NOT EXISTS ix_payments_created_at_id ON payments (created_at, id)",
+            "CREATE INDEX IF NOT EXISTS ix_admin_audit_log_created_at_id ON admin_audit_log (created_at, id)",
+        ):
+            try:
+                with db.engine.connect() as conn:
+                    conn.execute(db.text(statement))
+                    conn.commit()
+            except Exception:
+                pass  # Column already exists
+        
         # Create default subscription plans if they don't exist
         default_plans = [
             {'plan_name': 'Basic', 'price': 500.00, 'quiz_limit': 10, 'duration_days': 30},
@@ -453,3 +613,6 @@ def init_subscription_models(app):
                 db.session.add(plan)
         
         db.session.commit()
+    
+    # Flip expired subscriptions and send reminders in the background
+    subscription_sweeper.start()
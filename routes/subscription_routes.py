@@ -5,16 +5,18 @@ API endpoints for subscription management, payment processing, and teacher accou
 """
 
 from flask import Blueprint, request, jsonify, session, current_app
+from sqlalchemy import bindparam, insert, select, update
 from datetime import datetime, timezone, timedelta
-from functools import wraps
 import os
 import base64
 import io
 
 from models.subscription_models import (
     db, SubscriptionPlan, Payment, UserSubscription, 
-    AdminAuditLog, User
+    AdminAuditLog, User, plan_catalog, quiz_usage
 )
+from services.usage_meter import UsageLimitError
+from services.keyset import KeysetPaginator, KeysetError, page_size
 from utils.email_utils import (
     send_account_creation_email,
     send_payment_confirmation_email,
@@ -26,52 +28,60 @@ from utils.email_utils import (
     validate_email,
     rate_limit_check,
     get_client_ip,
+    queue_email,
     MAILBOXES
 )
+from utils.auth_tokens import AuthClaims, require_auth, current_auth
+from utils.password_hashing import hash_passwords, PROVISIONED_PASSWORD_HASH_METHOD
 
 # Create blueprint
 subscription_bp = Blueprint('subscription', __name__, url_prefix='/api')
 
+# Cursor pagination (and cached totals) for the payments and audit log listings
+paginator = KeysetPaginator(db)
+
+# Largest batch accepted by the bulk approval endpoint
+BULK_APPROVE_MAX = int(os.getenv('BULK_APPROVE_MAX', 500))
+
+# Largest page of the admin teachers listing
+TEACHERS_PAGE_MAX = int(os.getenv('TEACHERS_PAGE_MAX', 200))
+
+# Subscription statuses the teachers listing can filter by
+TEACHER_STATUSES = ('active', 'expired', 'limit_reached', 'no_subscription')
+
 
 # ============================================================================
 # AUTHENTICATION DECORATORS
 # ============================================================================
 
-def require_admin(f):
-    """Decorator to require admin authentication"""
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        # Check if admin is logged in (session-based)
-        if not session.get('is_admin'):
-            return jsonify({
-                'success': False,
-                'message': 'Admin authentication required'
-            }), 401
-        
-        return f(*args, **kwargs)
-    return decorated_function
+def _session_claims():
+    """Identity of a Flask-session login (clients that predate tokens)"""
+    if session.get('is_admin'):
+        return AuthClaims(session.get('user_id'), 'admin', name=session.get('admin_username'),
+                          email=session.get('user_email'))
+    user_id = session.get('user_id')
+    if not user_id:
+        return None
+    user = User.query.get(user_id)
+    return AuthClaims(user.id, user.role, name=user.username, email=user.email) if user else None
 
 
-def require_teacher(f):
-    """Decorator to require teacher authentication"""
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        user_id = session.get('user_id')
-        if not user_id:
-            return jsonify({
-                'success': False,
-                'message': 'Authentication required'
-            }), 401
-        
-        user = User.query.get(user_id)
-        if not user or user.role != 'teacher':
-            return jsonify({
-                'success': False,
-                'message': 'Teacher access required'
-            }), 403
-        
-        return f(*args, **kwargs)
-    return decorated_function
+# Admin-only and teacher-only endpoints (role from the signed token, or the session for older clients)
+require_admin = require_auth('admin', legacy=_session_claims)
+require_teacher = require_auth('teacher', legacy=_session_claims)
+
+
+def _flag(value):
+    """Boolean query flag ("true", "1", "yes")"""
+    return (value or '').lower() in ['true', '1', 'yes']
+
+
+def _optional_datetime(value):
+    """Parse an optional ISO 8601 query value (naive values are UTC); raises ValueError"""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
 
 
 # ============================================================================
@@ -83,13 +93,21 @@ def get_subscription_plans():
     """
     Get all active subscription plans.
     Public endpoint - no authentication required.
+
+    Served from the in-memory plan catalog with the catalog version as
+    ETag; clients sending If-None-Match get a 304 while it is unchanged.
     """
     try:
-        plans = SubscriptionPlan.get_all_active_plans()
-        return jsonify({
+        catalog, etag = plan_catalog.payload_and_etag()
+        response = jsonify({
             'success': True,
-            'plans': [plan.to_dict() for plan in plans]
+            'plans': catalog['plans'],
+            'tiers': catalog['tiers'],
+            'version': etag
         })
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'public, max-age=0, must-revalidate'
+        return response.make_conditional(request)
     except Exception as e:
         current_app.logger.error(f"Error fetching plans: {str(e)}")
         return jsonify({
@@ -301,13 +319,15 @@ def get_payment_status(trx_id):
 
 
 @subscription_bp.route('/payment/my-payments', methods=['GET'])
+@require_auth(legacy=_session_claims, optional=True)
 def get_my_payments():
     """
     Get all payments for the authenticated user.
     """
     try:
-        # Get email from session or query parameter
-        email = session.get('user_email') or request.args.get('email')
+        # Get email from the token (or legacy session) or query parameter
+        auth = current_auth()
+        email = (auth.email if auth else None) or request.args.get('email')
         
         if not email:
             return jsonify({
@@ -360,32 +380,38 @@ def get_pending_payments():
 @require_admin
 def get_all_payments():
     """
-    Get all payments (for admin dashboard).
+    Get all payments (for admin dashboard), newest first.
+
+    Keyset pagination: pass the previous page's `nextCursor` as `cursor`.
+    Query: limit (alias per_page), status, includeTotal.
     """
     try:
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 20, type=int)
         status = request.args.get('status')  # Optional filter
+        limit = page_size(request.args.get('limit', type=int) or request.args.get('per_page', type=int), 20)
         
-        query = Payment.query.order_by(Payment.created_at.desc())
-        
+        query = Payment.query
         if status:
             query = query.filter_by(status=status)
         
-        pagination = query.paginate(page=page, per_page=per_page, error_out=False)
-        payments = pagination.items
+        result = paginator.page(
+            query, Payment,
+            cursor=request.args.get('cursor'),
+            limit=limit,
+            include_total=_flag(request.args.get('includeTotal')),
+            filters=('status', status) if status else None
+        )
         
         return jsonify({
             'success': True,
-            'payments': [p.to_dict() for p in payments],
-            'pagination': {
-                'page': page,
-                'perPage': per_page,
-                'total': pagination.total,
-                'pages': pagination.pages
-            }
+            'payments': [p.to_dict() for p in result.pop('items')],
+            'pagination': {'limit': limit, **result}
         })
     
+    except KeysetError as e:
+        return jsonify({
+            'success': False,
+            'message': e.message
+        }), e.status_code
     except Exception as e:
         current_app.logger.error(f"Error fetching all payments: {str(e)}")
         return jsonify({
@@ -394,6 +420,174 @@ def get_all_payments():
         }), 500
 
 
+def _unique_usernames(emails):
+    """
+    Usernames for new accounts, checked against the users table in one query.
+
+    Candidates that are taken (or repeat within the batch) are regenerated
+    and checked again, which in practice needs no further round trip.
+    """
+    users = User.__table__
+    usernames = {email: generate_username_from_email(email) for email in emails}
+    pending = set(usernames)
+    while pending:
+        taken = set(db.session.execute(
+            select(users.c.username).where(users.c.username.in_({usernames[e] for e in pending}))
+        ).scalars())
+        seen = set()
+        clashes = set()
+        for email, username in usernames.items():
+            if username in seen or (email in pending and username in taken):
+                clashes.add(email)
+            seen.add(username)
+        for email in clashes:
+            usernames[email] = generate_username_from_email(email)
+        pending = clashes
+    return usernames
+
+
+def _approve_payments(payments):
+    """
+    Approve pending payments in one transaction.
+
+    Plan limits come from the in-memory plan catalog. New teacher accounts,
+    subscriptions and audit rows are created with one bulk INSERT each, and
+    the payments are marked approved with one executemany UPDATE, so the
+    whole batch costs a fixed handful of statements and a single commit.
+    Generated passwords are hashed up front in a process pool
+    (PROVISIONED_PASSWORD_HASH_METHOD).
+
+    Returns (results, approved): a result dict per payment in input order,
+    and the approved accounts for _queue_approval_emails(). A payment fails
+    on its own (e.g. its user is already a teacher); a database error rolls
+    back the whole batch and is raised.
+    """
+    auth = current_auth()
+    admin_id = auth.id or 1
+    admin_username = auth.name or 'admin'
+    ip_address = get_client_ip()
+    now = datetime.now(timezone.utc)
+    users = User.__table__
+
+    existing = {
+        row.email: row for row in db.session.execute(
+            select(users.c.id, users.c.email, users.c.username, users.c.role)
+            .where(users.c.email.in_({p.user_email for p in payments}))
+        ).all()
+    }
+
+    accepted = []
+    results = {}
+    new_emails = {}
+    for payment in payments:
+        user = existing.get(payment.user_email)
+        if (user is not None and user.role == 'teacher') or payment.user_email in new_emails:
+            results[payment.id] = {'paymentId': payment.id, 'success': False,
+                                   'message': 'User is already a teacher'}
+            continue
+        if user is None:
+            new_emails[payment.user_email] = None
+        accepted.append(payment)
+
+    # New teacher accounts: usernames in one query, passwords hashed in one pool batch
+    new_emails = list(new_emails)
+    passwords = {email: generate_secure_password() for email in new_emails}
+    user_ids = {email: row.id for email, row in existing.items()}
+    usernames = {email: row.username for email, row in existing.items()}
+    if new_emails:
+        usernames.update(_unique_usernames(new_emails))
+        hashes = hash_passwords([passwords[e] for e in new_emails], method=PROVISIONED_PASSWORD_HASH_METHOD)
+        created = db.session.execute(
+            insert(users).returning(users.c.id, users.c.email),
+            [{
+                'name': email.split('@')[0],  # Use email prefix as name
+                'email': email,
+                'username': usernames[email],
+                'role': 'teacher',
+                'password': password_hash,
+                'password_hash': password_hash
+            } for email, password_hash in zip(new_emails, hashes)]
+        ).all()
+        user_ids.update({row.email: row.id for row in created})
+
+    approved = []
+    subscriptions = []
+    audit_rows = []
+    payment_rows = []
+    for payment in accepted:
+        plan = plan_catalog.get(payment.plan_name)
+        expiry_date = now + timedelta(days=plan.duration_days if plan and plan.duration_days else 30)
+        subscriptions.append({
+            'user_id': user_ids[payment.user_email],
+            'plan_name': payment.plan_name,
+            'quiz_limit': plan.quiz_limit if plan else 10,
+            'expiry_date': expiry_date,
+            'payment_id': payment.id,
+            'is_active': True
+        })
+        payment_rows.append({'b_id': payment.id})
+        audit_rows.append({
+            'admin_username': admin_username,
+            'action': 'approve_payment',
+            'target_type': 'payment',
+            'target_id': payment.id,
+            'details': f'Approved payment {payment.trx_id} for {payment.user_email}',
+            'ip_address': ip_address
+        })
+        # A user approved twice in one batch only gets the account email once
+        password = passwords.pop(payment.user_email, None)
+        approved.append({
+            'email': payment.user_email,
+            'username': usernames[payment.user_email],
+            'password': password,
+            'planName': payment.plan_name,
+            'expiryDate': expiry_date
+        })
+        results[payment.id] = {
+            'paymentId': payment.id,
+            'success': True,
+            'email': payment.user_email,
+            'username': usernames[payment.user_email],
+            'plan': payment.plan_name,
+            'expiryDate': expiry_date.isoformat()
+        }
+
+    # Ordered before the commit expires the payment objects
+    results = [results[payment.id] for payment in payments]
+    try:
+        if accepted:
+            db.session.execute(insert(UserSubscription.__table__), subscriptions)
+            payments_table = Payment.__table__
+            db.session.execute(
+                update(payments_table)
+                .where(payments_table.c.id == bindparam('b_id'))
+                .values(status='approved', approved_by=admin_id, approved_at=now),
+                payment_rows
+            )
+            db.session.execute(insert(AdminAuditLog.__table__), audit_rows)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return results, approved
+
+
+def _queue_approval_emails(approved):
+    """Queue account creation (new accounts only) and approval emails for background delivery"""
+    for account in approved:
+        if account['password']:
+            queue_email(
+                send_account_creation_email,
+                user_email=account['email'],
+                username=account['username'],
+                password=account['password'],
+                plan_name=account['planName'],
+                expiry_date=account['expiryDate']
+            )
+        queue_email(send_payment_approved_email, account['email'], account['planName'])
+
+
 @subscription_bp.route('/admin/payment/<int:payment_id>/approve', methods=['POST'])
 @require_admin
 def approve_payment(payment_id):
@@ -401,7 +595,7 @@ def approve_payment(payment_id):
     Approve a payment and create teacher account.
     """
     try:
-        payment = Payment.query.get_or_404(payment_id)
+        payment = Payment.query.with_for_update().filter_by(id=payment_id).first_or_404()
         
         if payment.status != 'pending':
             return jsonify({
@@ -409,89 +603,27 @@ def approve_payment(payment_id):
                 'message': f'Payment already {payment.status}'
             }), 400
         
-        # Check if user already exists
-        user = User.get_by_email(payment.user_email)
-        
-        if user:
-            # User exists - check if already a teacher
-            if user.role == 'teacher':
-                return jsonify({
-                    'success': False,
-                    'message': 'User is already a teacher'
-                }), 400
-        else:
-            # Create new teacher account
-            username = generate_username_from_email(payment.user_email)
-            password = generate_secure_password()
-            
-            # Check username uniqueness
-            while User.get_by_username(username):
-                username = generate_username_from_email(payment.user_email)
-            
-            user = User(
-                name=payment.user_email.split('@')[0],  # Use email prefix as name
-                email=payment.user_email,
-                username=username,
-                role='teacher',
-                password=password  # Will be hashed by model
-            )
-            user.set_password(password)
-            db.session.add(user)
-            db.session.flush()  # Get user ID
-        
-        # Calculate expiry date
-        plan = SubscriptionPlan.get_plan_by_name(payment.plan_name)
-        duration_days = plan.duration_days if plan else 30
-        expiry_date = datetime.now(timezone.utc) + timedelta(days=duration_days)
-        
-        # Create user subscription
-        subscription = UserSubscription(
-            user_id=user.id,
-            plan_name=payment.plan_name,
-            quiz_limit=plan.quiz_limit if plan else 10,
-            expiry_date=expiry_date,
-            payment_id=payment.id,
-            is_active=True
-        )
-        db.session.add(subscription)
-        
-        # Approve payment
-        payment.approve(session.get('admin_id') or 1)
-        
-        # Log admin action
-        AdminAuditLog.log_action(
-            admin_username=session.get('admin_username') or 'admin',
-            action='approve_payment',
-            target_type='payment',
-            target_id=payment.id,
-            details=f'Approved payment {payment.trx_id} for {payment.user_email}',
-            ip_address=get_client_ip()
-        )
-        
-        db.session.commit()
-        
-        # Send account creation email
-        send_account_creation_email(
-            user_email=user.email,
-            username=user.username,
-            password=password,
-            plan_name=payment.plan_name,
-            expiry_date=expiry_date
-        )
+        trx_id = payment.trx_id
+        results, approved = _approve_payments([payment])
+        if not approved:
+            return jsonify({
+                'success': False,
+                'message': results[0]['message']
+            }), 400
         
-        # Send approval notification
-        send_payment_approved_email(user.email, payment.plan_name)
+        _queue_approval_emails(approved)
         
-        current_app.logger.info(f"Payment approved: {payment.trx_id} -> {user.email}")
+        account = approved[0]
+        current_app.logger.info(f"Payment approved: {trx_id} -> {account['email']}")
         
         return jsonify({
             'success': True,
             'message': 'Payment approved and teacher account created',
             'user': {
-                'email': user.email,
-                'username': user.username,
-                'plan': payment.plan_name,
-                'expiryDate': expiry_date.isoformat()
+                'email': account['email'],
+                'username': account['username'],
+                'plan': account['planName'],
+                'expiryDate': account['expiryDate'].isoformat()
             }
         })
     
@@ -504,6 +636,72 @@ def approve_payment(payment_id):
         }), 500
 
 
+@subscription_bp.route('/admin/payments/approve', methods=['POST'])
+@require_admin
+def approve_payments_bulk():
+    """
+    Approve many pending payments at once.
+
+    Body: {"paymentIds": [1, 2, ...]}. All payments are approved in one
+    transaction (see _approve_payments); failures such as a payment that is
+    no longer pending are reported per payment. Emails are queued and sent
+    in the background after the commit.
+    """
+    data = request.get_json(silent=True) or {}
+    payment_ids = data.get('paymentIds')
+    if not isinstance(payment_ids, list) or not payment_ids:
+        return jsonify({
+            'success': False,
+            'message': 'paymentIds must be a non-empty list'
+        }), 400
+    if len(payment_ids) > BULK_APPROVE_MAX:
+        return jsonify({
+            'success': False,
+            'message': f'At most {BULK_APPROVE_MAX} payments can be approved at once'
+        }), 400
+    
+    try:
+        payment_ids = list(dict.fromkeys(int(payment_id) for payment_id in payment_ids))
+    except (TypeError, ValueError):
+        return jsonify({
+            'success': False,
+            'message': 'paymentIds must be numbers'
+        }), 400
+    
+    try:
+        # Lock the rows so two admins cannot approve the same payment twice
+        payments = Payment.query.with_for_update().filter(Payment.id.in_(payment_ids)).all()
+        statuses = {p.id: p.status for p in payments}
+        results, approved = _approve_payments([p for p in payments if p.status == 'pending'])
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Bulk payment approval error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f'Failed to approve payments: {str(e)}'
+        }), 500
+    
+    _queue_approval_emails(approved)
+    
+    results = {result['paymentId']: result for result in results}
+    for payment_id in payment_ids:
+        if payment_id not in statuses:
+            results[payment_id] = {'paymentId': payment_id, 'success': False, 'message': 'Payment not found'}
+        elif payment_id not in results:
+            results[payment_id] = {'paymentId': payment_id, 'success': False,
+                                   'message': f'Payment already {statuses[payment_id]}'}
+    results = [results[payment_id] for payment_id in payment_ids]
+    
+    current_app.logger.info(f"Bulk approval: {len(approved)} of {len(results)} payments approved")
+    
+    return jsonify({
+        'success': True,
+        'approved': len(approved),
+        'failed': len(results) - len(approved),
+        'results': results
+    })
+
+
 @subscription_bp.route('/admin/payment/<int:payment_id>/reject', methods=['POST'])
 @require_admin
 def reject_payment(payment_id):
@@ -523,11 +721,11 @@ def reject_payment(payment_id):
             }), 400
         
         # Reject payment
-        payment.reject(session.get('admin_id') or 1, reason)
+        payment.reject(current_auth().id or 1, reason)
         
         # Log admin action
         AdminAuditLog.log_action(
-            admin_username=session.get('admin_username') or 'admin',
+            admin_username=current_auth().name or 'admin',
             action='reject_payment',
             target_type='payment',
             target_id=payment.id,
@@ -594,12 +792,14 @@ def get_payment_screenshot(payment_id):
 # ============================================================================
 
 @subscription_bp.route('/subscription/status', methods=['GET'])
+@require_auth(legacy=_session_claims, optional=True)
 def get_subscription_status():
     """
     Get current user's subscription status.
     """
     try:
-        email = session.get('user_email') or request.args.get('email')
+        auth = current_auth()
+        email = (auth.email if auth else None) or request.args.get('email')
         
         if not email:
             return jsonify({
@@ -636,12 +836,14 @@ def get_subscription_status():
 
 
 @subscription_bp.route('/subscription/can-create-quiz', methods=['GET'])
+@require_auth(legacy=_session_claims, optional=True)
 def can_create_quiz():
     """
     Check if user can create a new quiz.
     """
     try:
-        email = session.get('user_email') or request.args.get('email')
+        auth = current_auth()
+        email = (auth.email if auth else None) or request.args.get('email')
         
         if not email:
             return jsonify({
@@ -667,7 +869,7 @@ def can_create_quiz():
                 reason = 'Only teachers can create quizzes'
             elif not subscription:
                 reason = 'No active subscription'
-            elif subscription.expiry_date < datetime.now(timezone.utc):
+            elif subscription.is_expired():
                 reason = 'Subscription expired'
             elif subscription.quizzes_used >= subscription.quiz_limit:
                 reason = 'Quiz limit reached'
@@ -694,28 +896,31 @@ def increment_quiz_usage():
     Increment quiz usage counter when a new quiz is created.
     """
     try:
-        user_id = session.get('user_id')
-        
-        subscription = UserSubscription.get_active_subscription(user_id)
+        user_id = current_auth().id
         
-        if not subscription:
+        # Check and increment in one conditional UPDATE (no lost updates)
+        try:
+            usage = quiz_usage.consume(user_id)
+        except UsageLimitError as e:
+            db.session.rollback()
             return jsonify({
                 'success': False,
-                'message': 'No active subscription'
+                'message': e.message
             }), 400
         
-        if not subscription.can_create_quiz():
+        if usage is None:
+            db.session.rollback()
             return jsonify({
                 'success': False,
-                'message': 'Quiz limit reached or subscription expired'
+                'message': 'No active subscription'
             }), 400
         
-        subscription.increment_quiz_usage()
+        db.session.commit()
         
         return jsonify({
             'success': True,
-            'quizzesUsed': subscription.quizzes_used,
-            'quizzesRemaining': subscription.quiz_limit - subscription.quizzes_used
+            'quizzesUsed': usage.quizzes_used,
+            'quizzesRemaining': usage.quiz_limit - usage.quizzes_used
         })
     
     except Exception as e:
@@ -735,14 +940,54 @@ def increment_quiz_usage():
 @require_admin
 def get_all_teachers():
     """
-    Get all teacher accounts.
+    Get teacher accounts, one page at a time.
+
+    Query: plan, status (active, expired, limit_reached, no_subscription),
+    expiresAfter / expiresBefore (ISO 8601), limit (max TEACHERS_PAGE_MAX)
+    and offset. Teachers and their active subscriptions are loaded with one
+    joined query, plus one count.
     """
+    status = request.args.get('status') or None
+    if status and status not in TEACHER_STATUSES:
+        return jsonify({
+            'success': False,
+            'message': f'status must be one of: {", ".join(TEACHER_STATUSES)}'
+        }), 400
+    
+    try:
+        expires_after = _optional_datetime(request.args.get('expiresAfter'))
+        expires_before = _optional_datetime(request.args.get('expiresBefore'))
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'message': 'expiresAfter and expiresBefore must be ISO 8601 dates'
+        }), 400
+    
+    limit = max(1, min(request.args.get('limit', 50, type=int), TEACHERS_PAGE_MAX))
+    offset = max(0, request.args.get('offset', 0, type=int))
+    
     try:
-        teachers = User.get_teachers()
+        total, rows = User.list_teachers(
+            plan=request.args.get('plan') or None,
+            status=status,
+            expires_after=expires_after,
+            expires_before=expires_before,
+            limit=limit,
+            offset=offset
+        )
+        
+        teachers = []
+        for teacher, subscription in rows:
+            data = teacher.to_dict(include_subscription=False)
+            data['subscription'] = UserSubscription.status_payload(subscription)
+            teachers.append(data)
         
         return jsonify({
             'success': True,
-            'teachers': [t.to_dict() for t in teachers]
+            'teachers': teachers,
+            'total': total,
+            'limit': limit,
+            'offset': offset
         })
     
     except Exception as e:
@@ -793,6 +1038,9 @@ def upgrade_teacher_plan(user_id):
             subscription.plan_name = plan_name
             subscription.quiz_limit = plan.quiz_limit
             subscription.expiry_date = subscription.expiry_date + timedelta(days=extend_days)
+            # The sweeper expires it again if the new date has passed already
+            subscription.status = 'active'
+            subscription.reminder_sent_at = None
         else:
             # Create new
             expiry_date = datetime.now(timezone.utc) + timedelta(days=extend_days)
@@ -809,7 +1057,7 @@ def upgrade_teacher_plan(user_id):
         
         # Log admin action
         AdminAuditLog.log_action(
-            admin_username=session.get('admin_username') or 'admin',
+            admin_username=current_auth().name or 'admin',
             action='upgrade_teacher',
             target_type='user',
             target_id=user_id,
@@ -849,7 +1097,7 @@ def deactivate_teacher(user_id):
         
         # Log admin action
         AdminAuditLog.log_action(
-            admin_username=session.get('admin_username') or 'admin',
+            admin_username=current_auth().name or 'admin',
             action='deactivate_teacher',
             target_type='user',
             target_id=user_id,
@@ -879,27 +1127,32 @@ def deactivate_teacher(user_id):
 @require_admin
 def get_audit_log():
     """
-    Get admin audit log.
+    Get admin audit log, newest first.
+
+    Keyset pagination: pass the previous page's `nextCursor` as `cursor`.
+    Query: limit (alias per_page), includeTotal.
     """
     try:
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 50, type=int)
+        limit = page_size(request.args.get('limit', type=int) or request.args.get('per_page', type=int), 50)
         
-        pagination = AdminAuditLog.query.order_by(
-            AdminAuditLog.created_at.desc()
-        ).paginate(page=page, per_page=per_page, error_out=False)
+        result = paginator.page(
+            AdminAuditLog.query, AdminAuditLog,
+            cursor=request.args.get('cursor'),
+            limit=limit,
+            include_total=_flag(request.args.get('includeTotal'))
+        )
         
         return jsonify({
             'success': True,
-            'logs': [log.to_dict() for log in pagination.items],
-            'pagination': {
-                'page': page,
-                'perPage': per_page,
-                'total': pagination.total,
-                'pages': pagination.pages
-            }
+            'logs': [log.to_dict() for log in result.pop('items')],
+            'pagination': {'limit': limit, **result}
         })
     
+    except KeysetError as e:
+        return jsonify({
+            'success': False,
+            'message': e.message
+        }), e.status_code
     except Exception as e:
         current_app.logger.error(f"Error fetching audit log: {str(e)}")
         return jsonify({
@@ -0,0 +1,135 @@
+"""
+QuizFlow Services Package
+=========================
+Stateful application services shared by the API routes.
+"""
+
+from .quiz_sessions import (
+    QuizSessionManager,
+    QuizSessionError,
+    QUIZ_SUBMIT_GRACE_SECONDS
+)
+from .submission_writer import (
+    SubmissionBatchWriter,
+    SubmissionWriteError,
+    SUBMISSION_GROUP_COMMIT
+)
+from .query_monitor import (
+    QueryMonitor,
+    RequestQueryStats
+)
+from .metrics import (
+    REGISTRY,
+    init_metrics,
+    time_mail_send
+)
+from .profiler import SamplingProfiler
+from .ai_generation import (
+    QuestionGenerationService,
+    AIGenerationError,
+    FakeLLMBackend,
+    StreamingQuestionParser
+)
+from .question_import import (
+    QuestionImporter,
+    QuestionImportError
+)
+from .question_batch import (
+    QuestionBatchEditor,
+    QuestionBatchError
+)
+from .quiz_bundle import (
+    QuizBundle,
+    QuizBundleError,
+    BUNDLE_VERSION
+)
+from .question_search import (
+    QuestionSearchIndex,
+    QuestionSearchError
+)
+from .essay_scoring import (
+    EssayGradingService,
+    EssayGradingError,
+    EssayScorer,
+    is_essay
+)
+from .quiz_cache import (
+    QuizCache,
+    QuizLookupError
+)
+from .access_codes import (
+    AccessCodeResolver,
+    AccessCodeError
+)
+from .plan_catalog import (
+    PlanCatalog,
+    SUBSCRIPTION_TIERS
+)
+from .usage_meter import (
+    UsageMeter,
+    UsageLimitError
+)
+from .subscription_sweeper import (
+    SubscriptionSweeper,
+    next_period
+)
+from .keyset import (
+    KeysetPaginator,
+    KeysetError,
+    KEYSET_PAGE_MAX
+)
+from .question_sampling import (
+    build_paper,
+    paper_for,
+    paper_seed,
+    PaperSeedError
+)
+
+__all__ = [
+    'QuizSessionManager',
+    'QuizSessionError',
+    'QUIZ_SUBMIT_GRACE_SECONDS',
+    'SubmissionBatchWriter',
+    'SubmissionWriteError',
+    'SUBMISSION_GROUP_COMMIT',
+    'QueryMonitor',
+    'RequestQueryStats',
+    'REGISTRY',
+    'init_metrics',
+    'time_mail_send',
+    'SamplingProfiler',
+    'QuestionGenerationService',
+    'AIGenerationError',
+    'FakeLLMBackend',
+    'StreamingQuestionParser',
+    'QuestionImporter',
+    'QuestionImportError',
+    'QuestionBatchEditor',
+    'QuestionBatchError',
+    'QuizBundle',
+    'QuizBundleError',
+    'BUNDLE_VERSION',
+    'QuestionSearchIndex',
+    'QuestionSearchError',
+    'EssayGradingService',
+    'EssayGradingError',
+    'EssayScorer',
+    'is_essay',
+    'QuizCache',
+    'QuizLookupError',
+    'AccessCodeResolver',
+    'AccessCodeError',
+    'PlanCatalog',
+    'SUBSCRIPTION_TIERS',
+    'UsageMeter',
+    'UsageLimitError',
+    'SubscriptionSweeper',
+    'next_period',
+    'KeysetPaginator',
+    'KeysetError',
+    'KEYSET_PAGE_MAX',
+    'build_paper',
+    'paper_for',
+    'paper_seed',
+    'PaperSeedError'
+]
@@ -0,0 +1,259 @@
+"""
+QuizFlow Access Codes
+=====================
+In-memory resolver for student access codes.
+
+Every valid code lives in one dict: the global VALID_LOGIN_CODES (parsed
+once) and each quiz's access code with its validity window and usage cap.
+The dict is loaded with a single query at startup and rebuilt when an admin
+changes a quiz, so resolving a code during a login storm touches no
+database at all.
+
+A "use" is the first accepted login of a student (by email) with a code.
+Uses are counted in memory and written behind in batches
+(code_uses = code_uses + n) by a background thread, which also reloads the
+map every ACCESS_CODE_REFRESH_SECONDS to pick up changes made by other
+worker processes. With several workers a capped code can therefore admit a
+few more students than its cap (up to one flush interval's worth per
+worker); caps are meant for classroom-sized limits, not billing.
+
+Which students were counted is only kept in memory, so after a restart a
+capped code asks the `attempted` hook (quiz sessions and submissions in the
+app) before counting a student it has not seen yet; returning students are
+not counted twice and do not lock out new ones.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import bindparam, select
+
+
+# Codes accepted for the single-active-quiz setup (no quiz, no limits)
+VALID_LOGIN_CODES = tuple(
+    code.strip() for code in os.getenv('VALID_LOGIN_CODES', '12345,67890,11111,22222,33333').split(',')
+    if code.strip()
+)
+
+# Seconds between write-behind flushes of code usage counts
+ACCESS_CODE_FLUSH_INTERVAL = float(os.getenv('ACCESS_CODE_FLUSH_INTERVAL', 5))
+
+# Seconds between full reloads of the code map (changes made by other workers)
+ACCESS_CODE_REFRESH_SECONDS = float(os.getenv('ACCESS_CODE_REFRESH_SECONDS', 60))
+
+
+class AccessCodeError(Exception):
+    """Raised when a code cannot be used to log in."""
+
+    def __init__(self, message, status_code=401):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+class AccessCode:
+    """One resolvable code"""
+
+    __slots__ = ('code', 'quiz_id', 'valid_from', 'expires_at', 'max_uses', 'uses', 'students')
+
+    def __init__(self, code, quiz_id=None, valid_from=None, expires_at=None, max_uses=None, uses=0):
+        self.code = code
+        self.quiz_id = quiz_id
+        self.valid_from = valid_from
+        self.expires_at = expires_at
+        self.max_uses = max_uses
+        self.uses = uses
+        self.students = set()      # emails already counted (or found attempted) by this process
+
+    def check(self, now):
+        """Raise AccessCodeError if the code is outside its window"""
+        if self.valid_from and now < self.valid_from:
+            raise AccessCodeError("This access code is not active yet.", 403)
+        if self.expires_at and now >= self.expires_at:
+            raise AccessCodeError("This access code has expired.", 403)
+
+    def to_dict(self):
+        return {
+            "code": self.code,
+            "quizId": self.quiz_id,
+            "validFrom": self.valid_from.isoformat() if self.valid_from else None,
+            "expiresAt": self.expires_at.isoformat() if self.expires_at else None,
+            "maxUses": self.max_uses,
+            "uses": self.uses
+        }
+
+
+class AccessCodeResolver:
+    """
+    Args:
+        app: Flask application (used for app contexts in the background thread)
+        db: Flask-SQLAlchemy instance
+        quiz_model: The Quiz model class (quiz_access_code, code_valid_from,
+            code_expires_at, code_max_uses and code_uses columns)
+        global_codes: Codes valid for every login without a specific quiz
+        attempted: Optional callable(quiz_id, student_email) -> bool telling
+            whether the student already started or submitted the quiz; asked
+            (one query) for capped codes before counting an unseen student
+    """
+
+    def __init__(self, app, db, quiz_model, global_codes=VALID_LOGIN_CODES, attempted=None,
+                 flush_interval=ACCESS_CODE_FLUSH_INTERVAL, refresh_seconds=ACCESS_CODE_REFRESH_SECONDS):
+        self.app = app
+        self.db = db
+        self.attempted = attempted
+        self.table = quiz_model.__table__
+        self.global_codes = tuple(global_codes)
+        self.flush_interval = flush_interval
+        self.refresh_seconds = refresh_seconds
+
+        self._codes = {}           # code -> AccessCode
+        self._pending = {}         # quiz id -> uses not yet written
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self._worker = None
+
+        t = self.table
+        self._flush_stmt = (
+            t.update()
+            .where(t.c.id == bindparam('b_id'))
+            .values(code_uses=t.c.code_uses + bindparam('b_uses'))
+        )
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+
+    def load(self):
+        """Rebuild the code map with one query (call inside an app context)"""
+        t = self.table
+        rows = self.db.session.execute(
+            select(t.c.id, t.c.quiz_access_code, t.c.code_valid_from, t.c.code_expires_at,
+                   t.c.code_max_uses, t.c.code_uses)
+            .where(t.c.quiz_access_code.isnot(None))
+        ).all()
+        # Release the read transaction; the map is independent of the request's session
+        self.db.session.commit()
+
+        codes = {code: AccessCode(code) for code in self.global_codes}
+        with self._lock:
+            for row in rows:
+                previous = self._codes.get(row.quiz_access_code)
+                entry = AccessCode(row.quiz_access_code, row.id, row.code_valid_from, row.code_expires_at,
+                                   row.code_max_uses, (row.code_uses or 0) + self._pending.get(row.id, 0))
+                if previous is not None and previous.quiz_id == row.id:
+                    entry.students = previous.students
+                codes[row.quiz_access_code] = entry
+            self._codes = codes
+            self._loaded_at = time.monotonic()
+        self._ensure_worker()
+        return len(codes)
+
+    def _ensure_loaded(self):
+        if self._loaded_at is None:
+            self.load()
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+
+    def quiz_id_for(self, code):
+        """Quiz id of a quiz access code (None for global or unknown codes); no validity checks"""
+        self._ensure_loaded()
+        entry = self._codes.get(code)
+        return entry.quiz_id if entry else None
+
+    def resolve(self, code, now=None):
+        """
+        The AccessCode for a login attempt.
+
+        Raises AccessCodeError: 401 unknown code, 403 outside its validity
+        window. Usage caps are enforced by consume(), so students already
+        admitted can log in again after the cap is reached.
+        """
+        self._ensure_loaded()
+        entry = self._codes.get((code or '').strip())
+        if entry is None:
+            raise AccessCodeError("Invalid access code. Please check your code and try again.", 401)
+        entry.check(now or datetime.utcnow())
+        return entry
+
+    def consume(self, code, student_key):
+        """
+        Count a student's first login with a code; repeats are free.
+
+        Raises AccessCodeError (403) if the code's cap is reached.
+        """
+        entry = self.resolve(code)
+        if entry.quiz_id is None:
+            return entry
+        student_email = (student_key or '').strip()
+        student_key = student_email.lower()
+        if (entry.max_uses is not None and student_key not in entry.students
+                and self.attempted is not None and self.attempted(entry.quiz_id, student_email)):
+            # Counted before this process started (or by another worker)
+            with self._lock:
+                entry.students.add(student_key)
+            return entry
+        with self._lock:
+            if student_key in entry.students:
+                return entry
+            if entry.max_uses is not None and entry.uses >= entry.max_uses:
+                raise AccessCodeError("This access code has reached its maximum number of students.", 403)
+            entry.students.add(student_key)
+            entry.uses += 1
+            self._pending[entry.quiz_id] = self._pending.get(entry.quiz_id, 0) + 1
+        # The worker does not survive a fork (gunicorn --preload); restart it on first use
+        self._ensure_worker()
+        return entry
+
+    def codes(self):
+        """Snapshot of every quiz code (for admin listings)"""
+        self._ensure_loaded()
+        return [entry.to_dict() for entry in self._codes.values() if entry.quiz_id is not None]
+
+    # ------------------------------------------------------------------
+    # Write-behind usage counts
+    # ------------------------------------------------------------------
+
+    def flush(self):
+        """Write buffered usage counts with one executemany UPDATE"""
+        with self._lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+
+        rows = [{'b_id': quiz_id, 'b_uses': uses} for quiz_id, uses in batch.items()]
+        with self.app.app_context():
+            try:
+                self.db.session.execute(self._flush_stmt, rows)
+                self.db.session.commit()
+            except Exception as e:
+                self.db.session.rollback()
+                with self._lock:
+                    for quiz_id, uses in batch.items():
+                        self._pending[quiz_id] = self._pending.get(quiz_id, 0) + uses
+                self.app.logger.error(f"Access code usage flush failed: {str(e)}")
+                return 0
+        return len(rows)
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(target=self._worker_loop, name='access-code-worker', daemon=True)
+            self._worker.start()
+
+    def _worker_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at >= self.refresh_seconds:
+                try:
+                    with self.app.app_context():
+                        self.load()
+                except Exception as e:
+                    self.app.logger.error(f"Access code reload failed: {str(e)}")
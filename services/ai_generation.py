@@ -0,0 +1,750 @@
+"""
+QuizFlow AI Question Generation
+===============================
+Background jobs for LLM question generation with result caching.
+
+An OpenAI chat completion for a batch of questions routinely takes 10-30
+seconds, which ties up a web worker and exceeds serverless function limits.
+Generation therefore runs as a job on a small worker pool:
+
+    POST /api/admin/ai/generate-questions        -> 202 {"jobId": ...}
+    GET  /api/admin/ai/jobs/<job_id>             -> poll status / result
+    GET  /api/admin/ai/jobs/<job_id>/events      -> Server-Sent Events
+
+Large requests are split into chunks of AI_GENERATION_CHUNK_SIZE questions
+that run concurrently (at most AI_GENERATION_CHUNK_CONCURRENCY per job). Each
+chunk's response is streamed through a tolerant incremental JSON parser, so
+questions reach pollers and SSE listeners as soon as each object is complete,
+and a truncated response still yields every question before the cut-off.
+Questions that duplicate each other or the target quiz's existing questions
+are dropped.
+
+Results are cached by (topic, difficulty, type, count, context), so a repeat
+request completes immediately, and identical requests that arrive while a job
+is running share that job instead of calling the model twice.
+
+Set AI_GENERATION_BACKEND=fake to use a deterministic offline backend that
+needs neither the openai package nor an API key.
+"""
+
+import json
+import math
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+# 'openai' (default) or 'fake' for offline development and tests
+AI_GENERATION_BACKEND = os.getenv('AI_GENERATION_BACKEND', 'openai').lower()
+
+AI_MODEL = os.getenv('AI_MODEL', 'gpt-3.5-turbo')
+
+# Concurrent generation calls
+AI_GENERATION_WORKERS = int(os.getenv('AI_GENERATION_WORKERS', 4))
+
+# Per-call timeout passed to the model client, in seconds
+AI_GENERATION_TIMEOUT = float(os.getenv('AI_GENERATION_TIMEOUT', 60))
+
+# Cached results: lifetime in seconds and number of entries kept
+AI_CACHE_TTL = int(os.getenv('AI_CACHE_TTL', 86400))
+AI_CACHE_SIZE = int(os.getenv('AI_CACHE_SIZE', 256))
+
+# Finished jobs stay pollable for this long, in seconds
+AI_JOB_TTL = int(os.getenv('AI_JOB_TTL', 3600))
+
+# Simulated latency of the fake backend, in milliseconds
+AI_FAKE_LATENCY_MS = int(os.getenv('AI_FAKE_LATENCY_MS', 0))
+
+# Questions requested per model call, and concurrent calls per job
+AI_GENERATION_CHUNK_SIZE = int(os.getenv('AI_GENERATION_CHUNK_SIZE', 10))
+AI_GENERATION_CHUNK_CONCURRENCY = int(os.getenv('AI_GENERATION_CHUNK_CONCURRENCY', 3))
+
+MAX_QUESTIONS_PER_REQUEST = 200
+
+# Completion budget per question (plus a fixed overhead) for one chunk
+TOKENS_PER_QUESTION = {'multiple_choice': 220, 'essay': 260}
+
+SYSTEM_PROMPT = "You are an expert educator who creates high-quality quiz questions. Always respond with valid JSON only."
+
+
+class AIGenerationError(Exception):
+    """Raised when a generation request is invalid or the model call fails."""
+
+    def __init__(self, message, status_code=500):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+# ============================================================================
+# PROMPTS AND PARSING
+# ============================================================================
+
+def build_prompt(topic, difficulty, question_type, num_questions, context='', batch=None):
+    """
+    Build the user prompt for one generation request.
+
+    Args:
+        batch: Optional (number, total) when the request is split into chunks
+    """
+    context_line = f'Additional context: {context}' if context else ''
+    if batch and batch[1] > 1:
+        context_line += (f"\nThis is batch {batch[0]} of {batch[1]}; cover different aspects "
+                         f"of the topic than the other batches.")
+
+    if question_type == 'multiple_choice':
+        return f"""Create {num_questions} multiple choice questions about {topic} at {difficulty} level.
+{context_line}
+
+For each question, provide:
+1. Question text
+2. Four options (A, B, C, D)
+3. Correct answer (A, B, C, or D)
+4. Brief explanation
+
+Format as JSON array with objects containing: questionText, optionA, optionB, optionC, optionD, correctAnswer (0-3), explanation"""
+
+    if question_type == 'essay':
+        return f"""Create {num_questions} essay questions about {topic} at {difficulty} level.
+{context_line}
+
+For each question, provide:
+1. Question text
+2. Sample answer/key points
+3. Instructions for students
+4. Suggested word count
+
+Format as JSON array with objects containing: questionText, sampleAnswer, instructions, maxWords"""
+
+    # mixed
+    mc_count = num_questions // 2
+    essay_count = num_questions - mc_count
+    return f"""Create {mc_count} multiple choice and {essay_count} essay questions about {topic} at {difficulty} level.
+{context_line}
+
+For multiple choice questions, provide: questionText, optionA, optionB, optionC, optionD, correctAnswer (0-3), explanation, type: "multiple_choice"
+For essay questions, provide: questionText, sampleAnswer, instructions, maxWords, type: "essay"
+
+Format as JSON array."""
+
+
+def parse_generated_questions(content):
+    """Parse the model's JSON answer, tolerating a ```json fence"""
+    content = content.strip()
+    if content.startswith('```json'):
+        content = content[7:]
+    elif content.startswith('```'):
+        content = content[3:]
+    if content.endswith('```'):
+        content = content[:-3]
+    try:
+        questions = json.loads(content)
+    except json.JSONDecodeError as e:
+        raise AIGenerationError(f"Failed to parse AI response: {str(e)}")
+    if not isinstance(questions, list):
+        raise AIGenerationError("Failed to parse AI response: expected a JSON array")
+    return questions
+
+
+_TRAILING_COMMA = re.compile(r',\s*([}\]])')
+
+
+class StreamingQuestionParser:
+    """
+    Incremental, tolerant parser for a JSON array of objects.
+
+    Feed text as it arrives; every top-level object is returned as soon as
+    its closing brace is seen. Prose or code fences around the array, a
+    trailing comma inside an object and a truncated final object are all
+    tolerated: anything that cannot be parsed is counted in `rejected`.
+    """
+
+    def __init__(self):
+        self._text = ''
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._start = None
+        self._base = 0
+        self.rejected = 0
+
+    def feed(self, chunk):
+        """Consume more text and return the objects it completed"""
+        self._text += chunk
+        objects = []
+        text = self._text
+        for pos in range(self._pos, len(text)):
+            char = text[pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+            if char == '"' and self._depth > 0:
+                self._in_string = True
+            elif char in '[{':
+                if char == '{' and self._start is None and self._depth <= 1:
+                    self._start = pos
+                    self._base = self._depth
+                self._depth += 1
+            elif char in ']}':
+                self._depth = max(0, self._depth - 1)
+                if char == '}' and self._start is not None and self._depth == self._base:
+                    parsed = self._load(text[self._start:pos + 1])
+                    if parsed is not None:
+                        objects.append(parsed)
+                    self._start = None
+
+        # Keep only the unfinished object (if any) buffered
+        if self._start is None:
+            self._text, self._pos = '', 0
+        else:
+            self._text = text[self._start:]
+            self._pos = len(self._text)
+            self._start = 0
+        return objects
+
+    def _load(self, raw):
+        for candidate in (raw, _TRAILING_COMMA.sub(r'\1', raw)):
+            try:
+                value = json.loads(candidate)
+                if isinstance(value, dict):
+                    return value
+            except json.JSONDecodeError:
+                continue
+        self.rejected += 1
+        return None
+
+
+def question_fingerprint(text):
+    """Normalized question text used to detect duplicates"""
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', (text or '').lower()).split())
+
+
+def clean_question(question, question_type):
+    """Validate one generated question, or return None if it is unusable"""
+    if not isinstance(question, dict):
+        return None
+    text = question.get('questionText')
+    if not isinstance(text, str) or not text.strip():
+        return None
+    if question_type == 'multiple_choice':
+        if not all(isinstance(question.get(f'option{letter}'), str) for letter in 'ABCD'):
+            return None
+        answer = question.get('correctAnswer')
+        if isinstance(answer, str):
+            answer = answer.strip().upper()
+            answer = 'ABCD'.index(answer) if answer in ('A', 'B', 'C', 'D') else \
+                int(answer) if answer.isdigit() else None
+        if not isinstance(answer, int) or not 0 <= answer <= 3:
+            return None
+        question['correctAnswer'] = answer
+    return question
+
+
+# ============================================================================
+# BACKENDS
+# ============================================================================
+
+class OpenAIBackend:
+    """Chat-completions backend using the openai package"""
+
+    def __init__(self, model=AI_MODEL, timeout=AI_GENERATION_TIMEOUT):
+        try:
+            from openai import OpenAI
+        except ImportError:
+            raise AIGenerationError("OpenAI library not installed. Run: pip install openai")
+
+        api_key = os.getenv('OPENAI_API_KEY')
+        if not api_key or api_key == 'your_openai_api_key_here':
+            raise AIGenerationError("OpenAI API key not configured")
+
+        self.model = model
+        self.client = OpenAI(
+            api_key=api_key,
+            organization=os.getenv('OPENAI_ORGANIZATION'),
+            timeout=timeout
+        )
+
+    def complete(self, prompt, max_tokens=2000, temperature=0.7):
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=max_tokens,
+            temperature=temperature
+        )
+        return response.choices[0].message.content
+
+    def stream(self, prompt, max_tokens=2000, temperature=0.7):
+        """Yield the completion text as it is generated"""
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True
+        )
+        for event in response:
+            if event.choices and event.choices[0].delta.content:
+                yield event.choices[0].delta.content
+
+
+class FakeLLMBackend:
+    """
+    Deterministic offline backend.
+
+    Reads the question counts and topic back out of the prompt and returns
+    well-formed JSON in the same shape the real model is asked for.
+    """
+
+    def __init__(self, latency_ms=AI_FAKE_LATENCY_MS):
+        self.latency = latency_ms / 1000.0
+        self.calls = 0
+
+    def complete(self, prompt, max_tokens=2000, temperature=0.7):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        first_line = prompt.split('\n', 1)[0]
+        words = first_line.split()
+        topic = first_line.split(' about ', 1)[1].rsplit(' at ', 1)[0] if ' about ' in first_line else 'the topic'
+        if 'multiple choice and' in first_line:
+            mc_count, essay_count = int(words[1]), int(words[5])
+        elif 'essay questions' in first_line:
+            mc_count, essay_count = 0, int(words[1])
+        else:
+            mc_count, essay_count = int(words[1]), 0
+        mixed = mc_count and essay_count
+        batch = re.search(r'This is batch (\d+) of', prompt)
+        prefix = f"{batch.group(1)}." if batch else ''
+
+        questions = []
+        for i in range(mc_count):
+            question = {
+                "questionText": f"Sample question {prefix}{i + 1} about {topic}?",
+                "optionA": f"{topic} option A",
+                "optionB": f"{topic} option B",
+                "optionC": f"{topic} option C",
+                "optionD": f"{topic} option D",
+                "correctAnswer": i % 4,
+                "explanation": f"Option {'ABCD'[i % 4]} best describes {topic}."
+            }
+            if mixed:
+                question["type"] = "multiple_choice"
+            questions.append(question)
+        for i in range(essay_count):
+            question = {
+                "questionText": f"Discuss aspect {prefix}{i + 1} of {topic}.",
+                "sampleAnswer": f"A good answer explains aspect {i + 1} of {topic} with examples.",
+                "instructions": "Answer in full sentences.",
+                "maxWords": 250
+            }
+            if mixed:
+                question["type"] = "essay"
+            questions.append(question)
+        return json.dumps(questions)
+
+    def stream(self, prompt, max_tokens=2000, temperature=0.7):
+        text = self.complete(prompt, max_tokens, temperature)
+        for i in range(0, len(text), 64):
+            yield text[i:i + 64]
+
+
+def default_backend():
+    """Backend selected by AI_GENERATION_BACKEND"""
+    if AI_GENERATION_BACKEND == 'fake':
+        return FakeLLMBackend()
+    return OpenAIBackend()
+
+
+# ============================================================================
+# JOBS AND CACHE
+# ============================================================================
+
+def plan_chunks(question_type, num_questions, chunk_size):
+    """Split a request into [(question_type, count), ...] model calls"""
+    if question_type == 'mixed':
+        mc_count = num_questions // 2
+        parts = [('multiple_choice', mc_count), ('essay', num_questions - mc_count)]
+    else:
+        parts = [(question_type, num_questions)]
+
+    chunks = []
+    for part_type, count in parts:
+        while count > 0:
+            size = min(chunk_size, count)
+            chunks.append((part_type, size))
+            count -= size
+    return chunks
+
+
+class GenerationJob:
+    """One generation request, its chunks and the questions delivered so far"""
+
+    def __init__(self, key, params, existing=()):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.params = params
+        self.status = 'queued'
+        self.questions = []          # delivered (deduplicated against the quiz)
+        self.generated = []          # deduplicated within the job; cached
+        self.errors = []
+        self.error = None
+        self.cached = False
+        self.duplicates = 0
+        self.chunks_total = 0
+        self.chunks_done = 0
+        self.chunks_failed = 0
+        self.version = 0
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.deadline = None
+        self.changed = threading.Condition()
+
+        self._seen = {question_fingerprint(text) for text in existing}
+        self._existing = set(self._seen)
+        self._queue = deque()
+        self._running = 0
+
+    @property
+    def done(self):
+        return self.status in ('completed', 'failed')
+
+    def update(self, **fields):
+        with self.changed:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self.version += 1
+            self.changed.notify_all()
+
+    def add_questions(self, questions):
+        """Deliver new questions, dropping duplicates; returns how many were kept"""
+        kept = 0
+        with self.changed:
+            if self.done:
+                return 0
+            for question in questions:
+                fingerprint = question_fingerprint(question.get('questionText'))
+                if fingerprint in self._seen:
+                    self.duplicates += 1
+                    continue
+                self._seen.add(fingerprint)
+                self.generated.append(question)
+                self.questions.append(question)
+                kept += 1
+            if kept:
+                self.version += 1
+                self.changed.notify_all()
+        return kept
+
+    def use_cached(self, questions):
+        """Complete immediately from a cached result"""
+        delivered = [q for q in questions
+                     if question_fingerprint(q.get('questionText')) not in self._existing]
+        now = time.time()
+        self.update(status='completed', generated=list(questions), questions=delivered,
+                    duplicates=len(questions) - len(delivered), cached=True,
+                    started_at=now, finished_at=now)
+
+    def wait(self, version, timeout):
+        """Block until the job changes after `version` or `timeout` seconds pass"""
+        with self.changed:
+            if self.version == version and not self.done:
+                self.changed.wait(timeout)
+
+    def to_dict(self, since=0):
+        payload = {
+            "jobId": self.id,
+            "status": self.status,
+            "cached": self.cached,
+            "createdAt": self.created_at,
+            "startedAt": self.started_at,
+            "finishedAt": self.finished_at,
+            "requested": self.params['num_questions'],
+            "total": len(self.questions),
+            "since": since,
+            "questions": self.questions[since:],
+            "duplicatesSkipped": self.duplicates,
+            "progress": {
+                "chunks": self.chunks_total,
+                "completed": self.chunks_done,
+                "failed": self.chunks_failed
+            }
+        }
+        if self.errors:
+            payload["errors"] = self.errors
+        if self.status == 'completed':
+            payload["partial"] = len(self.questions) < self.params['num_questions']
+            payload["message"] = f"Generated {len(self.questions)} questions successfully" \
+                if not payload["partial"] else \
+                f"Generated {len(self.questions)} of {self.params['num_questions']} questions"
+        elif self.status == 'failed':
+            payload["message"] = self.error
+        return payload
+
+
+class _ResultCache:
+    """Small LRU cache with per-entry expiry"""
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if time.time() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+
+class QuestionGenerationService:
+    """
+    Run chunked question generation on a worker pool and cache the results.
+
+    Args:
+        app: Flask application (used for logging)
+        backend: Object with complete(prompt) -> str and optionally
+            stream(prompt) yielding text; defaults to the backend selected
+            by AI_GENERATION_BACKEND, created on first use
+    """
+
+    def __init__(self, app=None, backend=None, workers=AI_GENERATION_WORKERS,
+                 timeout=AI_GENERATION_TIMEOUT, cache_size=AI_CACHE_SIZE,
+                 cache_ttl=AI_CACHE_TTL, job_ttl=AI_JOB_TTL,
+                 chunk_size=AI_GENERATION_CHUNK_SIZE,
+                 chunk_concurrency=AI_GENERATION_CHUNK_CONCURRENCY):
+        self.app = app
+        self._backend = backend
+        self.workers = workers
+        self.timeout = timeout
+        self.job_ttl = job_ttl
+        self.chunk_size = max(1, chunk_size)
+        self.chunk_concurrency = max(1, chunk_concurrency)
+        self.cache = _ResultCache(cache_size, cache_ttl)
+
+        self._jobs = {}
+        self._inflight = {}          # (cache key, quiz id) -> running job
+        self._lock = threading.Lock()
+        self._pool = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = default_backend()
+        return self._backend
+
+    @staticmethod
+    def normalize(data):
+        """Validate a request body and return (cache key, params)"""
+        topic = (data.get('topic') or '').strip()
+        if not topic:
+            raise AIGenerationError("Topic is required", 400)
+
+        question_type = data.get('questionType', 'multiple_choice')
+        if question_type not in ('multiple_choice', 'essay', 'mixed'):
+            raise AIGenerationError("questionType must be multiple_choice, essay or mixed", 400)
+
+        try:
+            num_questions = int(data.get('numQuestions', 5))
+        except (TypeError, ValueError):
+            raise AIGenerationError("numQuestions must be a number", 400)
+        if not 1 <= num_questions <= MAX_QUESTIONS_PER_REQUEST:
+            raise AIGenerationError(f"numQuestions must be between 1 and {MAX_QUESTIONS_PER_REQUEST}", 400)
+
+        params = {
+            'topic': topic,
+            'difficulty': (data.get('difficulty') or 'intermediate').strip(),
+            'question_type': question_type,
+            'num_questions': num_questions,
+            'context': (data.get('context') or '').strip(),
+            'quiz_id': data.get('quizId')
+        }
+        key = (topic.lower(), params['difficulty'].lower(), question_type,
+               num_questions, ' '.join(params['context'].lower().split()))
+        return key, params
+
+    def submit(self, data, existing_questions=()):
+        """
+        Start (or reuse) a generation job for a request body.
+
+        Args:
+            data: Request body (topic, difficulty, questionType, numQuestions,
+                context, optional quizId)
+            existing_questions: Question texts already in the target quiz;
+                generated duplicates of these are dropped
+
+        Returns the GenerationJob; it is already completed on a cache hit.
+        """
+        key, params = self.normalize(data)
+        # Fail fast on configuration errors instead of inside the job
+        self.backend
+
+        inflight_key = (key, params['quiz_id'])
+        with self._lock:
+            self._prune()
+            job = self._inflight.get(inflight_key)
+            if job is not None:
+                return job
+
+            job = GenerationJob(key, params, existing_questions)
+            self._jobs[job.id] = job
+            cached = self.cache.get(key)
+            if cached is not None:
+                job.use_cached(cached)
+                return job
+
+            chunks = plan_chunks(params['question_type'], params['num_questions'], self.chunk_size)
+            job.chunks_total = len(chunks)
+            job._queue.extend((index + 1, chunk_type, count, 0) for index, (chunk_type, count) in enumerate(chunks))
+            waves = math.ceil(len(chunks) / self.chunk_concurrency)
+            job.started_at = time.time()
+            job.deadline = job.started_at + waves * 2 * self.timeout + 5 if self.timeout else None
+            job.status = 'running'
+            self._inflight[inflight_key] = job
+            self._dispatch(job)
+            return job
+
+    def get(self, job_id):
+        """Job by id, marking it failed if it has overrun its deadline"""
+        job = self._jobs.get(job_id)
+        if job is not None and job.status == 'running' and job.deadline and time.time() > job.deadline:
+            self._finish(job, error="AI generation timed out")
+        return job
+
+    # ------------------------------------------------------------------
+    # Worker pool
+    # ------------------------------------------------------------------
+
+    def _ensure_pool(self):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='ai-generation')
+        return self._pool
+
+    def _dispatch(self, job):
+        """Start queued chunks up to the per-job concurrency (caller holds the lock)"""
+        pool = self._ensure_pool()
+        while job._queue and job._running < self.chunk_concurrency and not job.done:
+            chunk = job._queue.popleft()
+            job._running += 1
+            pool.submit(self._run_chunk, job, chunk)
+
+    def _run_chunk(self, job, chunk):
+        batch, chunk_type, count, attempt = chunk
+        params = job.params
+        retry = None
+        error = None
+        try:
+            prompt = build_prompt(params['topic'], params['difficulty'], chunk_type, count,
+                                  params['context'], batch=(batch, job.chunks_total))
+            kept = self._generate(job, prompt, chunk_type, count, params['question_type'] == 'mixed')
+            if kept < count and attempt == 0 and not job.done:
+                # Truncated or duplicate-heavy answer: ask once for the shortfall
+                retry = (batch, chunk_type, count - kept, 1)
+        except Exception as e:
+            error = e.message if isinstance(e, AIGenerationError) else f"AI generation failed: {str(e)}"
+            if attempt == 0:
+                retry = (batch, chunk_type, count, 1)
+            elif self.app is not None:
+                self.app.logger.warning(f"AI generation job {job.id} chunk {batch} failed: {error}")
+
+        with self._lock:
+            job._running -= 1
+            if retry is not None:
+                job._queue.append(retry)
+            elif error is not None:
+                job.errors.append({"chunk": batch, "message": error})
+                job.chunks_failed += 1
+            else:
+                job.chunks_done += 1
+            self._dispatch(job)
+            finished = not job._queue and job._running == 0
+        job.update()
+        if finished:
+            self._complete(job)
+
+    def _generate(self, job, prompt, chunk_type, count, mixed):
+        """Stream one model call into the job; returns questions kept"""
+        max_tokens = min(4000, TOKENS_PER_QUESTION[chunk_type] * count + 200)
+        stream = getattr(self.backend, 'stream', None)
+        pieces = stream(prompt, max_tokens=max_tokens) if stream else \
+            [self.backend.complete(prompt, max_tokens=max_tokens)]
+
+        parser = StreamingQuestionParser()
+        kept = 0
+        for piece in pieces:
+            questions = []
+            for question in parser.feed(piece):
+                question = clean_question(question, chunk_type)
+                if question is None:
+                    continue
+                if mixed:
+                    question.setdefault('type', chunk_type)
+                questions.append(question)
+            kept += job.add_questions(questions[:count - kept])
+            if kept >= count or job.done:
+                break
+        return kept
+
+    def _complete(self, job):
+        if not job.questions:
+            message = job.errors[0]["message"] if job.errors else "AI generation returned no usable questions"
+            self._finish(job, error=message)
+            return
+        if not job.errors and len(job.generated) >= job.params['num_questions']:
+            self.cache.set(job.key, list(job.generated))
+        self._finish(job)
+
+    def _finish(self, job, error=None):
+        with self._lock:
+            if job.done:
+                return
+            key = (job.key, job.params['quiz_id'])
+            if self._inflight.get(key) is job:
+                del self._inflight[key]
+        if error is None:
+            job.update(status='completed', finished_at=time.time())
+        else:
+            job.update(status='failed', error=error, finished_at=time.time())
+
+    def _prune(self):
+        """Forget finished jobs older than the job TTL (caller holds the lock)"""
+        cutoff = time.time() - self.job_ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.done and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
@@ -0,0 +1,540 @@
+"""
+QuizFlow Essay Scoring
+======================
+Provisional scores for essay answers, computed locally.
+
+Essay answers are stored as "pending" in the submission's detailed_results
+when a quiz is submitted. A grading job then scores every pending answer of
+a quiz against the question's sample answer and writes provisional points
+(0-1 per essay) that a teacher can override.
+
+Scoring is lexical and runs in-process, with no external service. For each
+essay question the job builds one corpus from the sample answer and every
+student answer to it, and combines three similarities to the sample:
+
+    word TF-IDF cosine    light-stemmed words, stopwords removed
+    char TF-IDF cosine    character 4-grams (spelling and inflection tolerant)
+    BM25 coverage         BM25 of the sample's terms against the answer,
+                          relative to the sample scored against itself
+
+Vectors are sparse dicts sharing the question's vocabulary, so one question's
+batch costs one pass to count terms plus one sparse dot product per answer.
+The combined similarity is mapped linearly onto points between
+ESSAY_ZERO_CREDIT_SIMILARITY and ESSAY_FULL_CREDIT_SIMILARITY.
+
+Writes are conditional on the submission's essay_revision, so a teacher's
+override made while a job is running is never overwritten; that submission
+is simply picked up again by the next run.
+"""
+
+import math
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import bindparam, select
+
+
+# Submissions read and written per batch
+ESSAY_GRADING_BATCH = int(os.getenv('ESSAY_GRADING_BATCH', '200'))
+
+# Similarity at or above which an essay gets full points / at or below which it gets none
+ESSAY_FULL_CREDIT_SIMILARITY = float(os.getenv('ESSAY_FULL_CREDIT_SIMILARITY', '0.6'))
+ESSAY_ZERO_CREDIT_SIMILARITY = float(os.getenv('ESSAY_ZERO_CREDIT_SIMILARITY', '0.1'))
+
+# Seconds finished grading jobs stay queryable
+ESSAY_JOB_TTL = int(os.getenv('ESSAY_JOB_TTL', '3600'))
+
+# Weights of the combined similarity
+WORD_WEIGHT, CHAR_WEIGHT, COVERAGE_WEIGHT = 0.5, 0.2, 0.3
+
+# Answers shorter than this fraction of the sample lose points proportionally
+MIN_LENGTH_RATIO = 0.2
+
+ESSAY_STATUSES = ('pending', 'provisional', 'overridden')
+
+# Question types answered in free text (the seed scripts use 'written')
+ESSAY_TYPES = ('essay', 'written')
+
+_WORD = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be been but by can for from had has have he her his i if in into is it its "
+    "of on or our she so than that the their them then there these they this to was we were what "
+    "when which who will with would you your".split()
+)
+_SUFFIXES = ('ingly', 'edly', 'ing', 'ies', 'ied', 'ed', 'es', 'ly', 's')
+
+_BM25_K1 = 1.2
+_BM25_B = 0.75
+
+
+class EssayGradingError(Exception):
+    """Raised for invalid grading requests and overrides."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+# ============================================================================
+# TEXT AND SPARSE VECTORS
+# ============================================================================
+
+def _stem(word):
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def word_terms(value):
+    return [_stem(w) for w in _WORD.findall((value or '').lower()) if w not in _STOPWORDS]
+
+
+def char_terms(value, size=4):
+    normalized = ' '.join(_WORD.findall((value or '').lower()))
+    return [normalized[i:i + size] for i in range(len(normalized) - size + 1)]
+
+
+def _counts(terms):
+    counts = {}
+    for term in terms:
+        counts[term] = counts.get(term, 0) + 1
+    return counts
+
+
+def _idf(documents):
+    """Smoothed inverse document frequency over a list of count dicts"""
+    frequency = {}
+    for document in documents:
+        for term in document:
+            frequency[term] = frequency.get(term, 0) + 1
+    total = len(documents)
+    return {term: math.log((1 + total) / (1 + df)) + 1 for term, df in frequency.items()}
+
+
+def _tfidf(counts, idf):
+    vector = {term: (1 + math.log(tf)) * idf.get(term, 1.0) for term, tf in counts.items()}
+    norm = math.sqrt(sum(w * w for w in vector.values()))
+    return {term: w / norm for term, w in vector.items()} if norm else {}
+
+
+def cosine(left, right):
+    """Dot product of two L2-normalized sparse vectors"""
+    if len(left) > len(right):
+        left, right = right, left
+    return sum(w * right.get(term, 0.0) for term, w in left.items())
+
+
+# ============================================================================
+# SCORER
+# ============================================================================
+
+class EssayScorer:
+    """
+    Scores answers to one essay question against its sample answer.
+
+    Args:
+        sample_answer: The question's sample answer (Question.correct_answer)
+        corpus: Every answer to the question (pending or not); used for
+            term statistics so words all students use weigh less
+    """
+
+    def __init__(self, sample_answer, corpus=()):
+        self.sample_words = _counts(word_terms(sample_answer))
+        self.sample_chars = _counts(char_terms(sample_answer))
+        self.sample_length = sum(self.sample_words.values())
+
+        word_docs = [self.sample_words] + [_counts(word_terms(a)) for a in corpus]
+        char_docs = [self.sample_chars] + [_counts(char_terms(a)) for a in corpus]
+        self.word_idf = _idf(word_docs)
+        self.char_idf = _idf(char_docs)
+        self.average_length = (sum(sum(d.values()) for d in word_docs) / len(word_docs)) or 1
+        self.sample_word_vector = _tfidf(self.sample_words, self.word_idf)
+        self.sample_char_vector = _tfidf(self.sample_chars, self.char_idf)
+        self.sample_bm25 = self._bm25(self.sample_words, self.sample_length) or 1.0
+
+    def _bm25(self, counts, length):
+        score = 0.0
+        for term in self.sample_words:
+            tf = counts.get(term, 0)
+            if tf:
+                score += self.word_idf.get(term, 1.0) * tf * (_BM25_K1 + 1) / (
+                    tf + _BM25_K1 * (1 - _BM25_B + _BM25_B * length / self.average_length))
+        return score
+
+    def score(self, answer):
+        """
+        Score one answer.
+
+        Returns {"points": 0-1, "similarity": 0-1, "components": {...}}.
+        """
+        words = _counts(word_terms(answer))
+        length = sum(words.values())
+        if not length or not self.sample_length:
+            return {"points": 0.0, "similarity": 0.0,
+                    "components": {"word": 0.0, "char": 0.0, "coverage": 0.0}}
+
+        word = cosine(_tfidf(words, self.word_idf), self.sample_word_vector)
+        char = cosine(_tfidf(_counts(char_terms(answer)), self.char_idf), self.sample_char_vector)
+        coverage = min(1.0, self._bm25(words, length) / self.sample_bm25)
+        similarity = WORD_WEIGHT * word + CHAR_WEIGHT * char + COVERAGE_WEIGHT * coverage
+
+        length_ratio = length / self.sample_length
+        if length_ratio < MIN_LENGTH_RATIO:
+            similarity *= length_ratio / MIN_LENGTH_RATIO
+
+        span = (ESSAY_FULL_CREDIT_SIMILARITY - ESSAY_ZERO_CREDIT_SIMILARITY) or 1.0
+        points = min(1.0, max(0.0, (similarity - ESSAY_ZERO_CREDIT_SIMILARITY) / span))
+        return {
+            "points": round(points, 2),
+            "similarity": round(similarity, 3),
+            "components": {"word": round(word, 3), "char": round(char, 3), "coverage": round(coverage, 3)}
+        }
+
+
+# ============================================================================
+# SUBMISSION RESULTS
+# ============================================================================
+
+def is_essay(question_type):
+    """Whether questions of this type are answered in free text"""
+    return question_type in ESSAY_TYPES
+
+
+def essay_result(question, answer_text):
+    """detailed_results entry for an essay answer at submission time"""
+    answer_text = answer_text.strip() if isinstance(answer_text, str) else ''
+    return {
+        "id": question.id,
+        "question_text": question.question_text,
+        "question_type": "essay",
+        "user_answer_text": answer_text,
+        "user_selected_answer_text": answer_text or "Not Answered",
+        "correct_answer_text": question.correct_answer,
+        "is_correct": False,
+        # Blank answers need no grading
+        "essay_score": None if answer_text else 0.0,
+        "essay_status": "pending" if answer_text else "provisional"
+    }
+
+
+def score_results(detailed_results):
+    """
+    Points and essay status of a submission's detailed_results.
+
+    Multiple choice answers are worth 1 point when correct, essays their
+    essay_score (0 while pending). The status is None without essays, else
+    'pending', 'provisional' or 'reviewed' (every essay overridden).
+    """
+    points = 0.0
+    statuses = set()
+    for result in detailed_results or []:
+        if is_essay(result.get('question_type')):
+            points += result.get('essay_score') or 0.0
+            statuses.add(result.get('essay_status') or 'pending')
+        elif result.get('is_correct'):
+            points += 1
+    if not statuses:
+        status = None
+    elif 'pending' in statuses:
+        status = 'pending'
+    elif 'provisional' in statuses:
+        status = 'provisional'
+    else:
+        status = 'reviewed'
+    return points, status
+
+
+def _totals(detailed_results, total_questions):
+    points, status = score_results(detailed_results)
+    percentage = (points / total_questions) * 100 if total_questions else 0
+    return {"score": int(round(points)), "percentage": round(percentage, 2), "essay_status": status}
+
+
+# ============================================================================
+# GRADING JOBS
+# ============================================================================
+
+class EssayGradingJob:
+    """Progress of one grading run over a quiz"""
+
+    def __init__(self, quiz_id, regrade):
+        self.id = uuid.uuid4().hex
+        self.quiz_id = quiz_id
+        self.regrade = regrade
+        self.status = 'queued'
+        self.summary = {"submissions": 0, "answersScored": 0, "updated": 0, "skippedConflicts": 0}
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    @property
+    def done(self):
+        return self.status in ('completed', 'failed')
+
+    def to_dict(self):
+        return {
+            "jobId": self.id,
+            "quizId": self.quiz_id,
+            "status": self.status,
+            "regrade": self.regrade,
+            **self.summary,
+            "error": self.error,
+            "elapsedSeconds": round((self.finished_at or time.time()) - self.created_at, 3)
+        }
+
+
+class EssayGradingService:
+    """
+    Background essay grading and teacher overrides.
+
+    Args:
+        app: Flask app (jobs run in its app context)
+        db: Flask-SQLAlchemy instance
+        submission_model: The Submission model class (needs quiz_id,
+            essay_status and essay_revision columns)
+        question_model: The Question model class
+    """
+
+    def __init__(self, app, db, submission_model, question_model, batch_size=ESSAY_GRADING_BATCH):
+        self.app = app
+        self.db = db
+        self.submissions = submission_model.__table__
+        self.questions = question_model.__table__
+        self.batch_size = batch_size
+        self._jobs = {}
+        self._running = {}           # quiz id -> running job
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def start(self, quiz_id, regrade=False):
+        """
+        Queue a grading run for a quiz, or return the one already running.
+
+        With regrade, provisional scores are recomputed as well (e.g. after
+        the sample answer changed); overridden scores are always kept.
+        """
+        with self._lock:
+            self._prune()
+            job = self._running.get(quiz_id)
+            if job is not None:
+                return job
+            job = EssayGradingJob(quiz_id, regrade)
+            self._jobs[job.id] = job
+            self._running[quiz_id] = job
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='essay-grading')
+            self._pool.submit(self._run_job, job)
+            return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def _run_job(self, job):
+        job.status = 'running'
+        status = 'failed'
+        try:
+            with self.app.app_context():
+                try:
+                    self.run(job.quiz_id, regrade=job.regrade, summary=job.summary)
+                finally:
+                    self.db.session.remove()
+            status = 'completed'
+        except Exception as e:
+            job.error = f"Essay grading failed: {str(e)}"
+            self.app.logger.warning(f"Essay grading job {job.id} for quiz {job.quiz_id} failed: {e}")
+        finally:
+            # finished_at first: a job that reads as done always has one
+            job.finished_at = time.time()
+            job.status = status
+            with self._lock:
+                if self._running.get(job.quiz_id) is job:
+                    del self._running[job.quiz_id]
+
+    def _prune(self):
+        cutoff = time.time() - ESSAY_JOB_TTL
+        for job_id in [j.id for j in self._jobs.values() if j.done and j.finished_at is not None and j.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    # ------------------------------------------------------------------
+    # Grading
+    # ------------------------------------------------------------------
+
+    def run(self, quiz_id, regrade=False, summary=None):
+        """
+        Score every pending essay answer of a quiz and write provisional points.
+
+        Runs synchronously (the CLI calls it directly). Returns the summary:
+        submissions with work to do, answers scored, rows updated and rows
+        skipped because they changed while the run was scoring.
+        """
+        summary = summary if summary is not None else \
+            {"submissions": 0, "answersScored": 0, "updated": 0, "skippedConflicts": 0}
+        session = self.db.session
+        s, q = self.submissions, self.questions
+
+        samples = {row.id: row.correct_answer for row in session.execute(
+            select(q.c.id, q.c.correct_answer).where(q.c.quiz_id == quiz_id, q.c.question_type.in_(ESSAY_TYPES)))}
+        if not samples:
+            return summary
+
+        wanted = ('pending', 'provisional') if regrade else ('pending',)
+        corpus = {qid: [] for qid in samples}
+        work = []                    # (submission id, revision, total questions, results) with answers to score
+        rows = session.execute(
+            select(s.c.submission_id, s.c.essay_revision, s.c.total_questions, s.c.detailed_results)
+            .where(s.c.quiz_id == quiz_id, s.c.essay_status.isnot(None))
+            .execution_options(yield_per=self.batch_size)
+        )
+        for row in rows:
+            needs_scoring = False
+            for result in row.detailed_results or []:
+                if not is_essay(result.get('question_type')) or result.get('id') not in samples:
+                    continue
+                if result.get('user_answer_text'):
+                    corpus[result['id']].append(result['user_answer_text'])
+                if result.get('essay_status', 'pending') in wanted and result.get('user_answer_text'):
+                    needs_scoring = True
+            if needs_scoring:
+                work.append((row.submission_id, row.essay_revision or 0, row.total_questions,
+                             [dict(result) for result in row.detailed_results]))
+        summary["submissions"] = len(work)
+        if not work:
+            return summary
+
+        scorers = {qid: EssayScorer(sample, corpus[qid]) for qid, sample in samples.items()}
+        updates = []
+        for submission_id, revision, total_questions, results in work:
+            for result in results:
+                if (is_essay(result.get('question_type')) and result.get('id') in scorers
+                        and result.get('essay_status', 'pending') in wanted and result.get('user_answer_text')):
+                    scored = scorers[result['id']].score(result['user_answer_text'])
+                    result['essay_score'] = scored['points']
+                    result['essay_similarity'] = scored['similarity']
+                    result['essay_components'] = scored['components']
+                    result['essay_status'] = 'provisional'
+                    result['is_correct'] = scored['points'] >= 0.5
+                    summary["answersScored"] += 1
+            totals = _totals(results, total_questions)
+            updates.append({"b_id": submission_id, "b_revision": revision, "b_results": results,
+                            "b_score": totals["score"], "b_percentage": totals["percentage"],
+                            "b_status": totals["essay_status"]})
+
+        stmt = (
+            s.update()
+            .where(s.c.submission_id == bindparam('b_id'),
+                   s.c.essay_revision == bindparam('b_revision'))
+            .values(detailed_results=bindparam('b_results', type_=s.c.detailed_results.type),
+                    score=bindparam('b_score'), percentage=bindparam('b_percentage'),
+                    essay_status=bindparam('b_status'), essay_revision=s.c.essay_revision + 1)
+        )
+        for start in range(0, len(updates), self.batch_size):
+            batch = updates[start:start + self.batch_size]
+            try:
+                written = session.execute(stmt, batch).rowcount
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+            summary["updated"] += written
+            summary["skippedConflicts"] += len(batch) - written
+        return summary
+
+    # ------------------------------------------------------------------
+    # Teacher review
+    # ------------------------------------------------------------------
+
+    def override(self, submission_id, question_id, points, comment=None, expected_revision=None):
+        """
+        Set a teacher's score (0-1) for one essay answer.
+
+        Returns the submission's new totals. Raises EssayGradingError (404
+        unknown submission/answer, 409 if expected_revision is stale).
+        """
+        try:
+            points = float(points)
+        except (TypeError, ValueError):
+            raise EssayGradingError("score must be a number between 0 and 1")
+        if not 0 <= points <= 1:
+            raise EssayGradingError("score must be a number between 0 and 1")
+        if expected_revision is not None:
+            try:
+                expected_revision = int(expected_revision)
+            except (TypeError, ValueError):
+                raise EssayGradingError("revision must be a number")
+
+        session = self.db.session
+        s = self.submissions
+        row = session.execute(
+            select(s.c.submission_id, s.c.essay_revision, s.c.total_questions, s.c.detailed_results)
+            .where(s.c.submission_id == submission_id).with_for_update()
+        ).first()
+        if row is None:
+            session.rollback()
+            raise EssayGradingError("Submission not found", 404)
+        revision = row.essay_revision or 0
+        if expected_revision is not None and expected_revision != revision:
+            session.rollback()
+            raise EssayGradingError("Submission was changed since it was loaded; reload and try again.", 409)
+
+        results = [dict(result) for result in row.detailed_results or []]
+        target = next((r for r in results
+                       if is_essay(r.get('question_type')) and r.get('id') == question_id), None)
+        if target is None:
+            session.rollback()
+            raise EssayGradingError("Essay answer not found in this submission", 404)
+        target['essay_score'] = round(points, 2)
+        target['essay_status'] = 'overridden'
+        target['is_correct'] = points >= 0.5
+        if comment is not None:
+            target['teacher_comment'] = comment
+
+        totals = _totals(results, row.total_questions)
+        written = session.execute(
+            s.update()
+            .where(s.c.submission_id == submission_id, s.c.essay_revision == row.essay_revision)
+            .values(detailed_results=results, score=totals["score"], percentage=totals["percentage"],
+                    essay_status=totals["essay_status"], essay_revision=revision + 1)
+        ).rowcount
+        if written != 1:
+            session.rollback()
+            raise EssayGradingError("Submission was changed since it was loaded; reload and try again.", 409)
+        session.commit()
+        return {"submissionId": submission_id, "questionId": question_id, "essayScore": target['essay_score'],
+                "score": totals["score"], "percentage": totals["percentage"],
+                "essayStatus": totals["essay_status"], "revision": revision + 1}
+
+    def review_queue(self, quiz_id, status=None, limit=100, offset=0):
+        """Essay answers of a quiz for teacher review, optionally filtered by status"""
+        if status is not None and status not in ESSAY_STATUSES:
+            raise EssayGradingError(f"status must be one of: {', '.join(ESSAY_STATUSES)}")
+        s = self.submissions
+        query = select(s.c.submission_id, s.c.user_id, s.c.essay_revision, s.c.detailed_results) \
+            .where(s.c.quiz_id == quiz_id, s.c.essay_status.isnot(None)) \
+            .order_by(s.c.id)
+        items = []
+        for row in self.db.session.execute(query.execution_options(yield_per=self.batch_size)):
+            for result in row.detailed_results or []:
+                if not is_essay(result.get('question_type')):
+                    continue
+                if status is not None and result.get('essay_status', 'pending') != status:
+                    continue
+                items.append({
+                    "submissionId": row.submission_id,
+                    "userId": row.user_id,
+                    "revision": row.essay_revision or 0,
+                    "questionId": result.get('id'),
+                    "questionText": result.get('question_text'),
+                    "answer": result.get('user_answer_text'),
+                    "essayScore": result.get('essay_score'),
+                    "essayStatus": result.get('essay_status', 'pending'),
+                    "similarity": result.get('essay_similarity'),
+                    "components": result.get('essay_components'),
+                    "teacherComment": result.get('teacher_comment')
+                })
+        return {"total": len(items), "items": items[offset:offset + limit]}
@@ -0,0 +1,142 @@
+"""
+QuizFlow Keyset Pagination
+==========================
+Cursor pagination on (created_at, id) for the newest-first listings
+(payments, subscriptions, the admin audit log).
+
+A page is read as
+
+    WHERE (created_at, id) < (:cursor_created_at, :cursor_id)
+    ORDER BY created_at DESC, id DESC LIMIT :limit + 1
+
+so every page, however deep, is one index range scan. There is no OFFSET
+to skip and no COUNT(*). The cursor is opaque to clients: the last row's
+key in URL-safe base64, returned as `nextCursor` while there are more
+rows.
+
+Totals are opt-in. An unfiltered listing on PostgreSQL uses the planner's
+row estimate (pg_class.reltuples, marked approximate). Otherwise the exact
+count is cached per table and filter for PAGINATION_TOTAL_TTL seconds.
+"""
+
+import base64
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import and_, or_, text
+
+
+# Seconds a counted total is reused
+PAGINATION_TOTAL_TTL = float(os.getenv('PAGINATION_TOTAL_TTL', 60))
+
+# Largest page a keyset listing returns
+KEYSET_PAGE_MAX = int(os.getenv('KEYSET_PAGE_MAX', 200))
+
+# Cached totals kept at most (one per table and filter)
+_MAX_CACHED_TOTALS = 1000
+
+
+class KeysetError(Exception):
+    """Raised for malformed cursors."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def page_size(value, default):
+    """Requested page size clamped to 1..KEYSET_PAGE_MAX"""
+    return max(1, min(value or default, KEYSET_PAGE_MAX))
+
+
+def encode_cursor(created_at, row_id):
+    """Opaque cursor for the row (created_at, id)"""
+    raw = json.dumps([created_at.isoformat() if created_at else None, row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).rstrip(b'=').decode('ascii')
+
+
+def decode_cursor(cursor):
+    """(created_at, id) of a cursor; raises KeysetError if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, row_id = json.loads(raw)
+        return (datetime.fromisoformat(created_at) if created_at else None), int(row_id)
+    except (ValueError, TypeError):
+        raise KeysetError("Invalid cursor")
+
+
+class KeysetPaginator:
+    """
+    Args:
+        db: Flask-SQLAlchemy instance
+        total_ttl: Seconds a counted total is reused
+    """
+
+    def __init__(self, db, total_ttl=PAGINATION_TOTAL_TTL):
+        self.db = db
+        self.total_ttl = total_ttl
+        self._totals = {}            # (table, filter key) -> (expires at, total)
+        self._lock = threading.Lock()
+
+    def page(self, query, model, cursor=None, limit=50, include_total=False, filters=None):
+        """
+        One page of an ORM query, newest first.
+
+        Args:
+            query: Query over `model` with any filters already applied
+            model: Model with `created_at` and `id` columns
+            cursor: nextCursor of the previous page (None for the first page)
+            limit: Page size
+            include_total: Also return the (cached or approximate) total
+            filters: Hashable description of the query's filters (cache key
+                of the total; None means the query is unfiltered)
+
+        Returns {"items": [...], "nextCursor": str or None, "hasMore": bool}
+        plus "total" and "totalApproximate" when include_total is set.
+        """
+        created_at, row_id = model.created_at, model.id
+        page_query = query
+        if cursor:
+            after_created, after_id = decode_cursor(cursor)
+            page_query = page_query.filter(or_(
+                created_at < after_created,
+                and_(created_at == after_created, row_id < after_id)
+            ))
+        rows = page_query.order_by(created_at.desc(), row_id.desc()).limit(limit + 1).all()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        result = {
+            'items': rows,
+            'nextCursor': encode_cursor(rows[-1].created_at, rows[-1].id) if has_more else None,
+            'hasMore': has_more
+        }
+        if include_total:
+            result['total'], result['totalApproximate'] = self.total(query, model, filters)
+        return result
+
+    def total(self, query, model, filters=None):
+        """(total rows of the query, whether it is an estimate)"""
+        table = model.__table__.name
+        if filters is None and self.db.engine.dialect.name == 'postgresql':
+            estimate = self.db.session.execute(
+                text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table)"),
+                {'table': table}
+            ).scalar()
+            if estimate is not None and estimate >= 0:
+                return int(estimate), True
+
+        key = (table, filters)
+        cached = self._totals.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1], False
+        total = query.order_by(None).count()
+        with self._lock:
+            if len(self._totals) >= _MAX_CACHED_TOTALS:
+                self._totals.clear()
+            self._totals[key] = (time.monotonic() + self.total_ttl, total)
+        return total, False
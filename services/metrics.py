@@ -0,0 +1,336 @@
+"""
+QuizFlow Metrics
+================
+Low-overhead in-process metric collectors with a Prometheus text endpoint.
+
+Counters, gauges and histograms are plain Python objects guarded by a lock;
+recording a sample is a dictionary lookup and an addition. The registry is
+rendered in the Prometheus text exposition format on GET /metrics, so any
+Prometheus-compatible scraper (or curl) can read latency under exam load
+without an external APM agent.
+
+Usage:
+    from services.metrics import SUBMISSIONS_TOTAL, time_mail_send
+    SUBMISSIONS_TOTAL.inc(result='accepted')
+"""
+
+import bisect
+import os
+import threading
+import time
+
+from flask import Response, g, request
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+# Optional bearer token required to scrape /metrics
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    body = ','.join(
+        '{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for k, v in pairs
+    )
+    return '{' + body + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+# ============================================================================
+# COLLECTORS
+# ============================================================================
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labels=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(labels[name] for name in self.label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    kind = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, or be computed at scrape time"""
+
+    kind = 'gauge'
+
+    def __init__(self, *args, callback=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values = {}
+        self._callback = callback
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _samples(self):
+        if self._callback is not None:
+            # callback returns {label_values_tuple: value}
+            items = list(self._callback().items())
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, k)} {_format_value(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    """Bucketed distribution of observed values (e.g. latencies in seconds)"""
+
+    kind = 'histogram'
+
+    def __init__(self, *args, buckets=DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}   # key -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                entry[index] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def time(self, **labels):
+        """Context manager observing the elapsed wall time of its block"""
+        return _Timer(self, labels)
+
+    def _samples(self):
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        lines = []
+        for key, entry in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, ('le', _format_value(float(bound))))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, ('le', '+Inf'))} {entry[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(entry[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {entry[-1]}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'started')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+class Registry:
+    """Ordered collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+# ============================================================================
+# APPLICATION METRICS
+# ============================================================================
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'quizflow_http_request_duration_seconds', 'HTTP request latency by route',
+    labels=('method', 'route', 'status')
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    'quizflow_http_requests_in_flight', 'Requests currently being handled'
+)
+REQUEST_DB_SECONDS = Histogram(
+    'quizflow_request_db_seconds', 'Total database time per request by route',
+    labels=('route',)
+)
+REQUEST_DB_QUERIES = Histogram(
+    'quizflow_request_db_queries', 'SQL statements per request by route',
+    labels=('route',), buckets=(1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+)
+MAIL_SEND_SECONDS = Histogram(
+    'quizflow_mail_send_seconds', 'Mail send latency by message kind',
+    labels=('kind',)
+)
+MAIL_SEND_FAILURES = Counter(
+    'quizflow_mail_send_failures_total', 'Failed mail sends by message kind',
+    labels=('kind',)
+)
+SUBMISSIONS_TOTAL = Counter(
+    'quizflow_submissions_total', 'Quiz submissions by outcome',
+    labels=('result',)
+)
+LOGINS_TOTAL = Counter(
+    'quizflow_logins_total', 'Student logins by outcome',
+    labels=('result',)
+)
+GRADING_SECONDS = Histogram(
+    'quizflow_grading_duration_seconds', 'Time spent grading one submission',
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+)
+GRADED_ANSWERS_TOTAL = Counter(
+    'quizflow_graded_answers_total', 'Graded answers by correctness',
+    labels=('correct',)
+)
+
+
+def time_mail_send(send, message, kind):
+    """
+    Send a message through `send` while recording latency and failures.
+
+    Exceptions are re-raised so callers keep their existing error handling.
+    """
+    started = time.perf_counter()
+    try:
+        return send(message)
+    except Exception:
+        MAIL_SEND_FAILURES.inc(kind=kind)
+        raise
+    finally:
+        MAIL_SEND_SECONDS.observe(time.perf_counter() - started, kind=kind)
+
+
+def db_pool_gauges(engines):
+    """
+    Register scrape-time gauges for SQLAlchemy connection pools.
+
+    Args:
+        engines: Callable returning {name: engine}
+    """
+    def collect(method):
+        def callback():
+            values = {}
+            for name, engine in engines().items():
+                fn = getattr(engine.pool, method, None)
+                if callable(fn):
+                    values[(name,)] = fn()
+            return values
+        return callback
+
+    Gauge('quizflow_db_pool_size', 'Configured pool size', labels=('engine',), callback=collect('size'))
+    Gauge('quizflow_db_pool_checked_out', 'Connections in use', labels=('engine',), callback=collect('checkedout'))
+    Gauge('quizflow_db_pool_checked_in', 'Idle pooled connections', labels=('engine',), callback=collect('checkedin'))
+    Gauge('quizflow_db_pool_overflow', 'Connections beyond pool size', labels=('engine',), callback=collect('overflow'))
+
+
+# ============================================================================
+# FLASK INTEGRATION
+# ============================================================================
+
+def init_metrics(app, registry=REGISTRY):
+    """Record per-route latency and in-flight requests and serve GET /metrics"""
+
+    @app.before_request
+    def _metrics_start():
+        g.metrics_started = time.perf_counter()
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+
+    @app.after_request
+    def _metrics_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _metrics_finish(exc):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return
+        HTTP_REQUESTS_IN_FLIGHT.dec()
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        status = 500 if exc is not None else g.pop('metrics_status', 200)
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started,
+                                     method=request.method, route=route, status=status)
+        stats = g.get('query_stats')
+        if stats is not None:
+            REQUEST_DB_SECONDS.observe(stats.seconds, route=route)
+            REQUEST_DB_QUERIES.observe(stats.count, route=route)
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics_endpoint():
+        """Prometheus text-format metrics"""
+        if METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
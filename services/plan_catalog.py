@@ -0,0 +1,149 @@
+"""
+QuizFlow Plan Catalog
+=====================
+One in-memory catalog of everything a subscription can be bought as.
+
+- Plans are the teacher plans in the `subscription_plans` table (Basic,
+  Standard, Premium) used by the payment/approval blueprint. They are read
+  with one query and then served from memory.
+- Tiers are the plan types of the app's own `/api/subscription/*`
+  endpoints (free, basic, pro, enterprise). They are defined here once
+  instead of in the request handler.
+
+The catalog has a version (a hash of its contents) that the plans endpoint
+sends as an ETag, so pricing pages revalidate with a 304 instead of
+downloading the list again. Committing a change to a plan through the ORM
+invalidates the catalog in this process; other worker processes reload
+after PLAN_CACHE_TTL seconds.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+from sqlalchemy import select
+
+
+# Seconds the catalog is reused before it is read again (changes made by other workers)
+PLAN_CACHE_TTL = float(os.getenv('PLAN_CACHE_TTL', 300))
+
+# Plan types of the app's own subscription endpoints (-1 means unlimited)
+SUBSCRIPTION_TIERS = {
+    'free': {'quizzes_limit': 5, 'students_limit': 50, 'price': 0},
+    'basic': {'quizzes_limit': 20, 'students_limit': 100, 'price': 9.99},
+    'pro': {'quizzes_limit': 100, 'students_limit': 500, 'price': 29.99},
+    'enterprise': {'quizzes_limit': -1, 'students_limit': -1, 'price': 99.99}
+}
+
+
+class Plan:
+    """A plan row as an immutable, session-independent record"""
+
+    __slots__ = ('id', 'plan_name', 'price', 'currency', 'quiz_limit', 'duration_days', 'is_active')
+
+    def __init__(self, id, plan_name, price, currency, quiz_limit, duration_days, is_active=True):
+        self.id = id
+        self.plan_name = plan_name
+        self.price = price
+        self.currency = currency
+        self.quiz_limit = quiz_limit
+        self.duration_days = duration_days
+        self.is_active = is_active
+
+    def to_dict(self):
+        """Same shape as SubscriptionPlan.to_dict()"""
+        return {
+            'id': self.id,
+            'planName': self.plan_name,
+            'price': float(self.price),
+            'currency': self.currency,
+            'quizLimit': self.quiz_limit,
+            'durationDays': self.duration_days,
+            'isActive': self.is_active
+        }
+
+
+class PlanCatalog:
+    """
+    Args:
+        db: Flask-SQLAlchemy instance the plan table is read with
+        plan_model: The SubscriptionPlan model class
+        tiers: Plan types of the app's subscription endpoints
+        ttl: Seconds before the plans are read again
+    """
+
+    def __init__(self, db, plan_model, tiers=SUBSCRIPTION_TIERS, ttl=PLAN_CACHE_TTL):
+        self.db = db
+        self.table = plan_model.__table__
+        self.tiers = {name: dict(limits) for name, limits in tiers.items()}
+        self.ttl = ttl
+        self._state = None            # (expires at, {name: Plan}, payload, etag)
+        self._generation = 0          # bumped by invalidate()
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+
+    def _current(self):
+        state = self._state
+        if state is None or state[0] < time.monotonic():
+            with self._lock:
+                state = self._state
+                if state is None or state[0] < time.monotonic():
+                    generation = self._generation
+                    state = self._load()
+                    # A load that raced an invalidation may have read the old plans; serve it once, don't keep it
+                    if generation == self._generation:
+                        self._state = state
+        return state
+
+    def _load(self):
+        t = self.table
+        rows = self.db.session.execute(
+            select(t.c.id, t.c.plan_name, t.c.price, t.c.currency, t.c.quiz_limit, t.c.duration_days)
+            .where(t.c.is_active.is_(True))
+            .order_by(t.c.price, t.c.id)
+        ).all()
+        plans = {row.plan_name: Plan(row.id, row.plan_name, row.price, row.currency,
+                                     row.quiz_limit, row.duration_days) for row in rows}
+        payload = {'plans': [plan.to_dict() for plan in plans.values()], 'tiers': self.tiers}
+        etag = hashlib.sha1(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+        return (time.monotonic() + self.ttl, plans, payload, etag)
+
+    def invalidate(self):
+        """Drop the catalog; the next lookup reads the plans again"""
+        self._generation += 1
+        self._state = None
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+
+    def get(self, plan_name):
+        """Active plan by name, or None (like SubscriptionPlan.get_plan_by_name)"""
+        return self._current()[1].get(plan_name)
+
+    def plans(self):
+        """Active plans, cheapest first"""
+        return list(self._current()[1].values())
+
+    def tier(self, plan_type):
+        """Limits and price of one of the app's plan types, or None"""
+        return self.tiers.get(plan_type)
+
+    def payload(self):
+        """The whole catalog as a JSON-ready dict (shared; do not modify)"""
+        return self._current()[2]
+
+    def payload_and_etag(self):
+        """The catalog and its version from the same load, for a response body and its ETag"""
+        state = self._current()
+        return state[2], state[3]
+
+    @property
+    def etag(self):
+        """Version of the catalog's current contents"""
+        return self._current()[3]
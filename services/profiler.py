@@ -0,0 +1,314 @@
+"""
+QuizFlow Sampling Profiler
+==========================
+Opt-in stack sampling for slow requests, exported as flamegraphs.
+
+With PROFILER_ENABLED=true every request registers its thread in a small
+table of active requests. A single sampler thread wakes every
+PROFILER_INTERVAL_MS and captures the Python stack of each request that has
+been running longer than PROFILER_SLOW_MS, plus a random
+PROFILER_SAMPLE_RATE fraction of all requests (sampled from their start).
+Samples are aggregated per route into collapsed stacks and can be downloaded
+by an admin in either format:
+
+    GET /api/admin/profile?format=collapsed    flamegraph.pl / speedscope input
+    GET /api/admin/profile?format=speedscope   speedscope.app JSON
+    GET /api/admin/profile?format=summary      counters and hottest stacks
+    DELETE /api/admin/profile                  reset the aggregate
+
+When disabled no request hooks or threads are installed; the admin endpoint
+only reports that profiling is off.
+"""
+
+import os
+import random
+import sys
+import threading
+import time
+
+from flask import Response, jsonify, request
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+PROFILER_ENABLED = os.getenv('PROFILER_ENABLED', 'false').lower() in ['true', '1', 'yes']
+
+# Requests running longer than this are sampled from that point on
+PROFILER_SLOW_MS = int(os.getenv('PROFILER_SLOW_MS', 500))
+
+# Fraction of all requests sampled from their first millisecond (0.0 - 1.0)
+PROFILER_SAMPLE_RATE = float(os.getenv('PROFILER_SAMPLE_RATE', 0.0))
+
+# Time between stack samples
+PROFILER_INTERVAL_MS = int(os.getenv('PROFILER_INTERVAL_MS', 5))
+
+# Distinct stacks kept before new ones are folded into a single bucket
+PROFILER_MAX_STACKS = int(os.getenv('PROFILER_MAX_STACKS', 10000))
+
+# Optional bearer token required by the admin endpoint
+PROFILER_TOKEN = os.getenv('PROFILER_TOKEN')
+
+TRUNCATED_FRAME = '[other stacks]'
+
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def frame_label(code):
+    """Readable, line-independent label for a code object"""
+    filename = code.co_filename
+    if filename.startswith(_PROJECT_ROOT):
+        filename = os.path.relpath(filename, _PROJECT_ROOT)
+    else:
+        # Trim site-packages and stdlib prefixes down to the package path
+        for marker in ('site-packages' + os.sep, 'dist-packages' + os.sep):
+            if marker in filename:
+                filename = filename.split(marker, 1)[1]
+                break
+        else:
+            filename = os.path.basename(filename)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+class _ActiveRequest:
+    """A request currently being handled by some thread"""
+
+    __slots__ = ('label', 'started', 'sampled', 'samples')
+
+    def __init__(self, label, started, sampled):
+        self.label = label
+        self.started = started
+        self.sampled = sampled
+        self.samples = 0
+
+
+# ============================================================================
+# SAMPLING PROFILER
+# ============================================================================
+
+class SamplingProfiler:
+    """
+    Sample the stacks of slow (or randomly chosen) requests.
+
+    Usage:
+        profiler = SamplingProfiler(app)
+    """
+
+    def __init__(self, app=None, enabled=PROFILER_ENABLED, slow_ms=PROFILER_SLOW_MS,
+                 sample_rate=PROFILER_SAMPLE_RATE, interval_ms=PROFILER_INTERVAL_MS,
+                 max_stacks=PROFILER_MAX_STACKS, token=PROFILER_TOKEN):
+        self.enabled = enabled
+        self.slow = slow_ms / 1000.0
+        self.sample_rate = sample_rate
+        self.interval = max(interval_ms, 1) / 1000.0
+        self.max_stacks = max_stacks
+        self.token = token
+
+        self._active = {}           # thread ident -> _ActiveRequest
+        self._stacks = {}           # (route label, frame labels...) -> sample count
+        self._labels = {}           # code object -> frame label
+        self._lock = threading.Lock()
+        self._sampler = None
+        self._started_at = time.time()
+
+        self.stats = {'samples': 0, 'profiled_requests': 0, 'truncated_samples': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        if self.enabled:
+            app.before_request(self._before_request)
+            app.teardown_request(self._teardown_request)
+        app.add_url_rule('/api/admin/profile', 'admin_profile', self._profile_endpoint,
+                         methods=['GET', 'DELETE'])
+        app.extensions['profiler'] = self
+
+    # ------------------------------------------------------------------
+    # Request hooks
+    # ------------------------------------------------------------------
+
+    def _before_request(self):
+        route = request.url_rule.rule if request.url_rule else request.path
+        sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        self._active[threading.get_ident()] = _ActiveRequest(
+            f"{request.method} {route}", time.perf_counter(), sampled
+        )
+        self._ensure_sampler()
+
+    def _teardown_request(self, exc):
+        active = self._active.pop(threading.get_ident(), None)
+        if active is not None and active.samples:
+            with self._lock:
+                self.stats['profiled_requests'] += 1
+
+    # ------------------------------------------------------------------
+    # Sampler thread
+    # ------------------------------------------------------------------
+
+    def _ensure_sampler(self):
+        if self._sampler is not None and self._sampler.is_alive():
+            return
+        with self._lock:
+            if self._sampler is not None and self._sampler.is_alive():
+                return
+            self._sampler = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+            self._sampler.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.sample_once()
+            except Exception as e:
+                self.app.logger.warning(f"Profiler sample failed: {str(e)}")
+
+    def sample_once(self):
+        """Capture one stack for every request that is due to be sampled"""
+        now = time.perf_counter()
+        due = [(ident, active) for ident, active in list(self._active.items())
+               if active.sampled or now - active.started >= self.slow]
+        if not due:
+            return
+        frames = sys._current_frames()
+        for ident, active in due:
+            frame = frames.get(ident)
+            if frame is None:
+                continue
+            stack = self._stack_labels(frame)
+            active.samples += 1
+            self._record((active.label,) + stack)
+
+    def _stack_labels(self, frame):
+        codes = []
+        while frame is not None:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        codes.reverse()
+
+        # Drop the server frames below Flask's WSGI entry point
+        for index, code in enumerate(codes):
+            if code.co_name == 'wsgi_app' and code.co_filename.endswith(os.path.join('flask', 'app.py')):
+                codes = codes[index:]
+                break
+
+        labels = self._labels
+        result = []
+        for code in codes:
+            label = labels.get(code)
+            if label is None:
+                label = labels[code] = frame_label(code)
+            result.append(label)
+        return tuple(result)
+
+    def _record(self, stack):
+        with self._lock:
+            self.stats['samples'] += 1
+            if stack not in self._stacks and len(self._stacks) >= self.max_stacks:
+                self.stats['truncated_samples'] += 1
+                stack = (stack[0], TRUNCATED_FRAME)
+            self._stacks[stack] = self._stacks.get(stack, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+            self._labels.clear()
+            self._started_at = time.time()
+            for key in self.stats:
+                self.stats[key] = 0
+
+    # ------------------------------------------------------------------
+    # Export
+    # ------------------------------------------------------------------
+
+    def _snapshot(self, route=None):
+        with self._lock:
+            items = list(self._stacks.items())
+        if route:
+            items = [(stack, n) for stack, n in items if route in stack[0]]
+        return items
+
+    def collapsed(self, route=None):
+        """Brendan Gregg collapsed-stack format: 'frame;frame;frame count' per line"""
+        lines = [';'.join(f.replace(';', ':') for f in stack) + f" {count}"
+                 for stack, count in sorted(self._snapshot(route))]
+        return '\n'.join(lines) + ('\n' if lines else '')
+
+    def speedscope(self, route=None):
+        """speedscope file format, one sampled profile per route"""
+        frames = []
+        frame_index = {}
+        profiles = {}
+        for stack, count in sorted(self._snapshot(route)):
+            indexes = []
+            for label in stack[1:]:
+                index = frame_index.get(label)
+                if index is None:
+                    index = frame_index[label] = len(frames)
+                    name, _, location = label.partition(' (')
+                    file, _, line = location.rstrip(')').rpartition(':')
+                    frames.append({'name': name, 'file': file, 'line': int(line) if line.isdigit() else None})
+                indexes.append(index)
+            profile = profiles.setdefault(stack[0], {'samples': [], 'weights': []})
+            profile['samples'].append(indexes)
+            profile['weights'].append(count * self.interval * 1000)
+
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': 'QuizFlow slow requests',
+            'exporter': 'quizflow-profiler',
+            'activeProfileIndex': 0,
+            'shared': {'frames': frames},
+            'profiles': [
+                {
+                    'type': 'sampled',
+                    'name': label,
+                    'unit': 'milliseconds',
+                    'startValue': 0,
+                    'endValue': sum(profile['weights']),
+                    'samples': profile['samples'],
+                    'weights': profile['weights']
+                }
+                for label, profile in profiles.items()
+            ]
+        }
+
+    def summary(self, route=None, top=20):
+        items = self._snapshot(route)
+        by_route = {}
+        for stack, count in items:
+            by_route[stack[0]] = by_route.get(stack[0], 0) + count
+        hottest = sorted(items, key=lambda item: item[1], reverse=True)[:top]
+        return {
+            'enabled': self.enabled,
+            'slowMs': int(self.slow * 1000),
+            'sampleRate': self.sample_rate,
+            'intervalMs': int(self.interval * 1000),
+            'since': self._started_at,
+            'stats': dict(self.stats),
+            'routes': by_route,
+            'hottestStacks': [{'samples': n, 'route': stack[0], 'leaf': stack[-1], 'depth': len(stack) - 1}
+                              for stack, n in hottest]
+        }
+
+    def _profile_endpoint(self):
+        """Download or reset the aggregated request profile"""
+        if self.token and request.headers.get('Authorization') != f'Bearer {self.token}':
+            return jsonify({"success": False, "message": "Unauthorized"}), 401
+        if not self.enabled:
+            return jsonify({"success": False, "message": "Profiling is disabled. Set PROFILER_ENABLED=true."}), 404
+
+        if request.method == 'DELETE':
+            self.reset()
+            return jsonify({"success": True, "message": "Profile reset"})
+
+        route = request.args.get('route')
+        fmt = request.args.get('format', 'collapsed')
+        if fmt == 'collapsed':
+            return Response(self.collapsed(route), mimetype='text/plain')
+        if fmt == 'speedscope':
+            return jsonify(self.speedscope(route))
+        if fmt == 'summary':
+            return jsonify({"success": True, "profile": self.summary(route)})
+        return jsonify({"success": False, "message": "format must be collapsed, speedscope or summary"}), 400
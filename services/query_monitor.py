@@ -0,0 +1,165 @@
+"""
+QuizFlow Query Monitor
+======================
+Per-request SQL query counting and N+1 detection.
+
+Hooks SQLAlchemy engine events to count statements and total database time
+for every request. Statements are grouped by shape (the SQL text with bound
+parameters left as placeholders), and a shape that repeats
+QUERY_N1_THRESHOLD or more times within one request is reported as a
+suspected N+1 query.
+
+Results are written to a structured (JSON) log line and, in debug mode or
+with QUERY_DEBUG_HEADERS=true, to response headers:
+
+    X-DB-Query-Count: 12
+    X-DB-Time-Ms: 8.41
+    X-DB-N1-Suspects: 1
+"""
+
+import json
+import os
+import re
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+# Repetitions of one statement shape that count as a suspected N+1
+QUERY_N1_THRESHOLD = int(os.getenv('QUERY_N1_THRESHOLD', 5))
+
+# Expose the counters as response headers even outside debug mode
+QUERY_DEBUG_HEADERS = os.getenv('QUERY_DEBUG_HEADERS', 'false').lower() in ['true', '1', 'yes']
+
+# Log every request's query stats (N+1 suspects are always logged)
+QUERY_LOG_ALL = os.getenv('QUERY_LOG_ALL', 'false').lower() in ['true', '1', 'yes']
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def statement_shape(statement):
+    """Collapse whitespace so identical statements compare equal"""
+    return _WHITESPACE.sub(' ', statement).strip()
+
+
+class RequestQueryStats:
+    """Query counters for a single request"""
+
+    __slots__ = ('count', 'seconds', 'shapes')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = {}
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        shape = statement_shape(statement)
+        self.shapes[shape] = self.shapes.get(shape, 0) + 1
+
+    def n1_suspects(self, threshold=QUERY_N1_THRESHOLD):
+        """Statement shapes repeated at least `threshold` times, most frequent first"""
+        repeated = [(shape, n) for shape, n in self.shapes.items() if n >= threshold]
+        return sorted(repeated, key=lambda item: item[1], reverse=True)
+
+
+# ============================================================================
+# QUERY MONITOR
+# ============================================================================
+
+class QueryMonitor:
+    """
+    Attach per-request query accounting to a Flask app.
+
+    Usage:
+        monitor = QueryMonitor(app)
+        with app.app_context():
+            monitor.watch(db.engine)
+    """
+
+    def __init__(self, app=None, threshold=QUERY_N1_THRESHOLD, headers=QUERY_DEBUG_HEADERS,
+                 log_all=QUERY_LOG_ALL):
+        self.threshold = threshold
+        self.headers = headers
+        self.log_all = log_all
+        self._engines = set()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.extensions['query_monitor'] = self
+
+    def watch(self, engine):
+        """Count statements executed on this engine"""
+        if id(engine) in self._engines:
+            return
+        self._engines.add(id(engine))
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    @staticmethod
+    def current():
+        """Stats for the active request, or None outside a request"""
+        if not has_request_context():
+            return None
+        return g.get('query_stats')
+
+    # ------------------------------------------------------------------
+    # Engine events
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info['query_start_time'] = time.perf_counter()
+
+    @staticmethod
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop('query_start_time', None)
+        stats = QueryMonitor.current()
+        if stats is not None and started is not None:
+            stats.record(statement, time.perf_counter() - started)
+
+    # ------------------------------------------------------------------
+    # Request hooks
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _before_request():
+        g.query_stats = RequestQueryStats()
+
+    def _after_request(self, response):
+        stats = g.get('query_stats')
+        if stats is None:
+            return response
+
+        suspects = stats.n1_suspects(self.threshold)
+        db_ms = round(stats.seconds * 1000, 2)
+
+        if self.headers or self.app.debug:
+            response.headers['X-DB-Query-Count'] = str(stats.count)
+            response.headers['X-DB-Time-Ms'] = str(db_ms)
+            response.headers['X-DB-N1-Suspects'] = str(len(suspects))
+
+        if suspects or self.log_all:
+            record = {
+                'event': 'n_plus_one_suspected' if suspects else 'request_queries',
+                'method': request.method,
+                'path': request.path,
+                'endpoint': request.endpoint,
+                'status': response.status_code,
+                'queryCount': stats.count,
+                'dbTimeMs': db_ms,
+                'suspects': [{'count': n, 'statement': shape[:300]} for shape, n in suspects]
+            }
+            log = self.app.logger.warning if suspects else self.app.logger.info
+            log(json.dumps(record))
+        return response
@@ -0,0 +1,233 @@
+"""
+QuizFlow Question Batch Editor
+==============================
+Save a whole quiz's question edits and ordering in one statement.
+
+A batch is a full new ordering of a quiz's questions, a list of question
+patches, or both. The affected rows are read once, the patches are merged
+and validated in memory, and every changed row is written with a single
+
+    UPDATE questions SET ... FROM (VALUES (...), (...)) AS v (...)
+    WHERE questions.id = v.id AND questions.version = v.expected_version
+
+in one transaction (databases without UPDATE ... FROM fall back to one
+executemany UPDATE). Each question carries a version number that is bumped
+on every write; if any row's version no longer matches what the editor
+loaded, nothing is written and the conflicting ids are reported.
+"""
+
+import json
+
+from sqlalchemy import Integer, Text, bindparam, cast, column, update, values
+
+from .question_import import validate_record
+
+
+# Columns a patch may change
+EDITABLE_COLUMNS = ('question_text', 'question_type', 'option_a', 'option_b',
+                    'option_c', 'option_d', 'correct_answer', 'options', 'tag', 'difficulty')
+
+_TYPE_KEYS = ('questionType', 'question_type', 'type')
+_ANSWER_KEYS = ('correctAnswer', 'correct_answer', 'sampleAnswer')
+
+
+class QuestionBatchError(Exception):
+    """Raised when a batch is invalid or conflicts with concurrent edits."""
+
+    def __init__(self, message, status_code=400, errors=None, conflicts=None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.errors = errors or []
+        self.conflicts = conflicts or []
+
+
+def _as_record(row):
+    """Current column values in the API's request shape"""
+    record = {'questionText': row['question_text'], 'questionType': row['question_type'] or 'multiple_choice',
+              'tag': row['tag'], 'difficulty': row['difficulty']}
+    if record['questionType'] == 'essay':
+        record['sampleAnswer'] = row['correct_answer']
+        record['options'] = row['options'] or {}
+    else:
+        record.update({'optionA': row['option_a'], 'optionB': row['option_b'],
+                       'optionC': row['option_c'], 'optionD': row['option_d'],
+                       'correctAnswer': row['correct_answer']})
+    return record
+
+
+def _merge(record, patch):
+    """Apply a patch to a record; patched answer/type keys replace all aliases"""
+    merged = dict(record)
+    for group in (_TYPE_KEYS, _ANSWER_KEYS):
+        if any(key in patch for key in group):
+            for key in group:
+                merged.pop(key, None)
+    merged.update({k: v for k, v in patch.items() if k not in ('id', 'version')})
+    return merged
+
+
+class QuestionBatchEditor:
+    """
+    Apply reorders and patches to one quiz's questions.
+
+    Args:
+        db: Flask-SQLAlchemy instance
+        model: The Question model class (must have a `version` column)
+    """
+
+    def __init__(self, db, model):
+        self.db = db
+        self.model = model
+
+    def apply(self, quiz_id, order=None, patches=None, versions=None):
+        """
+        Validate and write a batch in one transaction.
+
+        Args:
+            order: Optional list of every question id of the quiz in the new order
+            patches: Optional list of {"id", "version", ...fields as in update_question}
+            versions: Optional {id: version} the editor loaded, for ids that are
+                only reordered
+
+        Returns {"updated": n, "questions": [{"id", "version", "orderIndex"}]}.
+        Raises QuestionBatchError (400 invalid, 404 unknown ids, 409 conflict).
+        """
+        patches = patches or []
+        table = self.model.__table__
+
+        try:
+            patch_ids = [int(p['id']) for p in patches]
+            order = [int(i) for i in order] if order is not None else None
+        except (KeyError, TypeError, ValueError):
+            raise QuestionBatchError("Every patch needs a numeric id and order must list question ids")
+        try:
+            versions = {int(k): int(v) for k, v in (versions or {}).items()}
+            for patch in patches:
+                if patch.get('version') is not None:
+                    versions[int(patch['id'])] = int(patch['version'])
+        except (AttributeError, TypeError, ValueError):
+            raise QuestionBatchError("versions must map question ids to version numbers")
+        if len(set(patch_ids)) != len(patch_ids):
+            raise QuestionBatchError("A question can only be patched once per batch")
+        if not patches and order is None:
+            raise QuestionBatchError("Send an order, patches, or both")
+
+        # One read of every row the batch touches
+        query = self.db.session.query(table).filter(table.c.quiz_id == quiz_id)
+        if order is None:
+            query = query.filter(table.c.id.in_(patch_ids))
+        current = {row.id: row._asdict() for row in query}
+
+        missing = [i for i in patch_ids if i not in current]
+        if missing:
+            raise QuestionBatchError(f"Questions not found in this quiz: {missing}", 404)
+        if order is not None and (len(order) != len(current) or set(order) != set(current)):
+            raise QuestionBatchError("order must list every question of the quiz exactly once")
+
+        # Expected versions: what the editor loaded, else what was just read
+        expected = {qid: row['version'] for qid, row in current.items()}
+        stale = [{"id": qid, "currentVersion": current[qid]['version']}
+                 for qid, version in versions.items()
+                 if qid in current and version != current[qid]['version']]
+        if stale:
+            raise QuestionBatchError("Questions were changed by someone else; reload and try again.",
+                                     409, conflicts=stale)
+
+        new_rows = {qid: dict(row) for qid, row in current.items()}
+        if order is not None:
+            for position, qid in enumerate(order, start=1):
+                new_rows[qid]['order_index'] = position
+
+        errors = []
+        for number, patch in enumerate(patches, start=1):
+            qid = int(patch['id'])
+            validated, error = validate_record(_merge(_as_record(current[qid]), patch))
+            if error:
+                errors.append({"row": number, "id": qid, "message": error})
+                continue
+            validated.setdefault('options', None)
+            new_rows[qid].update(validated)
+        if errors:
+            raise QuestionBatchError(f"{len(errors)} invalid patches; nothing was saved.", errors=errors)
+
+        changed = [qid for qid, row in new_rows.items()
+                   if any(row[c] != current[qid][c] for c in EDITABLE_COLUMNS + ('order_index',))]
+        if changed:
+            written = self._write(quiz_id, [(qid, expected[qid], new_rows[qid]) for qid in changed])
+            if written != len(changed):
+                self.db.session.rollback()
+                fresh = dict(self.db.session.query(table.c.id, table.c.version)
+                             .filter(table.c.id.in_(changed)).all())
+                conflicts = [{"id": qid, "currentVersion": fresh.get(qid)}
+                             for qid in changed if fresh.get(qid) != expected[qid]] or \
+                            [{"id": qid, "currentVersion": fresh.get(qid)} for qid in changed]
+                raise QuestionBatchError("Questions were changed by someone else; reload and try again.",
+                                         409, conflicts=conflicts)
+            self.db.session.commit()
+
+        return {
+            "updated": len(changed),
+            "questions": [
+                {"id": qid,
+                 "version": expected[qid] + 1 if qid in changed else expected[qid],
+                 "orderIndex": new_rows[qid]['order_index']}
+                for qid in sorted(new_rows, key=lambda q: (new_rows[q]['order_index'] or 0, q))
+            ]
+        }
+
+    def _write(self, quiz_id, rows):
+        """Write (id, expected version, new values) rows; returns rows matched"""
+        table = self.model.__table__
+        session = self.db.session
+        serialized = [
+            (qid, version, row['order_index'], row['question_text'], row['question_type'],
+             row['option_a'], row['option_b'], row['option_c'], row['option_d'],
+             None if row['correct_answer'] is None else str(row['correct_answer']),
+             None if row['options'] is None else json.dumps(row['options']),
+             row['tag'], row['difficulty'])
+            for qid, version, row in rows
+        ]
+
+        if session.get_bind().dialect.name == 'postgresql':
+            v = values(
+                column('id', Integer), column('expected_version', Integer), column('order_index', Integer),
+                column('question_text', Text), column('question_type', Text),
+                column('option_a', Text), column('option_b', Text), column('option_c', Text),
+                column('option_d', Text), column('correct_answer', Text), column('options', Text),
+                column('tag', Text), column('difficulty', Text),
+                name='v'
+            ).data(serialized)
+            stmt = (
+                update(table)
+                .where(table.c.id == v.c.id,
+                       table.c.version == v.c.expected_version,
+                       table.c.quiz_id == quiz_id)
+                .values(order_index=v.c.order_index, question_text=v.c.question_text,
+                        question_type=v.c.question_type, option_a=v.c.option_a,
+                        option_b=v.c.option_b, option_c=v.c.option_c, option_d=v.c.option_d,
+                        correct_answer=v.c.correct_answer,
+                        options=cast(v.c.options, table.c.options.type),
+                        tag=v.c.tag, difficulty=v.c.difficulty,
+                        version=table.c.version + 1)
+            )
+            return session.execute(stmt).rowcount
+
+        # Without UPDATE ... FROM (VALUES): one executemany UPDATE, same checks
+        names = ('b_id', 'b_version', 'b_order_index', 'b_question_text', 'b_question_type',
+                 'b_option_a', 'b_option_b', 'b_option_c', 'b_option_d', 'b_correct_answer', 'b_options',
+                 'b_tag', 'b_difficulty')
+        stmt = (
+            table.update()
+            .where(table.c.id == bindparam('b_id'),
+                   table.c.version == bindparam('b_version'),
+                   table.c.quiz_id == quiz_id)
+            .values(order_index=bindparam('b_order_index'), question_text=bindparam('b_question_text'),
+                    question_type=bindparam('b_question_type'), option_a=bindparam('b_option_a'),
+                    option_b=bindparam('b_option_b'), option_c=bindparam('b_option_c'),
+                    option_d=bindparam('b_option_d'), correct_answer=bindparam('b_correct_answer'),
+                    options=bindparam('b_options', type_=Text),
+                    tag=bindparam('b_tag'), difficulty=bindparam('b_difficulty'),
+                    version=table.c.version + 1)
+        )
+        return session.execute(stmt, [dict(zip(names, row)) for row in serialized]).rowcount
@@ -0,0 +1,146 @@
+"""
+QuizFlow Question Sampling
+==========================
+Deterministic per-student question papers drawn from a quiz's pool.
+
+A quiz can draw `sample_size` questions from its pool (optionally stratified
+by question tag or difficulty) and shuffle each question's options. The
+paper is a pure function of the pool and a seed derived from the quiz id and
+the student's identity, so `get_quiz` and `submit_quiz` rebuild exactly the
+same paper and answer key without storing it or querying for it.
+
+The seed is an HMAC keyed with PAPER_SEED_SECRET (or SECRET_KEY), so students
+cannot compute each other's papers. There is no built-in default: without a
+configured secret, sampled and shuffled quizzes are refused (PaperSeedError)
+rather than seeded with a key anyone can read in the repository. Editing the pool during an exam changes the papers of
+students who have not yet submitted; freeze the pool before the exam starts.
+"""
+
+import hashlib
+import hmac
+import os
+import random
+
+from .essay_scoring import is_essay
+
+
+# Secret mixed into every paper seed (required for sampled/shuffled quizzes; shared by all workers)
+PAPER_SEED_SECRET = os.getenv('PAPER_SEED_SECRET') or os.getenv('SECRET_KEY') or None
+
+SAMPLE_BY_FIELDS = ('tag', 'difficulty')
+
+
+class PaperSeedError(Exception):
+    """Raised when a per-student paper is needed but no seed secret is configured."""
+
+    def __init__(self, message, status_code=503):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+class PaperItem:
+    """One question as it appears on a student's paper"""
+
+    __slots__ = ('question', 'option_order')
+
+    def __init__(self, question, option_order):
+        self.question = question
+        self.option_order = option_order   # displayed position -> original option index
+
+    @property
+    def options(self):
+        original = [self.question.option_a, self.question.option_b,
+                    self.question.option_c, self.question.option_d]
+        return [original[i] for i in self.option_order]
+
+    def displayed_index(self, original_index):
+        """Position at which an original option index is shown"""
+        return self.option_order.index(original_index)
+
+    @property
+    def correct_index(self):
+        """Correct answer as a displayed option index (None for essay questions)"""
+        if is_essay(self.question.question_type):
+            return None
+        return self.displayed_index(int(self.question.correct_answer))
+
+
+def paper_seed(quiz_id, student_key, secret=None):
+    """64-bit seed for one student's paper of one quiz; raises PaperSeedError without a secret"""
+    secret = secret or PAPER_SEED_SECRET
+    if not secret:
+        raise PaperSeedError("Per-student papers are not configured (set PAPER_SEED_SECRET)")
+    message = f"{quiz_id}:{(student_key or '').strip().lower()}".encode('utf-8')
+    digest = hmac.new(secret.encode('utf-8'), message, hashlib.sha256).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+
+def uses_sampling(quiz):
+    """True if the quiz's papers differ between students"""
+    return bool(quiz.sample_size) or bool(quiz.shuffle_options)
+
+
+def _allocate(strata, total):
+    """Split `total` picks across strata proportionally (largest remainder)"""
+    pool_size = sum(len(items) for items in strata.values())
+    quotas = {key: total * len(items) / pool_size for key, items in strata.items()}
+    counts = {key: min(len(strata[key]), int(quota)) for key, quota in quotas.items()}
+    remaining = total - sum(counts.values())
+    # Hand out the rest by largest remainder, skipping exhausted strata
+    for key in sorted(strata, key=lambda k: (quotas[k] - int(quotas[k]), str(k)), reverse=True):
+        if remaining <= 0:
+            break
+        if counts[key] < len(strata[key]):
+            counts[key] += 1
+            remaining -= 1
+    return counts
+
+
+def build_paper(questions, seed, sample_size=None, sample_by=None, shuffle_options=False):
+    """
+    Select and order a student's questions.
+
+    Args:
+        questions: The quiz's full question pool (any order)
+        seed: Value from paper_seed()
+        sample_size: Questions per paper; None or >= pool size means all
+        sample_by: Optional 'tag' or 'difficulty' to stratify the sample
+        shuffle_options: Shuffle the four options of multiple choice questions
+
+    Returns a list of PaperItem. Without sampling or shuffling the paper is
+    the pool in order_index order with options unchanged.
+    """
+    pool = sorted(questions, key=lambda q: (q.order_index or 0, q.id))
+    rng = random.Random(seed)
+
+    if sample_size and sample_size < len(pool):
+        if sample_by in SAMPLE_BY_FIELDS:
+            strata = {}
+            for question in pool:
+                strata.setdefault(getattr(question, sample_by) or '', []).append(question)
+            counts = _allocate(strata, sample_size)
+            chosen = []
+            for key in sorted(strata, key=str):
+                chosen.extend(rng.sample(strata[key], counts[key]))
+        else:
+            chosen = rng.sample(pool, sample_size)
+        rng.shuffle(chosen)
+    else:
+        chosen = pool
+
+    paper = []
+    for question in chosen:
+        order = [0, 1, 2, 3]
+        if shuffle_options and (question.question_type or 'multiple_choice') == 'multiple_choice':
+            rng.shuffle(order)
+        paper.append(PaperItem(question, order))
+    return paper
+
+
+def paper_for(quiz, questions, student_key):
+    """The paper a given student sees for a quiz"""
+    if not uses_sampling(quiz):
+        return build_paper(questions, 0)
+    return build_paper(questions, paper_seed(quiz.id, student_key), sample_size=quiz.sample_size,
+                       sample_by=quiz.sample_by, shuffle_options=quiz.shuffle_options)
@@ -0,0 +1,446 @@
+"""
+QuizFlow Question Search
+========================
+Full-text search and near-duplicate detection over the whole question bank.
+
+Search covers each question's text and its four options:
+
+    PostgreSQL   to_tsvector('english', ...) matched against a GIN expression
+                 index (ix_questions_search), ranked with ts_rank_cd
+    others       an in-process inverted index ranked with BM25
+
+Query terms are ANDed. A term ending in '*' matches as a prefix, and the last
+term always does, so the endpoint works for search-as-you-type.
+
+Near duplicates are found with MinHash signatures over character 5-shingles of
+the normalized question text (robust to punctuation, case and small edits),
+bucketed with locality-sensitive hashing (bands of rows), and confirmed with
+the exact Jaccard similarity of the shingle sets. Candidates therefore cost a
+few dict lookups instead of a comparison against every question in the bank.
+
+The in-process structures are refreshed incrementally: each call reads the
+(id, version) pairs of all questions and re-indexes only rows that are new or
+changed. Edits that bypass the version column (raw SQL) are picked up when the
+process restarts.
+"""
+
+import hashlib
+import math
+import os
+import re
+import threading
+from bisect import bisect_left
+
+from sqlalchemy import func, select, text
+
+
+# Results returned by one search at most
+SEARCH_MAX_RESULTS = int(os.getenv('SEARCH_MAX_RESULTS', '100'))
+
+# Estimated Jaccard similarity at which two questions count as near duplicates
+DUPLICATE_THRESHOLD = float(os.getenv('DUPLICATE_THRESHOLD', '0.8'))
+
+# MinHash signature length and LSH banding (bands * rows == permutations)
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16
+LSH_ROWS = MINHASH_PERMUTATIONS // LSH_BANDS
+SHINGLE_SIZE = 5
+
+# Document expression shared by the GIN index and the search query; they must
+# match exactly for PostgreSQL to use the index
+SEARCH_DOCUMENT_SQL = (
+    "to_tsvector('english', coalesce(question_text, '') || ' ' || coalesce(option_a, '') || ' ' || "
+    "coalesce(option_b, '') || ' ' || coalesce(option_c, '') || ' ' || coalesce(option_d, ''))"
+)
+SEARCH_INDEX_DDL = f"CREATE INDEX IF NOT EXISTS ix_questions_search ON questions USING GIN ({SEARCH_DOCUMENT_SQL})"
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_QUERY_TERM = re.compile(r"[A-Za-z0-9]+\*?")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has in is it its of on or that the this to was were which with".split()
+)
+
+# BM25 parameters
+_K1 = 1.2
+_B = 0.75
+
+# Added per bin of distance when densifying, so borrowed values never collide
+# with a bin's own minimum
+_DENSIFY_OFFSET = 1 << 64
+
+
+class QuestionSearchError(Exception):
+    """Raised for unusable search queries."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+# ============================================================================
+# TEXT PROCESSING
+# ============================================================================
+
+def tokenize(value):
+    return _TOKEN.findall((value or '').lower())
+
+
+def parse_query(query):
+    """
+    Split a query into (term, is_prefix) pairs.
+
+    Stopwords are dropped unless they are prefixes; the last term is always
+    a prefix.
+    """
+    raw = _QUERY_TERM.findall(query or '')
+    terms = []
+    for position, word in enumerate(raw):
+        is_prefix = word.endswith('*') or position == len(raw) - 1
+        word = word.rstrip('*').lower()
+        if word and (is_prefix or word not in STOPWORDS):
+            terms.append((word, is_prefix))
+    return terms
+
+
+def question_document(row):
+    """Searchable text of a question row (text and options)"""
+    return ' '.join(part for part in (row.question_text, row.option_a, row.option_b,
+                                      row.option_c, row.option_d) if part)
+
+
+def shingles(value, size=SHINGLE_SIZE):
+    """Set of hashed character n-grams of the normalized text"""
+    normalized = ' '.join(tokenize(value))
+    if len(normalized) <= size:
+        grams = [normalized] if normalized else []
+    else:
+        grams = [normalized[i:i + size] for i in range(len(normalized) - size + 1)]
+    return {int.from_bytes(hashlib.blake2b(g.encode('utf-8'), digest_size=8).digest(), 'big')
+            for g in grams}
+
+
+def minhash(shingle_set):
+    """
+    MinHash signature (tuple of MINHASH_PERMUTATIONS ints) of a shingle set.
+
+    One-permutation hashing: each shingle hash is read once, its low bits
+    pick a bin and the rest compete for that bin's minimum. Empty bins
+    borrow the next filled bin's value (rotation densification), so
+    signatures of similar sets still agree bin by bin.
+    """
+    if not shingle_set:
+        return None
+    bins = [None] * MINHASH_PERMUTATIONS
+    for h in shingle_set:
+        slot, value = h % MINHASH_PERMUTATIONS, h // MINHASH_PERMUTATIONS
+        if bins[slot] is None or value < bins[slot]:
+            bins[slot] = value
+    signature = list(bins)
+    for slot in range(MINHASH_PERMUTATIONS):
+        distance = 1
+        while signature[slot] is None:
+            borrowed = bins[(slot + distance) % MINHASH_PERMUTATIONS]
+            if borrowed is not None:
+                signature[slot] = borrowed + distance * _DENSIFY_OFFSET
+            distance += 1
+    return tuple(signature)
+
+
+def _bands(signature):
+    return [(band, signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]) for band in range(LSH_BANDS)]
+
+
+def jaccard(left, right):
+    if not left or not right:
+        return 0.0
+    return len(left & right) / len(left | right)
+
+
+# ============================================================================
+# INDEX
+# ============================================================================
+
+class _Entry:
+    __slots__ = ('quiz_id', 'version', 'terms', 'length', 'shingles', 'signature')
+
+    def __init__(self, quiz_id, version, terms, length, shingle_set, signature):
+        self.quiz_id = quiz_id
+        self.version = version
+        self.terms = terms              # term -> frequency
+        self.length = length
+        self.shingles = shingle_set
+        self.signature = signature
+
+
+class QuestionSearchIndex:
+    """
+    Search and near-duplicate lookup over every question.
+
+    Args:
+        db: Flask-SQLAlchemy instance
+        model: The Question model class (must have a `version` column)
+        quiz_model: The Quiz model class, for result titles
+    """
+
+    def __init__(self, db, model, quiz_model):
+        self.db = db
+        self.model = model
+        self.quiz_model = quiz_model
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._postings = {}             # term -> {question id: frequency}
+        self._vocabulary = []           # sorted terms, for prefix lookups
+        self._vocabulary_dirty = False
+        self._total_length = 0
+        self._buckets = {}              # (band, rows) -> {question ids}
+
+    def _use_postgres(self):
+        return self.db.session.get_bind().dialect.name == 'postgresql'
+
+    # ------------------------------------------------------------------ sync
+
+    def refresh(self):
+        """Bring the in-process index up to date; returns rows (re)indexed"""
+        table = self.model.__table__
+        session = self.db.session
+        current = {row.id: row.version or 1
+                   for row in session.execute(select(table.c.id, table.c.version))}
+        with self._lock:
+            removed = [qid for qid in self._entries if qid not in current]
+            changed = [qid for qid, version in current.items()
+                       if qid not in self._entries or self._entries[qid].version != version]
+            for qid in removed:
+                self._remove(qid)
+            for start in range(0, len(changed), 500):
+                ids = changed[start:start + 500]
+                rows = session.execute(
+                    select(table.c.id, table.c.quiz_id, table.c.version, table.c.question_text,
+                           table.c.option_a, table.c.option_b, table.c.option_c, table.c.option_d)
+                    .where(table.c.id.in_(ids))
+                )
+                for row in rows:
+                    self._remove(row.id)
+                    self._add(row)
+        return len(changed)
+
+    def _add(self, row):
+        tokens = tokenize(question_document(row))
+        terms = {}
+        for token in tokens:
+            terms[token] = terms.get(token, 0) + 1
+        shingle_set = shingles(row.question_text)
+        entry = _Entry(row.quiz_id, row.version or 1, terms, len(tokens), shingle_set, minhash(shingle_set))
+        self._entries[row.id] = entry
+        self._total_length += entry.length
+        for term, frequency in terms.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                self._vocabulary_dirty = True
+            postings[row.id] = frequency
+        if entry.signature:
+            for key in _bands(entry.signature):
+                self._buckets.setdefault(key, set()).add(row.id)
+
+    def _remove(self, qid):
+        entry = self._entries.pop(qid, None)
+        if entry is None:
+            return
+        self._total_length -= entry.length
+        for term in entry.terms:
+            postings = self._postings[term]
+            postings.pop(qid, None)
+            if not postings:
+                del self._postings[term]
+                self._vocabulary_dirty = True
+        if entry.signature:
+            for key in _bands(entry.signature):
+                bucket = self._buckets.get(key)
+                if bucket is not None:
+                    bucket.discard(qid)
+                    if not bucket:
+                        del self._buckets[key]
+
+    def _expand(self, term, is_prefix):
+        if not is_prefix:
+            return [term] if term in self._postings else []
+        if self._vocabulary_dirty:
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_dirty = False
+        matches = []
+        for position in range(bisect_left(self._vocabulary, term), len(self._vocabulary)):
+            if not self._vocabulary[position].startswith(term):
+                break
+            matches.append(self._vocabulary[position])
+        return matches
+
+    # ---------------------------------------------------------------- search
+
+    def search(self, query, quiz_id=None, limit=20, offset=0):
+        """
+        Ranked search over question text and options.
+
+        Returns {"total": n, "results": [{"id", "quizId", "quizTitle",
+        "questionText", "questionType", "score"}]}.
+        """
+        terms = parse_query(query)
+        if not terms:
+            raise QuestionSearchError("Search query must contain at least one word")
+        limit = max(1, min(int(limit), SEARCH_MAX_RESULTS))
+        offset = max(0, int(offset))
+
+        if self._use_postgres():
+            ranked, total = self._search_postgres(terms, quiz_id, limit, offset)
+        else:
+            ranked, total = self._search_memory(terms, quiz_id, limit, offset)
+        return {"total": total, "results": self._hydrate(ranked)}
+
+    def _search_postgres(self, terms, quiz_id, limit, offset):
+        table = self.model.__table__
+        tsquery = ' & '.join(f"{term}:*" if is_prefix else term for term, is_prefix in terms)
+        document = text(SEARCH_DOCUMENT_SQL)
+        matches = text(f"{SEARCH_DOCUMENT_SQL} @@ to_tsquery('english', :tsquery)").bindparams(tsquery=tsquery)
+        rank = func.ts_rank_cd(document, func.to_tsquery('english', tsquery)).label('score')
+
+        base = select(table.c.id, rank).where(matches)
+        if quiz_id is not None:
+            base = base.where(table.c.quiz_id == quiz_id)
+        session = self.db.session
+        total = session.execute(select(func.count()).select_from(base.subquery())).scalar()
+        rows = session.execute(base.order_by(rank.desc(), table.c.id).limit(limit).offset(offset)).all()
+        return [(row.id, float(row.score)) for row in rows], total
+
+    def _search_memory(self, terms, quiz_id, limit, offset):
+        self.refresh()
+        with self._lock:
+            if not self._entries:
+                return [], 0
+            document_count = len(self._entries)
+            average_length = self._total_length / document_count or 1
+            scores = None
+            for term, is_prefix in terms:
+                term_scores = {}
+                for word in self._expand(term, is_prefix):
+                    postings = self._postings[word]
+                    idf = math.log(1 + (document_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for qid, frequency in postings.items():
+                        length = self._entries[qid].length
+                        weight = idf * frequency * (_K1 + 1) / (
+                            frequency + _K1 * (1 - _B + _B * length / average_length))
+                        term_scores[qid] = max(term_scores.get(qid, 0.0), weight)
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {qid: score + term_scores[qid] for qid, score in scores.items() if qid in term_scores}
+                if not scores:
+                    return [], 0
+            if quiz_id is not None:
+                scores = {qid: s for qid, s in scores.items() if self._entries[qid].quiz_id == quiz_id}
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [(qid, round(score, 4)) for qid, score in ranked[offset:offset + limit]], len(ranked)
+
+    def _hydrate(self, ranked):
+        if not ranked:
+            return []
+        table, quizzes = self.model.__table__, self.quiz_model.__table__
+        rows = self.db.session.execute(
+            select(table.c.id, table.c.quiz_id, table.c.question_text, table.c.question_type, quizzes.c.title)
+            .join(quizzes, quizzes.c.id == table.c.quiz_id)
+            .where(table.c.id.in_([qid for qid, _ in ranked]))
+        )
+        by_id = {row.id: row for row in rows}
+        return [{
+            "id": qid,
+            "quizId": by_id[qid].quiz_id,
+            "quizTitle": by_id[qid].title,
+            "questionText": by_id[qid].question_text,
+            "questionType": by_id[qid].question_type or 'multiple_choice',
+            "score": score
+        } for qid, score in ranked if qid in by_id]
+
+    # ------------------------------------------------------------ duplicates
+
+    def _candidates(self, signature):
+        found = set()
+        for key in _bands(signature):
+            found |= self._buckets.get(key, set())
+        return found
+
+    def find_duplicates(self, texts, threshold=DUPLICATE_THRESHOLD, quiz_id=None):
+        """
+        Flag near duplicates of new question texts.
+
+        Each text is compared with the bank (optionally one quiz) and with the
+        texts before it in the list. Returns one entry per flagged text:
+        {"index", "matches": [{"questionId" | "index", "similarity"}]}.
+        """
+        self.refresh()
+        flagged = []
+        seen = {}                                   # index -> shingles of earlier texts
+        seen_buckets = {}                           # LSH buckets of earlier texts
+        with self._lock:
+            for index, value in enumerate(texts):
+                shingle_set = shingles(value)
+                signature = minhash(shingle_set)
+                if signature is None:
+                    continue
+                matches = []
+                for qid in self._candidates(signature):
+                    entry = self._entries[qid]
+                    if quiz_id is not None and entry.quiz_id != quiz_id:
+                        continue
+                    similarity = jaccard(shingle_set, entry.shingles)
+                    if similarity >= threshold:
+                        matches.append({"questionId": qid, "quizId": entry.quiz_id,
+                                        "similarity": round(similarity, 3)})
+                earlier = set()
+                for key in _bands(signature):
+                    bucket = seen_buckets.setdefault(key, [])
+                    earlier.update(bucket)
+                    bucket.append(index)
+                for other in sorted(earlier):
+                    similarity = jaccard(shingle_set, seen[other])
+                    if similarity >= threshold:
+                        matches.append({"index": other, "similarity": round(similarity, 3)})
+                seen[index] = shingle_set
+                if matches:
+                    matches.sort(key=lambda m: -m["similarity"])
+                    flagged.append({"index": index, "matches": matches})
+        return flagged
+
+    def duplicate_groups(self, threshold=DUPLICATE_THRESHOLD, quiz_id=None):
+        """
+        Clusters of near-duplicate questions already in the bank.
+
+        Returns a list of sorted id lists (largest clusters first).
+        """
+        self.refresh()
+        with self._lock:
+            parent = {}
+
+            def root(qid):
+                while parent.get(qid, qid) != qid:
+                    qid = parent[qid]
+                return qid
+
+            checked = set()
+            for bucket in self._buckets.values():
+                if len(bucket) < 2:
+                    continue
+                members = sorted(qid for qid in bucket
+                                 if quiz_id is None or self._entries[qid].quiz_id == quiz_id)
+                for i, left in enumerate(members):
+                    for right in members[i + 1:]:
+                        if (left, right) in checked:
+                            continue
+                        checked.add((left, right))
+                        if jaccard(self._entries[left].shingles, self._entries[right].shingles) >= threshold:
+                            parent[root(right)] = root(left)
+
+            groups = {}
+            for qid in parent:
+                groups.setdefault(root(qid), set()).add(qid)
+        clusters = [sorted(members | {head}) for head, members in groups.items()]
+        return sorted(clusters, key=lambda c: (-len(c), c[0]))
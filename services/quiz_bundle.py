@@ -0,0 +1,382 @@
+"""
+QuizFlow Quiz Bundles
+=====================
+Versioned, gzip-compressed JSON-lines archives for moving quizzes between
+environments.
+
+A bundle is one JSON object per line:
+
+    {"type": "header", "format": "quizflow-bundle", "version": 1, ...}
+    {"type": "quiz", "title": ..., "timeLimit": ..., ...}
+    {"type": "question", "ref": 17, "questionText": ..., ...}      x N
+    {"type": "submission", "email": ..., "score": ..., ...}        x M (optional)
+    {"type": "footer", "counts": {"question": N, "submission": M}}
+
+Export streams rows from a server-side cursor straight into a gzip
+compressor, and import decompresses line by line and inserts in
+executemany batches of BUNDLE_BATCH_SIZE rows, so both run in constant
+memory regardless of quiz size. An import runs in one transaction and is
+rolled back if the footer counts do not match what was read.
+"""
+
+import gzip
+import io
+import json
+import os
+import zlib
+from datetime import datetime
+
+from sqlalchemy import insert, select
+
+
+BUNDLE_FORMAT = 'quizflow-bundle'
+BUNDLE_VERSION = 1
+SUPPORTED_BUNDLE_VERSIONS = (1,)
+
+# Rows per executemany INSERT and per server-side cursor fetch
+BUNDLE_BATCH_SIZE = int(os.getenv('BUNDLE_BATCH_SIZE', 1000))
+
+
+class QuizBundleError(Exception):
+    """Raised when a bundle is malformed or cannot be imported."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _decode_time(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+class _Prefixed(io.RawIOBase):
+    """Stream with some already-read bytes pushed back in front"""
+
+    def __init__(self, prefix, stream):
+        self._prefix = prefix
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._prefix:
+            n = min(len(buffer), len(self._prefix))
+            buffer[:n] = self._prefix[:n]
+            self._prefix = self._prefix[n:]
+            return n
+        data = self._stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+# ============================================================================
+# QUIZ BUNDLES
+# ============================================================================
+
+class QuizBundle:
+    """
+    Export and import quizzes as bundles.
+
+    Args:
+        db: Flask-SQLAlchemy instance
+        quiz_model, question_model, submission_model, user_model: Model classes
+    """
+
+    def __init__(self, db, quiz_model, question_model, submission_model, user_model,
+                 batch_size=BUNDLE_BATCH_SIZE):
+        self.db = db
+        self.quizzes = quiz_model.__table__
+        self.questions = question_model.__table__
+        self.submissions = submission_model.__table__
+        self.users = user_model.__table__
+        self.batch_size = batch_size
+
+    # ------------------------------------------------------------------
+    # Export
+    # ------------------------------------------------------------------
+
+    def records(self, quiz_id, include_submissions=False):
+        """Yield the bundle's records (dicts) in order"""
+        session = self.db.session
+        quiz = session.execute(select(self.quizzes).where(self.quizzes.c.id == quiz_id)).mappings().first()
+        if quiz is None:
+            raise QuizBundleError("Quiz not found", 404)
+
+        yield {"type": "header", "format": BUNDLE_FORMAT, "version": BUNDLE_VERSION,
+               "exportedAt": datetime.utcnow(), "includesSubmissions": include_submissions}
+        yield {"type": "quiz", "title": quiz['title'], "description": quiz['description'],
+               "timeLimit": quiz['time_limit'], "timePerQuestion": quiz['time_per_question'],
+               "isActive": quiz['is_active'], "accessCode": quiz['quiz_access_code'],
+               "sampleSize": quiz['sample_size'], "sampleBy": quiz['sample_by'],
+               "shuffleOptions": bool(quiz['shuffle_options']),
+               "createdAt": quiz['created_at']}
+
+        counts = {"question": 0, "submission": 0}
+        q = self.questions
+        rows = session.execute(
+            select(q).where(q.c.quiz_id == quiz_id).order_by(q.c.order_index, q.c.id)
+            .execution_options(yield_per=self.batch_size)
+        ).mappings()
+        for row in rows:
+            counts["question"] += 1
+            yield {"type": "question", "ref": row['id'], "questionText": row['question_text'],
+                   "questionType": row['question_type'], "optionA": row['option_a'],
+                   "optionB": row['option_b'], "optionC": row['option_c'], "optionD": row['option_d'],
+                   "options": row['options'], "correctAnswer": row['correct_answer'],
+                   "tag": row['tag'], "difficulty": row['difficulty'],
+                   "orderIndex": row['order_index']}
+
+        if include_submissions:
+            s, u = self.submissions, self.users
+            condition = s.c.quiz_id == quiz_id
+            if quiz['quiz_access_code']:
+                # Submissions saved before quiz_id was recorded are matched by access code
+                condition = condition | ((s.c.quiz_id.is_(None)) & (s.c.access_code == quiz['quiz_access_code']))
+            rows = session.execute(
+                select(s, u.c.email, u.c.name).join(u, u.c.id == s.c.user_id)
+                .where(condition).order_by(s.c.id)
+                .execution_options(yield_per=self.batch_size)
+            ).mappings()
+            for row in rows:
+                counts["submission"] += 1
+                yield {"type": "submission", "submissionId": row['submission_id'],
+                       "email": row['email'], "name": row['name'], "score": row['score'],
+                       "totalQuestions": row['total_questions'], "percentage": row['percentage'],
+                       "feedback": row['feedback'], "submittedAt": row['submitted_at'],
+                       "detailedResults": row['detailed_results'], "accessCode": row['access_code'],
+                       "quizStartTime": row['quiz_start_time'],
+                       "quizDurationSeconds": row['quiz_duration_seconds'],
+                       "essayStatus": row['essay_status']}
+
+        yield {"type": "footer", "counts": counts}
+
+    def export(self, quiz_id, include_submissions=False, compresslevel=6):
+        """
+        Yield the gzip-compressed bundle as byte chunks.
+
+        A missing quiz raises QuizBundleError on the first next(), before any
+        bytes are produced.
+        """
+        compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, 31)  # 31: gzip container
+        pending = []
+        pending_size = 0
+        for record in self.records(quiz_id, include_submissions):
+            pending.append(json.dumps(record, default=_encode, separators=(',', ':')) + '\n')
+            pending_size += len(pending[-1])
+            if pending_size >= 64 * 1024:
+                out = compressor.compress(''.join(pending).encode('utf-8'))
+                pending, pending_size = [], 0
+                if out:
+                    yield out
+        yield compressor.compress(''.join(pending).encode('utf-8')) + compressor.flush()
+
+    # ------------------------------------------------------------------
+    # Import
+    # ------------------------------------------------------------------
+
+    def import_stream(self, stream, include_submissions=True, title=None):
+        """
+        Import a bundle from a binary stream (gzip or plain JSON lines).
+
+        Creates a new, inactive quiz. Students are matched by email and
+        created if missing; submissions whose submissionId already exists
+        are skipped. Returns a summary dict.
+        """
+        magic = stream.read(2)
+        raw = io.BufferedReader(_Prefixed(magic, stream))
+        if magic == b'\x1f\x8b':
+            raw = gzip.GzipFile(fileobj=raw, mode='rb')
+        lines = io.TextIOWrapper(raw, encoding='utf-8')
+
+        session = self.db.session
+        summary = {"quizId": None, "questions": 0, "submissions": 0, "skippedSubmissions": 0,
+                   "createdStudents": 0, "warnings": []}
+        state = {"header": None, "quiz_id": None, "footer": None, "refs": {}}
+        questions, submissions = [], []
+        try:
+            for number, line in enumerate(lines, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise QuizBundleError(f"Line {number}: invalid JSON ({e.msg})")
+                kind = record.get('type') if isinstance(record, dict) else None
+
+                if state["footer"] is not None:
+                    raise QuizBundleError(f"Line {number}: data after footer")
+                if state["header"] is None:
+                    self._check_header(record)
+                    state["header"] = record
+                elif kind == 'quiz':
+                    if state["quiz_id"] is not None:
+                        raise QuizBundleError(f"Line {number}: bundle contains more than one quiz")
+                    state["quiz_id"] = self._insert_quiz(record, title, summary)
+                    summary["quizId"] = state["quiz_id"]
+                elif kind == 'question':
+                    self._require_quiz(state, number)
+                    questions.append(record)
+                    if len(questions) >= self.batch_size:
+                        self._insert_questions(state, questions, summary)
+                        questions = []
+                elif kind == 'submission':
+                    self._require_quiz(state, number)
+                    if questions:
+                        self._insert_questions(state, questions, summary)
+                        questions = []
+                    if not include_submissions:
+                        continue
+                    submissions.append(record)
+                    if len(submissions) >= self.batch_size:
+                        self._insert_submissions(state, submissions, summary)
+                        submissions = []
+                elif kind == 'footer':
+                    state["footer"] = record
+                else:
+                    raise QuizBundleError(f"Line {number}: unknown record type {kind!r}")
+
+            if state["header"] is None or state["quiz_id"] is None:
+                raise QuizBundleError("Bundle is empty or has no quiz record")
+            if state["footer"] is None:
+                raise QuizBundleError("Bundle is truncated (no footer)")
+            if questions:
+                self._insert_questions(state, questions, summary)
+            if submissions:
+                self._insert_submissions(state, submissions, summary)
+
+            expected = state["footer"].get('counts') or {}
+            if expected.get('question', summary["questions"]) != summary["questions"]:
+                raise QuizBundleError(f"Bundle declares {expected['question']} questions but "
+                                      f"contains {summary['questions']}")
+            read_submissions = summary["submissions"] + summary["skippedSubmissions"]
+            if include_submissions and expected.get('submission', read_submissions) != read_submissions:
+                raise QuizBundleError(f"Bundle declares {expected['submission']} submissions but "
+                                      f"contains {read_submissions}")
+            session.commit()
+        except (OSError, EOFError, UnicodeDecodeError) as e:
+            session.rollback()
+            raise QuizBundleError(f"Could not read bundle: {str(e)}")
+        except Exception:
+            session.rollback()
+            raise
+        return summary
+
+    @staticmethod
+    def _check_header(record):
+        if not isinstance(record, dict) or record.get('type') != 'header' or record.get('format') != BUNDLE_FORMAT:
+            raise QuizBundleError("Not a QuizFlow bundle (missing header)")
+        if record.get('version') not in SUPPORTED_BUNDLE_VERSIONS:
+            raise QuizBundleError(f"Unsupported bundle version {record.get('version')}; "
+                                  f"this server reads versions {list(SUPPORTED_BUNDLE_VERSIONS)}")
+
+    @staticmethod
+    def _require_quiz(state, number):
+        if state["quiz_id"] is None:
+            raise QuizBundleError(f"Line {number}: record before the quiz record")
+
+    def _insert_quiz(self, record, title, summary):
+        session = self.db.session
+        access_code = record.get('accessCode')
+        if access_code and session.execute(
+                select(self.quizzes.c.id).where(self.quizzes.c.quiz_access_code == access_code)).first():
+            summary["warnings"].append(f"Access code {access_code} is already in use; imported quiz has none")
+            access_code = None
+        if record.get('isActive'):
+            summary["warnings"].append("Imported quiz is inactive; activate it when ready")
+
+        result = session.execute(insert(self.quizzes).values(
+            title=title or record.get('title') or 'Imported quiz',
+            description=record.get('description'),
+            time_limit=record.get('timeLimit') or 1200,
+            time_per_question=record.get('timePerQuestion') or 30,
+            is_active=False,
+            quiz_access_code=access_code,
+            sample_size=record.get('sampleSize'),
+            sample_by=record.get('sampleBy'),
+            shuffle_options=bool(record.get('shuffleOptions'))
+        ))
+        return result.inserted_primary_key[0]
+
+    def _insert_questions(self, state, records, summary):
+        quiz_id = state["quiz_id"]
+        rows = [{
+            'quiz_id': quiz_id,
+            'question_text': r.get('questionText') or '',
+            'question_type': r.get('questionType') or 'multiple_choice',
+            'option_a': r.get('optionA'), 'option_b': r.get('optionB'),
+            'option_c': r.get('optionC'), 'option_d': r.get('optionD'),
+            'options': r.get('options'),
+            'correct_answer': '' if r.get('correctAnswer') is None else str(r.get('correctAnswer')),
+            'tag': r.get('tag'), 'difficulty': r.get('difficulty'),
+            'order_index': r.get('orderIndex') or 0
+        } for r in records]
+        session = self.db.session
+        q = self.questions
+        result = session.execute(insert(q).returning(q.c.id, sort_by_parameter_order=True), rows)
+        for record, new_id in zip(records, result.scalars()):
+            if record.get('ref') is not None:
+                state["refs"][record['ref']] = new_id
+        summary["questions"] += len(rows)
+
+    def _insert_submissions(self, state, records, summary):
+        session = self.db.session
+        s, u = self.submissions, self.users
+
+        ids = [r.get('submissionId') for r in records]
+        existing = set(session.execute(select(s.c.submission_id).where(s.c.submission_id.in_(ids))).scalars())
+        fresh = [r for r in records if r.get('submissionId') and r['submissionId'] not in existing]
+        summary["skippedSubmissions"] += len(records) - len(fresh)
+        if not fresh:
+            return
+
+        emails = {r['email'] for r in fresh if r.get('email')}
+        users = dict(session.execute(select(u.c.email, u.c.id).where(u.c.email.in_(emails))).all())
+        missing = {}
+        for r in fresh:
+            if r.get('email') and r['email'] not in users and r['email'] not in missing:
+                missing[r['email']] = {'name': r.get('name') or r['email'], 'email': r['email'],
+                                       'password': r.get('accessCode') or ''}
+        if missing:
+            result = session.execute(insert(u).returning(u.c.email, u.c.id, sort_by_parameter_order=True),
+                                     list(missing.values()))
+            users.update(dict(result.all()))
+            summary["createdStudents"] += len(missing)
+
+        refs = state["refs"]
+        rows = []
+        for r in fresh:
+            if r.get('email') not in users:
+                summary["skippedSubmissions"] += 1
+                continue
+            detailed = r.get('detailedResults')
+            if isinstance(detailed, list):
+                detailed = [dict(item, id=refs.get(item.get('id'), item.get('id'))) if isinstance(item, dict) else item
+                            for item in detailed]
+            rows.append({
+                'submission_id': r['submissionId'],
+                'user_id': users[r['email']],
+                'quiz_id': state["quiz_id"],
+                'score': r.get('score') or 0,
+                'total_questions': r.get('totalQuestions') or 0,
+                'percentage': r.get('percentage') or 0.0,
+                'feedback': r.get('feedback'),
+                'submitted_at': _decode_time(r.get('submittedAt')),
+                'detailed_results': detailed,
+                'access_code': r.get('accessCode'),
+                'quiz_start_time': _decode_time(r.get('quizStartTime')),
+                'quiz_duration_seconds': r.get('quizDurationSeconds'),
+                'essay_status': r.get('essayStatus'),
+                'essay_revision': 0
+            })
+        if rows:
+            session.execute(insert(s), rows)
+            summary["submissions"] += len(rows)
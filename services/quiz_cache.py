@@ -0,0 +1,208 @@
+"""
+QuizFlow Quiz Cache
+===================
+Per-quiz snapshots of settings and questions (the answer key) for the
+student-facing endpoints.
+
+Many quizzes can run at once, each identified by its id or access code.
+`get_quiz`, session start and `submit_quiz` read the quiz they were asked
+for from this cache instead of querying the quiz and its questions on every
+request, and instead of falling back to a single global "active" quiz.
+
+Snapshots are immutable (SQLAlchemy Row objects with attribute access), so
+readers share them without copying or locking. Each quiz has its own load
+lock: when a class of 500 opens a quiz at once, one request loads it while
+the rest wait for that quiz only, and other quizzes are unaffected.
+
+Admin endpoints that change a quiz call invalidate(). Other worker processes
+see changes after QUIZ_CACHE_TTL seconds; avoid editing a quiz's questions
+while its exam is running.
+"""
+
+import os
+import threading
+import time
+
+from sqlalchemy import select
+
+
+# Seconds a loaded quiz (and an access code lookup) is reused
+QUIZ_CACHE_TTL = float(os.getenv('QUIZ_CACHE_TTL', '30'))
+
+
+class QuizLookupError(Exception):
+    """Raised when a request does not identify exactly one quiz."""
+
+    def __init__(self, message, status_code=404):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+class QuizSnapshot:
+    """A quiz row and its questions in order_index order"""
+
+    __slots__ = ('quiz', 'questions', 'loaded_at', '_derived')
+
+    def __init__(self, quiz, questions):
+        self.quiz = quiz
+        self.questions = questions
+        self.loaded_at = time.monotonic()
+        self._derived = {}
+
+    @property
+    def id(self):
+        return self.quiz.id
+
+    def memo(self, key, build):
+        """
+        A value derived from this snapshot, built on first use.
+
+        Derived values (e.g. the rendered student payload) live and die with
+        the snapshot, so invalidate() drops them too. Callers must treat them
+        as read-only.
+        """
+        value = self._derived.get(key)
+        if value is None:
+            value = self._derived.setdefault(key, build())
+        return value
+
+
+class QuizCache:
+    """
+    Args:
+        db: Flask-SQLAlchemy instance
+        quiz_model: The Quiz model class
+        question_model: The Question model class
+        ttl: Seconds before a snapshot is reloaded
+        codes: Optional AccessCodeResolver; access codes are then mapped to
+            quiz ids from its in-memory index instead of a query
+    """
+
+    def __init__(self, db, quiz_model, question_model, ttl=QUIZ_CACHE_TTL, codes=None):
+        self.db = db
+        self.quizzes = quiz_model.__table__
+        self.questions = question_model.__table__
+        self.ttl = ttl
+        self.codes = codes
+        self._snapshots = {}         # quiz id -> QuizSnapshot
+        self._codes = {}             # access code -> (quiz id, expires at)
+        self._active = None          # (quiz ids, expires at)
+        self._load_locks = {}        # quiz id -> Lock
+        self._lock = threading.Lock()
+
+    def _fresh(self, snapshot):
+        return snapshot is not None and time.monotonic() - snapshot.loaded_at < self.ttl
+
+    def get(self, quiz_id):
+        """Snapshot of a quiz, or None if it does not exist"""
+        snapshot = self._snapshots.get(quiz_id)
+        if self._fresh(snapshot):
+            return snapshot
+        with self._lock:
+            load_lock = self._load_locks.setdefault(quiz_id, threading.Lock())
+        with load_lock:
+            snapshot = self._snapshots.get(quiz_id)
+            if self._fresh(snapshot):
+                return snapshot
+            snapshot = self._load(quiz_id)
+            if snapshot is None:
+                self._snapshots.pop(quiz_id, None)
+            else:
+                self._snapshots[quiz_id] = snapshot
+            return snapshot
+
+    def _load(self, quiz_id):
+        session = self.db.session
+        quiz = session.execute(select(self.quizzes).where(self.quizzes.c.id == quiz_id)).first()
+        if quiz is None:
+            return None
+        q = self.questions
+        questions = tuple(session.execute(
+            select(q).where(q.c.quiz_id == quiz_id).order_by(q.c.order_index, q.c.id)).all())
+        return QuizSnapshot(quiz, questions)
+
+    def by_code(self, code):
+        """Snapshot of the quiz with this access code, or None"""
+        if self.codes is not None:
+            quiz_id = self.codes.quiz_id_for(code)
+            if quiz_id is None:
+                return None
+            snapshot = self.get(quiz_id)
+            return snapshot if snapshot is not None and snapshot.quiz.quiz_access_code == code else None
+        entry = self._codes.get(code)
+        if entry is None or entry[1] < time.monotonic():
+            quiz_id = self.db.session.execute(
+                select(self.quizzes.c.id).where(self.quizzes.c.quiz_access_code == code)).scalar()
+            if quiz_id is None:
+                return None
+            self._codes[code] = (quiz_id, time.monotonic() + self.ttl)
+        else:
+            quiz_id = entry[0]
+        snapshot = self.get(quiz_id)
+        if snapshot is None or snapshot.quiz.quiz_access_code != code:
+            # The code moved to another quiz; look it up again next time
+            self._codes.pop(code, None)
+            return None
+        return snapshot
+
+    def active_ids(self):
+        """Ids of every active quiz"""
+        active = self._active
+        if active is None or active[1] < time.monotonic():
+            ids = tuple(self.db.session.execute(
+                select(self.quizzes.c.id).where(self.quizzes.c.is_active.is_(True))
+                .order_by(self.quizzes.c.id)).scalars())
+            active = self._active = (ids, time.monotonic() + self.ttl)
+        return active[0]
+
+    def resolve(self, quiz_id=None, code=None, bound_quiz_id=None):
+        """
+        The quiz a student request refers to.
+
+        An explicit quiz id wins, then an access code. Without either, the
+        request is only unambiguous while exactly one quiz is active (the
+        single-quiz setup older clients rely on).
+
+        A quiz named by id must be active and, if it has an access code, the
+        request must carry that code, unless the caller is already bound to
+        the quiz (`bound_quiz_id`: the quiz of its token or quiz session,
+        which was checked when it was issued).
+        """
+        if quiz_id is not None:
+            snapshot = self.get(quiz_id)
+            if snapshot is None:
+                raise QuizLookupError("Quiz not found")
+            if bound_quiz_id is not None and bound_quiz_id == quiz_id:
+                return snapshot
+            if not snapshot.quiz.is_active:
+                raise QuizLookupError("Quiz not found")
+            quiz_code = snapshot.quiz.quiz_access_code
+            if quiz_code and code != quiz_code:
+                if code:
+                    raise QuizLookupError("Access code does not match this quiz", 403)
+                raise QuizLookupError("An access code is required for this quiz", 403)
+            return snapshot
+        if code:
+            snapshot = self.by_code(code)
+            if snapshot is not None:
+                return snapshot
+        active = self.active_ids()
+        if not active:
+            raise QuizLookupError("No quiz found for this access code" if code else "No active quiz found")
+        if len(active) > 1:
+            raise QuizLookupError("Several quizzes are running; please use your quiz's access code", 400)
+        snapshot = self.get(active[0])
+        if snapshot is None:
+            raise QuizLookupError("No active quiz found")
+        return snapshot
+
+    def invalidate(self, quiz_id=None):
+        """Drop a quiz's snapshot (or all of them) and the cached lookups"""
+        with self._lock:
+            if quiz_id is None:
+                self._snapshots.clear()
+            else:
+                self._snapshots.pop(quiz_id, None)
+            self._codes.clear()
+            self._active = None
@@ -0,0 +1,313 @@
+"""
+QuizFlow Quiz Sessions
+======================
+Server-authoritative quiz timing with a write-behind heartbeat buffer.
+
+Starting a quiz creates a session row holding the server-side deadline.
+Active sessions are cached in memory, so heartbeats and the deadline check
+on submission are served without touching the database. Autosaved answers
+are coalesced per session and flushed to the database in batches.
+
+Sessions leave the cache once they are submitted (after the submission
+commits) or, for abandoned ones, on the first flush pass after their
+deadline plus the grace period; a later lookup reloads them from the row.
+"""
+
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam
+from sqlalchemy.exc import IntegrityError
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+# Seconds between background flushes of autosaved answers
+HEARTBEAT_FLUSH_INTERVAL = float(os.getenv('HEARTBEAT_FLUSH_INTERVAL', 5))
+
+# Flush immediately once this many sessions have unsaved answers
+HEARTBEAT_FLUSH_BATCH = int(os.getenv('HEARTBEAT_FLUSH_BATCH', 200))
+
+# Extra seconds allowed after the deadline for in-flight submissions
+QUIZ_SUBMIT_GRACE_SECONDS = int(os.getenv('QUIZ_SUBMIT_GRACE_SECONDS', 30))
+
+
+class QuizSessionError(Exception):
+    """Raised when a session cannot be used for the requested action."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+# ============================================================================
+# SESSION MANAGER
+# ============================================================================
+
+class QuizSessionManager:
+    """
+    In-process cache of active quiz sessions plus a write-behind buffer for
+    heartbeat autosaves.
+
+    Args:
+        app: Flask application (used for app contexts in the flusher thread)
+        db: Flask-SQLAlchemy instance
+        model: The QuizSession model class
+    """
+
+    def __init__(self, app, db, model, flush_interval=HEARTBEAT_FLUSH_INTERVAL,
+                 flush_batch=HEARTBEAT_FLUSH_BATCH, grace_seconds=QUIZ_SUBMIT_GRACE_SECONDS):
+        self.app = app
+        self.db = db
+        self.model = model
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.grace = timedelta(seconds=grace_seconds)
+
+        self._sessions = {}        # session_id -> cached session dict
+        self._by_user_quiz = {}    # (user_id, quiz_id) -> session_id
+        self._pending = {}         # session_id -> (answers, seen_at)
+        self._lock = threading.Lock()
+        self._flusher = None
+
+        table = model.__table__
+        self._flush_stmt = (
+            table.update()
+            .where(table.c.session_id == bindparam('b_session_id'))
+            .values(answers=bindparam('b_answers'), last_heartbeat_at=bindparam('b_seen_at'))
+        )
+
+    # ------------------------------------------------------------------
+    # Cache helpers
+    # ------------------------------------------------------------------
+
+    def _cache(self, row):
+        """Cache a session row as a plain dict and return it"""
+        session = {
+            'session_id': row.session_id,
+            'user_id': row.user_id,
+            'quiz_id': row.quiz_id,
+            'access_code': row.access_code,
+            'started_at': row.started_at,
+            'deadline': row.deadline,
+            'answers': row.answers or [],
+            'submitted_at': row.submitted_at
+        }
+        with self._lock:
+            self._sessions[row.session_id] = session
+            self._by_user_quiz[(row.user_id, row.quiz_id)] = row.session_id
+        return session
+
+    def _evict(self, session_id):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            self._pending.pop(session_id, None)
+            if session:
+                self._by_user_quiz.pop((session['user_id'], session['quiz_id']), None)
+
+    def get(self, session_id):
+        """Return the cached session, loading it from the database on a miss"""
+        session = self._sessions.get(session_id)
+        if session is not None:
+            return session
+        row = self.model.query.filter_by(session_id=session_id).first()
+        return self._cache(row) if row else None
+
+    def find(self, user_id, quiz_id):
+        """Return a user's session on a quiz (cached, else from the database), or None"""
+        session_id = self._by_user_quiz.get((user_id, quiz_id))
+        session = self._sessions.get(session_id) if session_id else None
+        if session is None:
+            row = self.model.query.filter_by(user_id=user_id, quiz_id=quiz_id).first()
+            session = self._cache(row) if row else None
+        return session
+
+    def is_expired(self, session, now=None):
+        """True once the deadline plus the grace period has passed"""
+        now = now or datetime.utcnow()
+        return now > session['deadline'] + self.grace
+
+    def remaining_seconds(self, session, now=None):
+        now = now or datetime.utcnow()
+        return max(0, int((session['deadline'] - now).total_seconds()))
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    def start(self, user_id, quiz, access_code=None):
+        """
+        Start (or resume) a session for a user on a quiz.
+
+        Reloading the quiz page resumes the existing session so the timer
+        cannot be reset by the client.
+        """
+        session = self.find(user_id, quiz.id)
+        if session is not None:
+            if session['submitted_at']:
+                raise QuizSessionError("This quiz has already been submitted by you.", 403)
+            return session
+
+        now = datetime.utcnow()
+        row = self.model(
+            session_id=str(uuid.uuid4()),
+            user_id=user_id,
+            quiz_id=quiz.id,
+            access_code=access_code,
+            started_at=now,
+            deadline=now + timedelta(seconds=quiz.time_limit or 1200),
+            answers=[]
+        )
+        self.db.session.add(row)
+        # Cache before committing so reading the row back needs no refresh query
+        session = self._cache(row)
+        self._ensure_flusher()
+        try:
+            self.db.session.commit()
+        except IntegrityError:
+            # A concurrent request for the same student started it first
+            self.db.session.rollback()
+            self._evict(session['session_id'])
+            row = self.model.query.filter_by(user_id=user_id, quiz_id=quiz.id).first()
+            session = self._cache(row)
+        return session
+
+    def heartbeat(self, session_id, answers):
+        """
+        Record autosaved answers for a session.
+
+        The answers are buffered in memory and written by the next batch flush.
+        """
+        session = self.get(session_id)
+        if session is None:
+            raise QuizSessionError("Quiz session not found", 404)
+        if session['submitted_at']:
+            raise QuizSessionError("This quiz has already been submitted.", 409)
+
+        now = datetime.utcnow()
+        if self.is_expired(session, now):
+            raise QuizSessionError("Time limit exceeded", 403)
+
+        if answers is not None:
+            with self._lock:
+                session['answers'] = answers
+                self._pending[session_id] = (answers, now)
+                pending = len(self._pending)
+            if pending >= self.flush_batch:
+                self.flush()
+            else:
+                self._ensure_flusher()
+        return session
+
+    def validate_submission(self, session_id, user_id):
+        """
+        Check that a submission is allowed for this session.
+
+        Served from the cache, so it costs no queries for active sessions.
+        """
+        session = self.get(session_id)
+        if session is None or session['user_id'] != user_id:
+            raise QuizSessionError("Quiz session not found", 404)
+        if session['submitted_at']:
+            raise QuizSessionError("This quiz has already been submitted by you.", 403)
+        if self.is_expired(session):
+            raise QuizSessionError("Time limit exceeded. Your quiz session has expired.", 403)
+        return session
+
+    def mark_submitted(self, session_ids):
+        """
+        Stage the submitted_at update on the current db session.
+
+        Accepts one session id or a list of them. The caller commits it
+        together with the submission rows, then calls evict(); until then the
+        cached sessions stay as they were, so a failed commit loses nothing.
+        """
+        if isinstance(session_ids, str):
+            session_ids = [session_ids]
+        if not session_ids:
+            return None
+        now = datetime.utcnow()
+        table = self.model.__table__
+        self.db.session.execute(
+            table.update()
+            .where(table.c.session_id.in_(session_ids))
+            .values(submitted_at=now)
+        )
+        return now
+
+    def evict(self, session_ids):
+        """
+        Drop sessions (one id or a list) and their pending autosaves from the cache.
+
+        Call after the submission commits; the final answers are in the
+        submission, and the next lookup reloads the submitted row.
+        """
+        if isinstance(session_ids, str):
+            session_ids = [session_ids]
+        for session_id in session_ids or ():
+            self._evict(session_id)
+
+    def _evict_expired(self, now=None):
+        """Drop abandoned sessions past their deadline plus grace (unless autosaves are pending)"""
+        now = now or datetime.utcnow()
+        with self._lock:
+            expired = [sid for sid, session in self._sessions.items()
+                       if sid not in self._pending and self.is_expired(session, now)]
+            for sid in expired:
+                session = self._sessions.pop(sid)
+                self._by_user_quiz.pop((session['user_id'], session['quiz_id']), None)
+        return len(expired)
+
+    # ------------------------------------------------------------------
+    # Write-behind flushing
+    # ------------------------------------------------------------------
+
+    def flush(self):
+        """Write all buffered autosaves with a single executemany UPDATE"""
+        with self._lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+
+        rows = [
+            {'b_session_id': sid, 'b_answers': answers, 'b_seen_at': seen_at}
+            for sid, (answers, seen_at) in batch.items()
+        ]
+        # A fresh app context has its own db session (Flask-SQLAlchemy 3), so a flush
+        # triggered inside a request never commits that request's pending changes
+        with self.app.app_context():
+            try:
+                self.db.session.execute(self._flush_stmt, rows)
+                self.db.session.commit()
+            except Exception as e:
+                self.db.session.rollback()
+                # Put the batch back unless newer answers arrived meanwhile
+                with self._lock:
+                    for sid, entry in batch.items():
+                        self._pending.setdefault(sid, entry)
+                self.app.logger.error(f"Heartbeat flush failed: {str(e)}")
+                return 0
+        return len(rows)
+
+    def _ensure_flusher(self):
+        if self._flusher is not None and self._flusher.is_alive():
+            return
+        with self._lock:
+            if self._flusher is not None and self._flusher.is_alive():
+                return
+            self._flusher = threading.Thread(
+                target=self._flush_loop, name='quiz-session-flusher', daemon=True
+            )
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+            self._evict_expired()
@@ -0,0 +1,241 @@
+"""
+QuizFlow Submission Writer
+==========================
+Optional group-commit persistence for quiz submissions.
+
+When a timed quiz ends, every student auto-submits within a few seconds and
+per-request INSERT + COMMIT latency dominates. In group-commit mode the
+request thread hands its graded row to a bounded in-process buffer; a single
+writer thread drains the buffer every SUBMISSION_BATCH_MAX_DELAY_MS or
+SUBMISSION_BATCH_MAX_ROWS rows and writes the whole batch with one multi-row
+INSERT and one COMMIT.
+
+A submission is only acknowledged after the transaction containing it has
+committed: the request thread blocks on its ticket until the writer reports
+the outcome. Nothing is acknowledged from memory.
+"""
+
+import os
+import queue
+import threading
+import time
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+SUBMISSION_GROUP_COMMIT = os.getenv('SUBMISSION_GROUP_COMMIT', 'false').lower() in ['true', '1', 'yes']
+
+# Flush when this many submissions are waiting...
+SUBMISSION_BATCH_MAX_ROWS = int(os.getenv('SUBMISSION_BATCH_MAX_ROWS', 100))
+
+# ...or when the oldest one has waited this long
+SUBMISSION_BATCH_MAX_DELAY_MS = int(os.getenv('SUBMISSION_BATCH_MAX_DELAY_MS', 50))
+
+# Bound on queued submissions; beyond it requests write synchronously
+SUBMISSION_BUFFER_SIZE = int(os.getenv('SUBMISSION_BUFFER_SIZE', 2000))
+
+# How long a request waits for its batch to commit
+SUBMISSION_ACK_TIMEOUT = float(os.getenv('SUBMISSION_ACK_TIMEOUT', 30))
+
+
+class SubmissionWriteError(Exception):
+    """Raised when a submission could not be durably written."""
+
+    def __init__(self, message, status_code=500):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+class _Ticket:
+    """One queued submission and the caller waiting for its outcome"""
+
+    __slots__ = ('row', 'session_id', 'done', 'error', 'duplicate')
+
+    def __init__(self, row, session_id=None):
+        self.row = row
+        self.session_id = session_id
+        self.done = threading.Event()
+        self.error = None
+        self.duplicate = False
+
+    @property
+    def key(self):
+        return (self.row['user_id'], self.row.get('quiz_id'))
+
+
+# ============================================================================
+# BATCH WRITER
+# ============================================================================
+
+class SubmissionBatchWriter:
+    """
+    Group-commit writer for the submissions table.
+
+    Args:
+        app: Flask application (used for app contexts in the writer thread)
+        db: Flask-SQLAlchemy instance
+        model: The Submission model class
+        quiz_sessions: Optional QuizSessionManager; sessions of written rows
+            are marked submitted in the same transaction
+    """
+
+    def __init__(self, app, db, model, quiz_sessions=None, enabled=SUBMISSION_GROUP_COMMIT,
+                 max_rows=SUBMISSION_BATCH_MAX_ROWS, max_delay_ms=SUBMISSION_BATCH_MAX_DELAY_MS,
+                 buffer_size=SUBMISSION_BUFFER_SIZE, ack_timeout=SUBMISSION_ACK_TIMEOUT):
+        self.app = app
+        self.db = db
+        self.model = model
+        self.quiz_sessions = quiz_sessions
+        self.enabled = enabled
+        self.max_rows = max_rows
+        self.max_delay = max_delay_ms / 1000.0
+        self.ack_timeout = ack_timeout
+
+        self._queue = queue.Queue(maxsize=buffer_size)
+        self._pending = set()          # (user_id, quiz_id) of tickets not yet resolved
+        self._lock = threading.Lock()
+        self._worker = None
+
+        self.stats = {'batches': 0, 'rows': 0, 'fallbacks': 0, 'sync_writes': 0, 'duplicates': 0}
+
+    def is_pending(self, user_id, quiz_id):
+        """True while this user's submission of this quiz is queued but not yet committed"""
+        return (user_id, quiz_id) in self._pending
+
+    def write(self, row, session_id=None):
+        """
+        Durably write one submission row (a dict of Submission columns).
+
+        Blocks until the row's batch has committed and raises
+        SubmissionWriteError if it could not be written. The submission stays
+        pending until its ticket is resolved, even if this request stops
+        waiting, so a retry cannot queue a second row behind the first.
+        """
+        ticket = _Ticket(row, session_id)
+        with self._lock:
+            if ticket.key in self._pending:
+                raise SubmissionWriteError("This quiz has already been submitted by you.", 403)
+            self._pending.add(ticket.key)
+
+        try:
+            # Hand this request's pooled connection back before waiting, or a
+            # burst of blocked requests can exhaust the pool the writer needs
+            self.db.session.close()
+            self._ensure_worker()
+            self._queue.put_nowait(ticket)
+        except queue.Full:
+            # Buffer is saturated: write on the request thread instead
+            self.stats['sync_writes'] += 1
+            self._write_batch([ticket])
+        except Exception:
+            with self._lock:
+                self._pending.discard(ticket.key)
+            raise
+
+        if not ticket.done.wait(self.ack_timeout):
+            raise SubmissionWriteError(
+                "Your submission is still being saved. Please check your results shortly.", 503
+            )
+        if ticket.duplicate:
+            raise SubmissionWriteError("This quiz has already been submitted by you.", 403)
+        if ticket.error is not None:
+            raise SubmissionWriteError(f"Database error: {ticket.error}")
+
+    # ------------------------------------------------------------------
+    # Writer thread
+    # ------------------------------------------------------------------
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(
+                target=self._run, name='submission-writer', daemon=True
+            )
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            flush_at = time.monotonic() + self.max_delay
+            while len(batch) < self.max_rows:
+                remaining = flush_at - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._write_batch(batch)
+
+    def _write_batch(self, batch):
+        """Insert a batch in one transaction, isolating failures per row"""
+        with self.app.app_context():
+            try:
+                self._insert(batch)
+                self.stats['batches'] += 1
+                self.stats['rows'] += len(batch)
+                self._resolve(batch)
+                return
+            except Exception as e:
+                self.db.session.rollback()
+                if len(batch) == 1:
+                    self._resolve_failed(batch[0], e)
+                    return
+                self.app.logger.warning(f"Submission batch of {len(batch)} failed, retrying per row: {str(e)}")
+
+            # One bad row must not fail everyone else's submission
+            self.stats['fallbacks'] += 1
+            for ticket in batch:
+                try:
+                    self._insert([ticket])
+                    self.stats['rows'] += 1
+                    self._resolve([ticket])
+                except Exception as e:
+                    self.db.session.rollback()
+                    self._resolve_failed(ticket, e)
+
+    def _insert(self, batch):
+        self.db.session.execute(self.model.__table__.insert(), [t.row for t in batch])
+        session_ids = [t.session_id for t in batch if t.session_id]
+        if session_ids and self.quiz_sessions is not None:
+            self.quiz_sessions.mark_submitted(session_ids)
+        self.db.session.commit()
+        if session_ids and self.quiz_sessions is not None:
+            self.quiz_sessions.evict(session_ids)
+
+    def _resolve_failed(self, ticket, error):
+        # A unique (user_id, quiz_id) violation means another worker already
+        # saved this student's submission: that is not a write failure
+        if isinstance(error, IntegrityError) and self._already_saved(ticket.row):
+            self.stats['duplicates'] += 1
+            ticket.duplicate = True
+            self._resolve([ticket])
+        else:
+            self._resolve([ticket], error=error)
+
+    def _already_saved(self, row):
+        t = self.model.__table__
+        try:
+            return self.db.session.execute(
+                select(t.c.id).where(t.c.user_id == row['user_id'], t.c.quiz_id == row.get('quiz_id')).limit(1)
+            ).first() is not None
+        except Exception:
+            self.db.session.rollback()
+            return False
+
+    def _resolve(self, batch, error=None):
+        with self._lock:
+            for ticket in batch:
+                self._pending.discard(ticket.key)
+        for ticket in batch:
+            ticket.error = error
+            ticket.done.set()
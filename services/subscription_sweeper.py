@@ -0,0 +1,202 @@
+"""
+QuizFlow Subscription Sweeper
+=============================
+Background expiry, renewal and reminder processing for teacher subscriptions.
+
+Subscriptions carry a stored `status` ('active' or 'expired') that the
+sweeper persists. Read paths (status endpoints, quiz creation checks, the
+teachers listing) also compare expiry_date with the clock, so expiry does
+not depend on this thread running (it does not on serverless deployments).
+The sweeper:
+
+- Reminders: active subscriptions expiring within SUBSCRIPTION_REMINDER_DAYS
+  get one reminder email (reminder_sent_at marks them).
+- Expiry: active subscriptions past expiry_date are flipped to 'expired',
+  or, with SUBSCRIPTION_AUTO_RENEW, rolled into a new period of the plan's
+  duration_days with usage reset to zero.
+
+Every step walks the expiry_date index in batches of SUBSCRIPTION_SWEEP_BATCH
+rows. Updates are guarded by the state they change, so several worker
+processes may sweep at once without double-processing a row.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import bindparam, select, update
+
+
+# Seconds between sweeps (0 disables the background thread)
+SUBSCRIPTION_SWEEP_INTERVAL = float(os.getenv('SUBSCRIPTION_SWEEP_INTERVAL', 300))
+
+# Rows read and written per sweep batch
+SUBSCRIPTION_SWEEP_BATCH = int(os.getenv('SUBSCRIPTION_SWEEP_BATCH', 500))
+
+# Days before expiry a reminder email is sent (0 disables reminders)
+SUBSCRIPTION_REMINDER_DAYS = float(os.getenv('SUBSCRIPTION_REMINDER_DAYS', 3))
+
+# Renew expired subscriptions for another period instead of expiring them
+SUBSCRIPTION_AUTO_RENEW = os.getenv('SUBSCRIPTION_AUTO_RENEW', 'false').lower() in ['true', '1', 'yes']
+
+DEFAULT_DURATION_DAYS = 30
+
+
+def _as_utc(value):
+    return value.replace(tzinfo=timezone.utc) if value is not None and value.tzinfo is None else value
+
+
+def next_period(expiry_date, duration_days, now):
+    """(start, expiry) of the first renewal period that ends after `now`"""
+    duration = timedelta(days=duration_days or DEFAULT_DURATION_DAYS)
+    start, expiry = _as_utc(expiry_date), _as_utc(expiry_date) + duration
+    while expiry <= now:
+        start, expiry = expiry, expiry + duration
+    return start, expiry
+
+
+class SubscriptionSweeper:
+    """
+    Args:
+        app: Flask application (for app contexts on the worker thread)
+        db: Flask-SQLAlchemy instance
+        subscription_model: UserSubscription (status and reminder_sent_at columns)
+        user_model: User model (for reminder recipients)
+        plans: PlanCatalog (duration_days of renewals)
+        notify: Callable(email, plan_name, expiry_date) that queues a reminder
+    """
+
+    def __init__(self, app, db, subscription_model, user_model, plans, notify=None,
+                 interval=SUBSCRIPTION_SWEEP_INTERVAL, batch_size=SUBSCRIPTION_SWEEP_BATCH,
+                 reminder_days=SUBSCRIPTION_REMINDER_DAYS, auto_renew=SUBSCRIPTION_AUTO_RENEW):
+        self.app = app
+        self.db = db
+        self.subscriptions = subscription_model.__table__
+        self.users = user_model.__table__
+        self.plans = plans
+        self.notify = notify
+        self.interval = interval
+        self.batch_size = batch_size
+        self.reminder_days = reminder_days
+        self.auto_renew = auto_renew
+        self._worker = None
+        self._lock = threading.Lock()
+
+        s = self.subscriptions
+        self._due = (s.c.is_active.is_(True), s.c.status == 'active')
+        self._renew = (
+            update(s)
+            .where(s.c.id == bindparam('b_id'), s.c.status == 'active',
+                   s.c.expiry_date == bindparam('b_old_expiry'))
+            .values(quizzes_used=0, start_date=bindparam('b_start'), expiry_date=bindparam('b_expiry'),
+                    reminder_sent_at=None)
+        )
+
+    # ------------------------------------------------------------------
+    # Sweeping
+    # ------------------------------------------------------------------
+
+    def sweep(self, now=None):
+        """
+        Run one full sweep (inside an app context).
+
+        Returns {"reminded": n, "expired": n, "renewed": n}.
+        """
+        now = now or datetime.now(timezone.utc)
+        counts = {'reminded': 0, 'expired': 0, 'renewed': 0}
+        if self.reminder_days > 0 and self.notify is not None:
+            while True:
+                reminded, more = self._remind_batch(now)
+                counts['reminded'] += reminded
+                if not more:
+                    break
+        while True:
+            processed, more = self._expire_batch(now)
+            counts['renewed' if self.auto_renew else 'expired'] += processed
+            if not more:
+                break
+        return counts
+
+    def _remind_batch(self, now):
+        s, u = self.subscriptions, self.users
+        session = self.db.session
+        rows = session.execute(
+            select(s.c.id, s.c.plan_name, s.c.expiry_date, u.c.email)
+            .join(u, u.c.id == s.c.user_id)
+            .where(*self._due, s.c.reminder_sent_at.is_(None),
+                   s.c.expiry_date > now, s.c.expiry_date <= now + timedelta(days=self.reminder_days))
+            .order_by(s.c.expiry_date)
+            .limit(self.batch_size)
+        ).all()
+        if not rows:
+            session.commit()
+            return 0, False
+        # Only the process whose UPDATE claims a row sends its reminder
+        claimed = set(session.execute(
+            update(s).where(s.c.id.in_([row.id for row in rows]), s.c.reminder_sent_at.is_(None))
+            .values(reminder_sent_at=now)
+            .returning(s.c.id)
+        ).scalars())
+        session.commit()
+        for row in rows:
+            if row.id in claimed:
+                self.notify(row.email, row.plan_name, row.expiry_date)
+        return len(claimed), len(rows) == self.batch_size
+
+    def _expire_batch(self, now):
+        s = self.subscriptions
+        session = self.db.session
+        rows = session.execute(
+            select(s.c.id, s.c.plan_name, s.c.expiry_date)
+            .where(*self._due, s.c.expiry_date <= now)
+            .order_by(s.c.expiry_date)
+            .limit(self.batch_size)
+        ).all()
+        if not rows:
+            session.commit()
+            return 0, False
+        if self.auto_renew:
+            params = []
+            for row in rows:
+                plan = self.plans.get(row.plan_name)
+                start, expiry = next_period(row.expiry_date, plan.duration_days if plan else None, now)
+                params.append({'b_id': row.id, 'b_old_expiry': row.expiry_date,
+                               'b_start': start, 'b_expiry': expiry})
+            session.execute(self._renew, params)
+        else:
+            session.execute(
+                update(s).where(s.c.id.in_([row.id for row in rows]), s.c.status == 'active',
+                                s.c.expiry_date <= now)
+                .values(status='expired')
+            )
+        session.commit()
+        return len(rows), len(rows) == self.batch_size
+
+    # ------------------------------------------------------------------
+    # Background thread
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """Start the periodic sweep thread (no-op when the interval is 0)"""
+        if self.interval <= 0:
+            return
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(target=self._worker_loop, name='subscription-sweeper', daemon=True)
+            self._worker.start()
+
+    def _worker_loop(self):
+        while True:
+            with self.app.app_context():
+                try:
+                    counts = self.sweep()
+                    if any(counts.values()):
+                        self.app.logger.info(f"Subscription sweep: {counts}")
+                except Exception as e:
+                    self.db.session.rollback()
+                    self.app.logger.error(f"Subscription sweep failed: {str(e)}")
+            time.sleep(self.interval)
@@ -0,0 +1,111 @@
+"""
+QuizFlow Usage Meter
+====================
+Race-free quota counters (e.g. quizzes created per subscription).
+
+Consuming quota is one conditional statement:
+
+    UPDATE subscriptions SET quizzes_used = quizzes_used + 1
+    WHERE id = <the owner's row> AND quizzes_used + 1 <= quizzes_limit [AND usable]
+    RETURNING id, quizzes_used, quizzes_limit
+
+The check and the increment happen in the database, so concurrent
+requests cannot both take the last unit. The allowed path does not read
+the row before the write. Only a refused request pays for a second query,
+to tell "over the limit" apart from "no such row".
+
+Both subscription systems use it. The app's `subscriptions` table treats a
+limit below 1 as unlimited (not counted). The blueprint's
+`user_subscriptions` table also requires the row to be active and
+unexpired.
+"""
+
+from datetime import datetime, timezone
+
+from sqlalchemy import case, func, or_, select, update
+from sqlalchemy.orm.attributes import set_committed_value
+
+
+class UsageLimitError(Exception):
+    """Raised when a row exists but has no quota left (or is not usable)."""
+
+    def __init__(self, message, status_code=403):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+class UsageMeter:
+    """
+    Args:
+        db: Flask-SQLAlchemy instance
+        model: Model with an id, an owner column and the used/limit columns
+        used_column: Name of the counter column
+        limit_column: Name of the quota column
+        owner_column: Column identifying the owner (the newest matching row is metered)
+        scope: Optional callable(table) -> WHERE clauses selecting the owner's
+            candidate rows (e.g. only active subscriptions)
+        usable: Optional callable(table, now) -> WHERE clauses a row must
+            also meet to be charged (e.g. not expired)
+        unlimited_below: Limits below this value mean "unlimited"; such
+            rows are allowed and not counted
+        limit_message: Message of the UsageLimitError
+    """
+
+    def __init__(self, db, model, used_column, limit_column, owner_column='user_id',
+                 scope=None, usable=None, unlimited_below=None,
+                 limit_message='Quiz limit reached. Please upgrade your subscription to create more quizzes.'):
+        self.db = db
+        self.table = model.__table__
+        self.used = self.table.c[used_column]
+        self.limit = self.table.c[limit_column]
+        self.owner = self.table.c[owner_column]
+        self.scope = scope
+        self.usable = usable
+        self.unlimited_below = unlimited_below
+        self.limit_message = limit_message
+
+    def _target(self, owner_id, row_id):
+        t = self.table
+        if row_id is not None:
+            return t.c.id == row_id
+        scope = self.scope(t) if self.scope else ()
+        return t.c.id == select(func.max(t.c.id)).where(self.owner == owner_id, *scope).scalar_subquery()
+
+    def consume(self, owner_id=None, amount=1, row_id=None, now=None):
+        """
+        Charge `amount` units to an owner's row (or a specific row id).
+
+        Runs in the caller's transaction; the caller commits. Returns the
+        row's (id, used, limit) after the charge, or None if the owner has
+        no metered row. Raises UsageLimitError if the row has no quota left
+        or is not usable.
+        """
+        t = self.table
+        target = self._target(owner_id, row_id)
+        usable = self.usable(t, now or datetime.now(timezone.utc)) if self.usable else ()
+
+        if self.unlimited_below is None:
+            within = self.used + amount <= self.limit
+            charged = self.used + amount
+        else:
+            unlimited = self.limit < self.unlimited_below
+            within = or_(unlimited, self.used + amount <= self.limit)
+            charged = case((unlimited, self.used), else_=self.used + amount)
+
+        session = self.db.session
+        row = session.execute(
+            update(t).where(target, within, *usable)
+            .values({self.used.name: charged})
+            .returning(t.c.id, self.used, self.limit)
+        ).first()
+        if row is not None:
+            return row
+        if session.execute(select(t.c.id).where(target)).first() is not None:
+            raise UsageLimitError(self.limit_message)
+        return None
+
+    @staticmethod
+    def sync(instance, attribute, row):
+        """Show a charge on an already loaded ORM instance without marking it dirty"""
+        set_committed_value(instance, attribute, row[1])
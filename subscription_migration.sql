@@ -52,6 +52,7 @@ CREATE INDEX IF NOT EXISTS idx_payments_status ON payments(status);
 CREATE INDEX IF NOT EXISTS idx_payments_email ON payments(user_email);
 CREATE INDEX IF NOT EXISTS idx_payments_trx_id ON payments(trx_id);
 CREATE INDEX IF NOT EXISTS idx_payments_created ON payments(created_at);
+CREATE INDEX IF NOT EXISTS ix_payments_created_at_id ON payments(created_at, id);  -- keyset pagination
 
 -- ============================================================================
 -- 3. USER SUBSCRIPTIONS TABLE
@@ -78,6 +79,11 @@ CREATE INDEX IF NOT EXISTS idx_user_subscriptions_user_id ON user_subscriptions(
 CREATE INDEX IF NOT EXISTS idx_user_subscriptions_expiry ON user_subscriptions(expiry_date);
 CREATE INDEX IF NOT EXISTS idx_user_subscriptions_active ON user_subscriptions(is_active);
 
+-- Stored expiry state and reminder marker (maintained by the subscription sweeper)
+ALTER TABLE user_subscriptions ADD COLUMN IF NOT EXISTS status VARCHAR(20) DEFAULT 'active';
+ALTER TABLE user_subscriptions ADD COLUMN IF NOT EXISTS reminder_sent_at TIMESTAMP;
+CREATE INDEX IF NOT EXISTS ix_user_subscriptions_status ON user_subscriptions(status);
+
 -- ============================================================================
 -- 4. ADD SUBSCRIPTION FIELDS TO USERS TABLE
 -- ============================================================================
@@ -111,6 +117,7 @@ CREATE TABLE IF NOT EXISTS admin_audit_log (
 
 CREATE INDEX IF NOT EXISTS idx_admin_audit_admin ON admin_audit_log(admin_username);
 CREATE INDEX IF NOT EXISTS idx_admin_audit_action ON admin_audit_log(action);
+CREATE INDEX IF NOT EXISTS ix_admin_audit_log_created_at_id ON admin_audit_log(created_at, id);  -- keyset pagination
 
 -- ============================================================================
 -- 6. RATE LIMITING TABLE (for payment submissions)
@@ -209,10 +216,14 @@ BEGIN
     UPDATE user_subscriptions
     SET 
         quizzes_used = 0,
-        start_date = expiry_date,
-        expiry_date = expiry_date + (duration_days || ' days')::INTERVAL
-    WHERE expiry_date <= CURRENT_TIMESTAMP
-    AND is_active = TRUE;
+        start_date = user_subscriptions.expiry_date,
+        expiry_date = user_subscriptions.expiry_date + (COALESCE(sp.duration_days, 30) || ' days')::INTERVAL,
+        status = 'active',
+        reminder_sent_at = NULL
+    FROM subscription_plans sp
+    WHERE sp.plan_name = user_subscriptions.plan_name
+    AND user_subscriptions.expiry_date <= CURRENT_TIMESTAMP
+    AND user_subscriptions.is_active = TRUE;
 END;
 $$ LANGUAGE plpgsql;
 
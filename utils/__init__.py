@@ -20,7 +20,9 @@ from .email_utils import (
     send_payment_confirmation_email,
     send_payment_approved_email,
     send_payment_rejected_email,
+    send_subscription_expiry_reminder_email,
     send_admin_notification,
+    queue_email,
     
     # Security utilities
     validate_email,
@@ -28,6 +30,15 @@ from .email_utils import (
     rate_limit_check,
     rate_limit_decorator
 )
+from .auth_tokens import (
+    # Signed session tokens
+    AuthClaims,
+    AuthTokenError,
+    issue_token,
+    verify_token,
+    current_auth,
+    require_auth
+)
 
 __all__ = [
     # Configuration
@@ -45,11 +56,21 @@ __all__ = [
     'send_payment_confirmation_email',
     'send_payment_approved_email',
     'send_payment_rejected_email',
+    'send_subscription_expiry_reminder_email',
     'send_admin_notification',
+    'queue_email',
     
     # Security utilities
     'validate_email',
     'get_client_ip',
     'rate_limit_check',
-    'rate_limit_decorator'
+    'rate_limit_decorator',
+    
+    # Signed session tokens
+    'AuthClaims',
+    'AuthTokenError',
+    'issue_token',
+    'verify_token',
+    'current_auth',
+    'require_auth'
 ]
@@ -0,0 +1,202 @@
+"""
+QuizFlow Auth Tokens
+====================
+Signed stateless tokens and the shared authentication decorator.
+
+A token is `qf1.<payload>.<signature>`: the payload is compact JSON
+(user id, role, quiz id, name, email, expiry) in URL-safe base64, signed
+with HMAC-SHA256 under AUTH_TOKEN_SECRET. Verifying one is a hash and a
+JSON decode, so authenticated endpoints know who is calling without a
+database lookup. Tokens cannot be revoked before they expire; keep
+AUTH_TOKEN_TTL to roughly an exam day.
+
+`require_auth` is used by app.py and the subscription blueprint alike.
+Older clients identify themselves with the Flask session, an X-User-Id
+header or an email in the body; those paths keep working through the
+decorator's `legacy` hook, but only when AUTH_ALLOW_LEGACY is turned on.
+
+Without AUTH_TOKEN_SECRET (or SECRET_KEY) each process signs with a random
+key of its own: tokens stop working on restart and are not shared between
+workers, but nobody can forge one from a default that ships in the repo.
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import time
+from functools import wraps
+
+from flask import g, jsonify, request
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+# Signing key (set this in production; rotating it logs everyone out)
+AUTH_TOKEN_SECRET = os.getenv('AUTH_TOKEN_SECRET') or os.getenv('SECRET_KEY')
+if not AUTH_TOKEN_SECRET:
+    AUTH_TOKEN_SECRET = secrets.token_urlsafe(32)
+    logging.getLogger(__name__).warning(
+        "AUTH_TOKEN_SECRET/SECRET_KEY is not set; signing auth tokens with a random per-process key")
+
+# Token lifetime in seconds
+AUTH_TOKEN_TTL = int(os.getenv('AUTH_TOKEN_TTL', 8 * 3600))
+
+# Accept session / header / body identification from clients without a token
+AUTH_ALLOW_LEGACY = os.getenv('AUTH_ALLOW_LEGACY', 'false').lower() in ['true', '1', 'yes']
+
+TOKEN_PREFIX = 'qf1'
+
+
+class AuthTokenError(Exception):
+    """Raised when a token is malformed, forged or expired."""
+
+    def __init__(self, message, status_code=401):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+class AuthClaims:
+    """
+    The identity carried by a token.
+
+    Exposes `id`, `name` and `email` like a User row, so handlers can use
+    either interchangeably.
+    """
+
+    __slots__ = ('id', 'role', 'quiz_id', 'name', 'email', 'expires_at')
+
+    def __init__(self, id, role, quiz_id=None, name=None, email=None, expires_at=None):
+        self.id = id
+        self.role = role
+        self.quiz_id = quiz_id
+        self.name = name
+        self.email = email
+        self.expires_at = expires_at
+
+
+# ============================================================================
+# ISSUE / VERIFY
+# ============================================================================
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _sign(message, secret):
+    return _b64encode(hmac.new(secret.encode('utf-8'), message.encode('ascii'), hashlib.sha256).digest())
+
+
+def issue_token(user_id, role, quiz_id=None, name=None, email=None, ttl=None, secret=None):
+    """Signed token for a user; valid for `ttl` seconds (AUTH_TOKEN_TTL by default)"""
+    expires_at = int(time.time()) + (AUTH_TOKEN_TTL if ttl is None else ttl)
+    payload = json.dumps([user_id, role, quiz_id, name, email, expires_at], separators=(',', ':'))
+    body = f"{TOKEN_PREFIX}.{_b64encode(payload.encode('utf-8'))}"
+    return f"{body}.{_sign(body, secret or AUTH_TOKEN_SECRET)}"
+
+
+def verify_token(token, secret=None):
+    """
+    AuthClaims of a token; raises AuthTokenError if it is invalid or expired.
+
+    Returns None for a correctly signed payload of the wrong shape.
+    """
+    try:
+        prefix, payload, signature = token.split('.')
+    except (AttributeError, ValueError):
+        raise AuthTokenError("Malformed authentication token")
+    if prefix != TOKEN_PREFIX:
+        raise AuthTokenError("Malformed authentication token")
+    expected = _sign(f"{prefix}.{payload}", secret or AUTH_TOKEN_SECRET)
+    if not hmac.compare_digest(signature, expected):
+        raise AuthTokenError("Invalid authentication token")
+    try:
+        user_id, role, quiz_id, name, email, expires_at = json.loads(_b64decode(payload))
+    except ValueError:
+        raise AuthTokenError("Malformed authentication token")
+    except TypeError:
+        return None
+    try:
+        expired = expires_at < time.time()
+    except TypeError:
+        return None
+    if expired:
+        raise AuthTokenError("Your session has expired. Please log in again.")
+    return AuthClaims(user_id, role, quiz_id, name, email, expires_at)
+
+
+def token_from_request():
+    """
+    The token sent with the current request, or None.
+
+    Accepts `Authorization: Bearer <token>` and a bare token (what the
+    quiz page sends). Placeholder values older pages stored ("authorized",
+    "demo-mode") do not carry the prefix and count as no token.
+    """
+    header = request.headers.get('Authorization', '').strip()
+    if header[:7].lower() == 'bearer ':
+        header = header[7:].strip()
+    return header if header.startswith(TOKEN_PREFIX + '.') else None
+
+
+def current_auth():
+    """Claims of the authenticated caller of this request, or None"""
+    return g.get('auth')
+
+
+# ============================================================================
+# DECORATOR
+# ============================================================================
+
+def require_auth(*roles, legacy=None, optional=False):
+    """
+    Decorator that authenticates a request and stores its AuthClaims in g.auth.
+
+    Args:
+        roles: Roles allowed to call the endpoint (any role if empty)
+        legacy: Callable returning AuthClaims (or None) for requests without
+            a token; only consulted while AUTH_ALLOW_LEGACY is on
+        optional: Let requests without a token (or legacy identity) through
+            with g.auth = None, for endpoints that still identify callers
+            from the request body
+
+    A present but invalid token is always rejected (401), as is a caller
+    whose role is not allowed (403).
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            token = token_from_request()
+            claims = None
+            if token:
+                try:
+                    claims = verify_token(token)
+                except AuthTokenError as e:
+                    return jsonify({'success': False, 'message': e.message}), e.status_code
+                if claims is None:
+                    return jsonify({'success': False, 'message': 'Malformed authentication token'}), 401
+            elif legacy is not None and AUTH_ALLOW_LEGACY:
+                claims = legacy()
+
+            if claims is None:
+                if optional:
+                    g.auth = None
+                    return f(*args, **kwargs)
+                return jsonify({'success': False, 'message': 'Authentication required'}), 401
+            if roles and claims.role not in roles:
+                return jsonify({'success': False, 'message': 'You do not have access to this resource'}), 403
+
+            g.auth = claims
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
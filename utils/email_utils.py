@@ -8,11 +8,15 @@ import secrets
 import string
 import re
 import os
+import queue
+import threading
 from datetime import datetime, timezone
-from flask import request
+from flask import request, current_app
 from flask_mail import Mail, Message
 from functools import wraps
 
+from services.metrics import time_mail_send
+
 
 # ============================================================================
 # MAIL CONFIGURATION
@@ -180,8 +184,8 @@ def send_email(to, subject, message, html=None, from_mailbox='noreply', cc=None,
             bcc=bcc
         )
         
-        # Send email
-        mail.send(msg)
+        # Send email (latency and failures are exported on /metrics)
+        time_mail_send(mail.send, msg, from_mailbox)
         
         # Log successful send (optional)
         current_app.logger.info(f"Email sent to {recipients} from {sender}: {subject}")
@@ -611,6 +615,62 @@ The QuizFlow Team
     )
 
 
+def send_subscription_expiry_reminder_email(user_email, plan_name, expiry_date):
+    """
+    Send a reminder that a subscription is about to expire.
+    
+    Args:
+        user_email: Recipient email
+        plan_name: Subscription plan name
+        expiry_date: Subscription expiry date
+    
+    Returns:
+        dict: {'success': bool, 'message': str}
+    """
+    # Format expiry date for display
+    if isinstance(expiry_date, datetime):
+        expiry_formatted = expiry_date.strftime('%B %d, %Y')
+    else:
+        expiry_formatted = str(expiry_date)
+    
+    subject = "⏰ Your QuizFlow Subscription Expires Soon"
+    
+    text_message = f"""
+Your QuizFlow Subscription Expires Soon
+
+This is a friendly reminder that your subscription is about to expire.
+
+SUBSCRIPTION DETAILS:
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+Plan: {plan_name}
+Expires: {expiry_formatted}
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+After this date you will not be able to create new quizzes. Your existing
+quizzes and results stay available.
+
+TO RENEW:
+1. Choose a plan at: https://quizflow.buzz/pricing.html
+2. Submit your bKash payment details
+3. We'll extend your subscription once the payment is approved
+
+Need Help?
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+📧 Support: support@quizflow.buzz
+💳 Billing: billing@quizflow.buzz
+
+Best regards,
+The QuizFlow Team
+"""
+    
+    return send_email(
+        to=user_email,
+        subject=subject,
+        message=text_message,
+        from_mailbox='billing'
+    )
+
+
 def send_admin_notification(subject, message, admin_emails=None):
     """
     Send notification to admin mailbox.
@@ -634,6 +694,51 @@ def send_admin_notification(subject, message, admin_emails=None):
     )
 
 
+# ============================================================================
+# BACKGROUND DELIVERY
+# ============================================================================
+
+_email_queue = queue.Queue()
+_email_worker = None
+_email_worker_lock = threading.Lock()
+
+
+def queue_email(send, *args, **kwargs):
+    """
+    Run an email function on the background email thread.
+    
+    Request handlers use this so they never wait for SMTP; the emails of
+    one call are sent in the order they were queued. Must be called inside
+    an app context.
+    
+    Usage:
+        queue_email(send_payment_approved_email, 'user@example.com', 'Basic')
+    """
+    _email_queue.put((current_app._get_current_object(), send, args, kwargs))
+    _ensure_email_worker()
+
+
+def _ensure_email_worker():
+    global _email_worker
+    if _email_worker is not None and _email_worker.is_alive():
+        return
+    with _email_worker_lock:
+        if _email_worker is not None and _email_worker.is_alive():
+            return
+        _email_worker = threading.Thread(target=_email_loop, name='email-queue', daemon=True)
+        _email_worker.start()
+
+
+def _email_loop():
+    while True:
+        app, send, args, kwargs = _email_queue.get()
+        with app.app_context():
+            try:
+                send(*args, **kwargs)
+            except Exception as e:
+                app.logger.error(f"Queued email failed: {str(e)}")
+
+
 # ============================================================================
 # SECURITY UTILITIES
 # ============================================================================
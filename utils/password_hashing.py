@@ -0,0 +1,164 @@
+"""
+QuizFlow Password Hashing
+=========================
+Configurable password hashing, process-pool bulk hashing and background
+rehashing of legacy or outdated hashes.
+
+Hashes are werkzeug hashes (`method$salt$hash`), so the scheme and cost are
+a werkzeug method string such as `scrypt:32768:8:1` or
+`pbkdf2:sha256:600000`:
+
+- PASSWORD_HASH_METHOD is the target for every password a user chose or
+  logged in with.
+- PROVISIONED_PASSWORD_HASH_METHOD is used for the random passwords
+  generated when teacher accounts are provisioned in bulk. Those are long
+  random strings, so a cheaper cost is acceptable; the hash is upgraded to
+  PASSWORD_HASH_METHOD on the teacher's first login.
+
+Hashing is deliberately CPU-bound, so hash_passwords() spreads large batches
+over a process pool instead of running them one after another in a request
+thread. PasswordRehasher upgrades plaintext and outdated hashes after a
+successful login on a background thread, so the login itself never waits
+for a hash.
+"""
+
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from sqlalchemy import bindparam, func
+from werkzeug.security import generate_password_hash
+
+
+# Scheme and cost for user passwords (werkzeug method string)
+PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt')
+
+# Scheme and cost for generated passwords of provisioned accounts
+PROVISIONED_PASSWORD_HASH_METHOD = os.getenv('PROVISIONED_PASSWORD_HASH_METHOD', PASSWORD_HASH_METHOD)
+
+# Worker processes for bulk hashing (0 hashes inline)
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', min(4, os.cpu_count() or 1)))
+
+# Batches smaller than this are hashed inline (pool start-up is not free)
+PASSWORD_HASH_POOL_THRESHOLD = int(os.getenv('PASSWORD_HASH_POOL_THRESHOLD', 4))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def hash_password(password, method=None):
+    """Werkzeug hash of a password with the configured (or given) method"""
+    return generate_password_hash(password, method=method or PASSWORD_HASH_METHOD)
+
+
+@lru_cache(maxsize=8)
+def _method_prefix(method):
+    # Werkzeug normalises the method (e.g. "scrypt" -> "scrypt:32768:8:1"); hash once to learn how
+    return generate_password_hash('', method=method).split('$', 1)[0]
+
+
+def needs_rehash(password_hash, method=None):
+    """True if a werkzeug hash was made with another scheme or cost than the target"""
+    return password_hash.split('$', 1)[0] != _method_prefix(method or PASSWORD_HASH_METHOD)
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS)
+        return _pool
+
+
+def hash_passwords(passwords, method=None):
+    """
+    Hash many passwords, in a process pool when the batch is large enough.
+
+    Returns the hashes in input order. Falls back to hashing inline if the
+    pool cannot be used (e.g. a platform without process support).
+    """
+    passwords = list(passwords)
+    method = method or PASSWORD_HASH_METHOD
+    if PASSWORD_HASH_WORKERS <= 0 or len(passwords) < PASSWORD_HASH_POOL_THRESHOLD:
+        return [hash_password(p, method) for p in passwords]
+    try:
+        chunksize = max(1, len(passwords) // (PASSWORD_HASH_WORKERS * 4))
+        return list(_get_pool().map(hash_password, passwords, [method] * len(passwords), chunksize=chunksize))
+    except Exception:
+        return [hash_password(p, method) for p in passwords]
+
+
+class PasswordRehasher:
+    """
+    Background upgrade of plaintext and outdated password hashes.
+
+    Args:
+        app: Flask application (for app contexts on the worker thread)
+        db: Flask-SQLAlchemy instance
+        user_model: Model with `password` and `password_hash` columns
+    """
+
+    BATCH_SIZE = 50
+
+    def __init__(self, app, db, user_model, method=None):
+        self.app = app
+        self.db = db
+        self.method = method or PASSWORD_HASH_METHOD
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+        t = user_model.__table__
+        # Only overwrite the value that was checked, so a concurrent password change wins
+        self._update = (
+            t.update()
+            .where(t.c.id == bindparam('b_id'))
+            .where(func.coalesce(t.c.password_hash, t.c.password) == bindparam('b_old_password'))
+            .values(password_hash=bindparam('b_hash'), password=bindparam('b_hash'))
+        )
+
+    def submit(self, user_id, password, stored_password):
+        """
+        Queue a rehash after a successful login (never blocks).
+
+        `stored_password` is the value the password was checked against
+        (the old hash, or the legacy plaintext).
+        """
+        self._queue.put((user_id, password, stored_password))
+        self._ensure_worker()
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(target=self._work_loop, name='password-rehash', daemon=True)
+            self._worker.start()
+
+    def _work_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self.rehash(batch)
+
+    def rehash(self, batch):
+        """Hash and store a batch of (user id, password, stored password); returns the batch size"""
+        hashes = hash_passwords([password for _, password, _ in batch], self.method)
+        rows = [{'b_id': user_id, 'b_old_password': stored, 'b_hash': new_hash}
+                for (user_id, _, stored), new_hash in zip(batch, hashes)]
+        with self.app.app_context():
+            try:
+                self.db.session.execute(self._update, rows)
+                self.db.session.commit()
+                return len(rows)
+            except Exception as e:
+                self.db.session.rollback()
+                self.app.logger.error(f"Password rehash failed: {str(e)}")
+                return 0